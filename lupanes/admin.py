@@ -1,14 +1,34 @@
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
 from django.utils.formats import date_format
 
-from lupanes.models import DeliveryNote, Producer, Product, ProductPrice
+from lupanes.exceptions import MonthClosed
+from lupanes.models import (ClosedMonth, CustomerMonthTotal, DeliveryNote,
+                            Producer, Product, ProductPrice)
 
 
 @admin.register(DeliveryNote)
 class DeliveryNoteAdmin(admin.ModelAdmin):
-    list_display = ["date_short", "customer", "product", "quantity"]
+    list_display = ["date_short", "customer", "product", "quantity", "amount"]
     ordering = ["date"]
 
+    # notes of closed months are read-only
+    def has_change_permission(self, request, obj=None):
+        if obj is not None and ClosedMonth.objects.is_closed(obj.date):
+            return False
+        return super().has_change_permission(request, obj)
+
+    def has_delete_permission(self, request, obj=None):
+        if obj is not None and ClosedMonth.objects.is_closed(obj.date):
+            return False
+        return super().has_delete_permission(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        try:
+            queryset.delete()
+        except MonthClosed as e:
+            raise PermissionDenied(str(e))
+
     def date_short(self, obj):
         return date_format(obj.date, format='SHORT_DATE_FORMAT', use_l10n=True)
     date_short.admin_order_field = "date"
@@ -26,4 +46,18 @@ class ProductAdmin(admin.ModelAdmin):
     inlines = [ProductPriceInline]
 
 
+class CustomerMonthTotalInline(admin.TabularInline):
+    model = CustomerMonthTotal
+    readonly_fields = ["customer", "total", "missing_prices"]
+    can_delete = False
+    extra = 0
+
+
+@admin.register(ClosedMonth)
+class ClosedMonthAdmin(admin.ModelAdmin):
+    list_display = ["__str__", "closed_at", "closed_by"]
+    ordering = ["-year", "-month"]
+    inlines = [CustomerMonthTotalInline]
+
+
 admin.site.register(Producer)
@@ -0,0 +1,115 @@
+"""
+Server-side processing for DataTables.
+
+See https://datatables.net/manual/server-side
+
+Paging uses OFFSET unless the client sends the `cursor` returned with the
+previous page, then the next page is fetched with keyset pagination
+(`WHERE (field, pk) > (last_value, last_pk)`), so its cost does not grow
+with the page number.
+"""
+import base64
+import json
+from operator import attrgetter
+
+from django.db.models import F, Q
+
+MAX_PAGE_LENGTH = 500
+
+
+def _to_int(value, default):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class DataTablesRequest:
+    """
+    Parse the DataTables parameters and apply them to a queryset.
+
+    `columns` maps the `data` name of each sortable column to the model field
+    used to sort it; `search_fields` are the fields matched by the search box.
+    """
+
+    def __init__(self, params, columns, search_fields, default_column, default_length=50):
+        self.draw = _to_int(params.get("draw"), 0)
+        self.start = max(_to_int(params.get("start"), 0), 0)
+        self.length = _to_int(params.get("length"), default_length)
+        if not 0 < self.length <= MAX_PAGE_LENGTH:
+            self.length = default_length
+        self.search = params.get("search[value]", "").strip()
+        self.search_fields = search_fields
+
+        column_index = params.get("order[0][column]")
+        column_name = params.get(f"columns[{column_index}][data]")
+        self.order_field = columns.get(column_name, columns[default_column])
+        self.descending = params.get("order[0][dir]") == "desc"
+
+        self.cursor = self._decode_cursor(params.get("cursor"))
+
+    def _decode_cursor(self, value):
+        if not value:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(value.encode()))
+        except (ValueError, TypeError):
+            return None
+        # only valid to fetch the page that follows it with the same order and search
+        expected = {"field": self.order_field, "desc": self.descending, "search": self.search, "start": self.start}
+        if not isinstance(cursor, dict) or any(cursor.get(key) != value for key, value in expected.items()):
+            return None
+        return cursor
+
+    def _encode_cursor(self, obj):
+        cursor = {
+            "field": self.order_field,
+            "desc": self.descending,
+            "search": self.search,
+            "start": self.start + self.length,
+            "value": attrgetter(self.order_field.replace("__", "."))(obj),
+            "pk": obj.pk,
+        }
+        # str() keeps the microseconds of datetimes and the precision of decimals
+        return base64.urlsafe_b64encode(json.dumps(cursor, default=str).encode()).decode()
+
+    def filter(self, qs):
+        if not self.search:
+            return qs
+        condition = Q()
+        for field in self.search_fields:
+            condition |= Q(**{f"{field}__icontains": self.search})
+        return qs.filter(condition)
+
+    def order(self, qs):
+        # NULLs first ascending and last descending: same place as the keyset condition
+        if self.descending:
+            return qs.order_by(F(self.order_field).desc(nulls_last=True), "-pk")
+        return qs.order_by(F(self.order_field).asc(nulls_first=True), "pk")
+
+    def _after_cursor(self):
+        field, value, pk = self.order_field, self.cursor["value"], self.cursor["pk"]
+        op = "lt" if self.descending else "gt"
+        if value is None:
+            condition = Q(**{f"{field}__isnull": True, f"pk__{op}": pk})
+            if not self.descending:
+                condition |= Q(**{f"{field}__isnull": False})
+            return condition
+
+        condition = Q(**{f"{field}__{op}": value}) | Q(**{field: value, f"pk__{op}": pk})
+        if self.descending:
+            condition |= Q(**{f"{field}__isnull": True})
+        return condition
+
+    def page(self, qs):
+        """Return the objects of the requested page and the cursor of the next one"""
+        qs = self.order(qs)
+        if self.cursor is not None:
+            objects = list(qs.filter(self._after_cursor())[:self.length])
+        else:
+            objects = list(qs[self.start:self.start + self.length])
+
+        next_cursor = None
+        if len(objects) == self.length:
+            next_cursor = self._encode_cursor(objects[-1])
+        return objects, next_cursor
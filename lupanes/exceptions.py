@@ -9,3 +9,23 @@ class PriceDoesNotExistOnDate(ObjectDoesNotExist):
 class RetryExhausted(Exception):
     """All retry attempts have been exhausted for an API call"""
     pass
+
+
+class MonthAlreadyClosed(Exception):
+    """The month has already been closed"""
+    pass
+
+
+class MonthNotFinished(Exception):
+    """Only the months that have already ended can be closed"""
+    pass
+
+
+class MonthClosed(Exception):
+    """The delivery notes of a closed month cannot be changed"""
+    pass
+
+
+class CircuitOpen(Exception):
+    """The service has failed too many times, calls are not allowed until the cooldown ends"""
+    pass
@@ -1,18 +1,83 @@
+from decimal import Decimal
+
 from django import forms
 from django.contrib.auth import get_user_model
+from django.core.cache import caches
 from django.core.exceptions import ValidationError
+from django.forms.models import ModelChoiceIterator
 
-from lupanes.models import DeliveryNote, Producer, Product, ProductPrice
+from lupanes.models import (CATALOG, CUSTOMERS, ClosedMonth, DeliveryNote,
+                            Producer, Product, ProductPrice, get_data_version)
 from django.db.models.functions import Lower
 
 User = get_user_model()
 
 
+def get_cached_choices(cache_name, version, queryset, label=str):
+    """(pk, label) of the `queryset` objects, kept on the process local cache until `version` data changes"""
+    local_cache = caches["local"]
+    key = f"choices:{cache_name}:{get_data_version(version)!r}"
+    choices = local_cache.get(key)
+    if choices is None:
+        choices = [(obj.pk, label(obj)) for obj in queryset]
+        local_cache.set(key, choices, timeout=None)
+    return choices
+
+
+def validate_open_month(date):
+    if ClosedMonth.objects.is_closed(date):
+        raise ValidationError("El mes de esa fecha está cerrado", code="closed_month")
+
+
+def get_active_customer_choices():
+    return get_cached_choices("active-customers", CUSTOMERS, User.objects.get_active_customers())
+
+
+def get_product_choices():
+    # all products (even inactive)
+    return get_cached_choices("products", CATALOG, Product.objects.select_related("producer").order_by(Lower('name')))
+
+
+class CachedModelChoiceIterator(ModelChoiceIterator):
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        yield from self.field.get_cached_choices()
+
+    def __len__(self):
+        return len(self.field.get_cached_choices()) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.field.get_cached_choices())
+
+
+class CachedModelChoiceField(forms.ModelChoiceField):
+    """
+    ModelChoiceField whose (pk, label) choices are kept on the process local
+    cache until the `version` data (see `get_data_version`) changes.
+    """
+    iterator = CachedModelChoiceIterator
+
+    def __init__(self, queryset, *, cache_name, version, **kwargs):
+        self.cache_name = cache_name
+        self.version = version
+        super().__init__(queryset, **kwargs)
+
+    def get_cached_choices(self):
+        if not hasattr(self, "_cached_choices"):
+            self._cached_choices = get_cached_choices(
+                self.cache_name, self.version, self.queryset, self.label_from_instance,
+            )
+        return self._cached_choices
+
+
 class DeliveryNoteCreateForm(forms.ModelForm):
     """Form to register day shop by neveras"""
-    product = forms.ModelChoiceField(
+    product = CachedModelChoiceField(
         label="Producto",
-        queryset=Product.objects.filter(is_active=True).order_by(Lower('name'))
+        queryset=Product.objects.filter(is_active=True).select_related("producer").order_by(Lower('name')),
+        cache_name="active-products",
+        version=CATALOG,
     )
 
     class Meta:
@@ -23,12 +88,31 @@ class DeliveryNoteCreateForm(forms.ModelForm):
         self.customer = kwargs.pop("customer")
         return super().__init__(*args, **kwargs)
 
+    def clean(self):
+        cleaned_data = super().clean()
+        # the note is dated when it is created
+        validate_open_month(self.instance.date)
+        return cleaned_data
+
     def save(self, commit=True):
         self.instance.customer = self.customer
         instance = super().save(commit)
         return instance
 
 
+class DeliveryNoteUpdateForm(forms.ModelForm):
+    """Form to fix a note of the day by its nevera"""
+
+    class Meta:
+        model = DeliveryNote
+        fields = ["product", "quantity"]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        validate_open_month(self.instance.date)
+        return cleaned_data
+
+
 class DateTimeLocalInput(forms.DateTimeInput):
     input_type = "datetime-local"
 
@@ -50,14 +134,18 @@ class DateTimeLocalField(forms.DateTimeField):
 
 class DeliveryNoteForm(forms.ModelForm):
     """Form to digitalize albaranes by tienda group"""
-    customer = forms.ModelChoiceField(
+    customer = CachedModelChoiceField(
         label="Nevera",
         queryset=User.objects.get_active_customers(),
+        cache_name="active-customers",
+        version=CUSTOMERS,
     )
     # allow to select all products (even inactive)
-    product = forms.ModelChoiceField(
+    product = CachedModelChoiceField(
         label="Producto",
-        queryset=Product.objects.all().order_by(Lower('name'))
+        queryset=Product.objects.all().select_related("producer").order_by(Lower('name')),
+        cache_name="products",
+        version=CATALOG,
     )
     date = DateTimeLocalField()
 
@@ -69,12 +157,71 @@ class DeliveryNoteForm(forms.ModelForm):
         self.user = kwargs.pop("user")
         return super().__init__(*args, **kwargs)
 
+    def clean_date(self):
+        date = self.cleaned_data["date"]
+        validate_open_month(date)
+        return date
+
     def save(self, commit=True):
         self.instance.created_by = self.user
         instance = super().save(commit)
         return instance
 
 
+class DeliveryNoteSheetForm(forms.Form):
+    """Common data of the lines of a paper sheet"""
+    sheet_number = forms.CharField(label="Nº de hoja", max_length=6, required=False)
+    date = DateTimeLocalField(label="Fecha")
+
+    def clean_date(self):
+        date = self.cleaned_data["date"]
+        validate_open_month(date)
+        return date
+
+
+class DeliveryNoteLineForm(forms.Form):
+    """One line of a paper sheet (choices are validated without querying the database)"""
+    customer = forms.TypedChoiceField(label="Nevera", coerce=int)
+    product = forms.TypedChoiceField(label="Producto", coerce=int)
+    quantity = forms.DecimalField(label="Cantidad", max_digits=6, decimal_places=3, min_value=Decimal("0.001"))
+
+    def __init__(self, *args, customer_choices=(), product_choices=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["customer"].choices = customer_choices
+        self.fields["product"].choices = product_choices
+
+
+class BaseDeliveryNoteLineFormSet(forms.BaseFormSet):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # loaded once for all the lines
+        empty = [("", "---------")]
+        self.customer_choices = empty + get_active_customer_choices()
+        self.product_choices = empty + get_product_choices()
+
+    def get_form_kwargs(self, index):
+        return {"customer_choices": self.customer_choices, "product_choices": self.product_choices}
+
+    def get_errors_report(self):
+        """[(line number, [messages])] of the lines with errors"""
+        report = []
+        for number, form in enumerate(self.forms, start=1):
+            messages = [
+                f"{form.fields[name].label}: {error}" if name in form.fields else error
+                for name, errors in form.errors.items()
+                for error in errors
+            ]
+            if messages:
+                report.append((number, messages))
+        return report
+
+
+DeliveryNoteLineFormSet = forms.formset_factory(
+    DeliveryNoteLineForm, formset=BaseDeliveryNoteLineFormSet, extra=10, min_num=1, validate_min=True,
+    max_num=100, validate_max=True,
+)
+
+
 class NotifyMissingProductForm(forms.Form):
     product = forms.CharField(
         label="Producto",
@@ -0,0 +1,173 @@
+import datetime
+import gzip
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+FILE_PREFIX = "backup_"
+FILE_SUFFIX_DATE_FORMAT = "%Y%m%d%H%M%S"
+PLAIN_SUFFIX = ".sql.gz"
+DIRECTORY_SUFFIX = ".dir"
+# backups made by the former scripts/database_backup.py
+LEGACY_SUFFIX = ".zip"
+
+METRICS_FILENAME = "backup_metrics.jsonl"
+CHUNK_SIZE = 1024 * 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "Back up the database with pg_dump, compressing its output on the fly "
+        "(or using the parallel directory format), and delete the old backups."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output-dir', default=settings.LUPIERRA_BACKUP_DIR,
+                            help="Directory where backups are stored.")
+        parser.add_argument('--keep-days', type=int, default=settings.LUPIERRA_BACKUP_KEEP_DAYS,
+                            help="Delete backups older than these days.")
+        parser.add_argument('--format', choices=["plain", "directory"], default="plain",
+                            help="plain: gzipped SQL; directory: pg_dump directory format (compressed by pg_dump).")
+        parser.add_argument('--jobs', type=int, default=1,
+                            help="Tables dumped in parallel (only with --format=directory).")
+        parser.add_argument('--compress-level', type=int, choices=range(1, 10), default=6)
+        parser.add_argument('--pg-dump', default="pg_dump",
+                            help="pg_dump executable.")
+        parser.add_argument('--upload', action='store_true',
+                            help="Upload the backup to Google Drive with gdrive.")
+
+    def handle(self, *args, **options):
+        output_dir = options["output_dir"]
+        os.makedirs(output_dir, exist_ok=True)
+
+        timestamp = datetime.datetime.now().strftime(FILE_SUFFIX_DATE_FORMAT)
+        start = time.monotonic()
+        if options["format"] == "directory":
+            path = os.path.join(output_dir, FILE_PREFIX + timestamp + DIRECTORY_SUFFIX)
+            self.dump_directory(path, options)
+        else:
+            path = os.path.join(output_dir, FILE_PREFIX + timestamp + PLAIN_SUFFIX)
+            self.dump_plain(path, options)
+        duration = time.monotonic() - start
+
+        size = get_size(path)
+        self.record_metrics(output_dir, {
+            "backup": os.path.basename(path),
+            "format": options["format"],
+            "size": size,
+            "duration": round(duration, 3),
+        })
+        self.stdout.write(f"Created {path} ({size / 1024 / 1024:.1f} MiB in {duration:.1f}s).")
+
+        try:
+            if options["upload"]:
+                self.upload(path)
+        finally:
+            # old backups are deleted even if the upload fails
+            self.delete_old_backups(output_dir, options["keep_days"])
+
+    def upload(self, path):
+        cmd = ["gdrive", "files", "upload"]
+        if os.path.isdir(path):
+            cmd.append("--recursive")
+        try:
+            subprocess.run(cmd + [path], check=True, stderr=subprocess.PIPE)
+        except FileNotFoundError as e:
+            raise CommandError(f"Cannot upload {path}: {e}")
+        except subprocess.CalledProcessError as e:
+            message = e.stderr.decode(errors="replace").strip()
+            raise CommandError(f"Upload of {path} failed with exit code {e.returncode}: {message}")
+
+    def get_pg_dump_command(self, options, *extra_args):
+        db = settings.DATABASES["default"]
+        cmd = [options["pg_dump"], *extra_args]
+        for option, key in (("--host", "HOST"), ("--port", "PORT"), ("--username", "USER")):
+            if db.get(key):
+                cmd.append(f"{option}={db[key]}")
+        cmd.append(db["NAME"])
+        return cmd
+
+    def get_pg_dump_env(self):
+        # the password is not passed as argument to keep it out of the process list
+        env = os.environ.copy()
+        password = settings.DATABASES["default"].get("PASSWORD")
+        if password:
+            env["PGPASSWORD"] = password
+        return env
+
+    def dump_plain(self, path, options):
+        """Stream pg_dump output through gzip into the backup file (nothing else is written to disk)"""
+        cmd = self.get_pg_dump_command(options, "--format=plain")
+        partial_path = path + ".partial"
+        process = None
+        with tempfile.TemporaryFile() as stderr:
+            try:
+                with open(partial_path, "wb") as raw, \
+                        gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=options["compress_level"]) as archive:
+                    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr, env=self.get_pg_dump_env())
+                    shutil.copyfileobj(process.stdout, archive, CHUNK_SIZE)
+                    process.stdout.close()
+                    returncode = process.wait()
+                self.check_returncode(returncode, stderr)
+            except BaseException:
+                if process is not None and process.poll() is None:
+                    process.kill()
+                    process.wait()
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+                raise
+        os.rename(partial_path, path)
+
+    def dump_directory(self, path, options):
+        """pg_dump directory format: one compressed file per table, dumped by `--jobs` workers"""
+        cmd = self.get_pg_dump_command(
+            options, "--format=directory", f"--jobs={options['jobs']}",
+            f"--compress={options['compress_level']}", f"--file={path}",
+        )
+        with tempfile.TemporaryFile() as stderr:
+            returncode = subprocess.run(cmd, stderr=stderr, env=self.get_pg_dump_env()).returncode
+            try:
+                self.check_returncode(returncode, stderr)
+            except CommandError:
+                shutil.rmtree(path, ignore_errors=True)
+                raise
+
+    def check_returncode(self, returncode, stderr):
+        if returncode != 0:
+            stderr.seek(0)
+            message = stderr.read().decode(errors="replace").strip()
+            raise CommandError(f"pg_dump failed with exit code {returncode}: {message}")
+
+    def record_metrics(self, output_dir, metrics):
+        metrics["created_at"] = datetime.datetime.now().isoformat(timespec="seconds")
+        with open(os.path.join(output_dir, METRICS_FILENAME), "a") as metrics_file:
+            metrics_file.write(json.dumps(metrics) + "\n")
+
+    def delete_old_backups(self, output_dir, keep_days):
+        keep_back_date = datetime.datetime.now() - datetime.timedelta(days=keep_days)
+        for name in os.listdir(output_dir):
+            if not name.startswith(FILE_PREFIX) or not name.endswith((PLAIN_SUFFIX, DIRECTORY_SUFFIX, LEGACY_SUFFIX)):
+                continue
+            path = os.path.join(output_dir, name)
+            if os.stat(path).st_mtime < keep_back_date.timestamp():
+                self.stdout.write(f"Deleting old backup {name}")
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+
+
+def get_size(path):
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from lupanes.exceptions import MonthAlreadyClosed, MonthNotFinished
+from lupanes.models import ClosedMonth
+
+
+class Command(BaseCommand):
+    help = "Close a month: freeze the amounts of its delivery notes and save the customers totals."
+
+    def add_arguments(self, parser):
+        parser.add_argument('year', type=int)
+        parser.add_argument('month', type=int, choices=range(1, 13))
+
+    def handle(self, *args, **options):
+        try:
+            closed_month = ClosedMonth.objects.close(options["year"], options["month"])
+        except (MonthAlreadyClosed, MonthNotFinished) as e:
+            raise CommandError(e)
+
+        self.stdout.write(f"Closed {closed_month} with {closed_month.totals.count()} customer totals.")
@@ -0,0 +1,132 @@
+import datetime
+import gzip
+import io
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Max
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from lupanes.exports import stream_csv
+from lupanes.models import DeliveryNote
+
+MANIFEST_FILENAME = "manifest.json"
+PARTITION_FILENAME = "deliverynotes.csv.gz"
+
+HEADER = [
+    "id", "sheet_number", "date", "customer_id", "customer", "product_id", "product",
+    "producer", "unit", "quantity", "unit_price", "amount", "created_at", "updated_at",
+]
+
+FIELDS = [
+    "id", "sheet_number", "date", "customer_id", "customer__username", "product_id", "product__name",
+    "product__producer__name", "product__unit", "quantity", "line_unit_price", "line_amount",
+    "created_at", "updated_at",
+]
+
+
+def _isoformat(value):
+    return timezone.localtime(value).isoformat() if value else ""
+
+
+def partition_path(output_dir, month):
+    """Hive style layout (`year=2024/month=01/`) understood by most analytics tools"""
+    return os.path.join(output_dir, f"year={month.year}", f"month={month.month:02d}", PARTITION_FILENAME)
+
+
+class Command(BaseCommand):
+    help = (
+        "Export the delivery notes (with customer, product, producer and price) to one "
+        "gzipped CSV per month. Only the months changed since the previous run are rewritten."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output-dir', default=settings.LUPIERRA_ANALYTICS_DIR,
+                            help="Directory where the month partitions are written.")
+        parser.add_argument('--full', action='store_true',
+                            help="Rewrite every month (e.g. after renaming products or customers).")
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help="Rows fetched at once from the database cursor.")
+
+    def handle(self, *args, **options):
+        output_dir = options["output_dir"]
+        os.makedirs(output_dir, exist_ok=True)
+        manifest = self.load_manifest(output_dir)
+        previous = {} if options["full"] else manifest
+
+        # a deleted note does not change `updated_at` but it does change the count
+        current = {}
+        months = (
+            DeliveryNote.objects.annotate(month=TruncMonth("date")).order_by()
+            .values("month").annotate(rows=Count("id"), last_updated_at=Max("updated_at"))
+        )
+        for row in months:
+            current[row["month"].strftime("%Y-%m")] = {
+                "rows": row["rows"],
+                "last_updated_at": _isoformat(row["last_updated_at"]),
+            }
+
+        written = 0
+        for key, state in sorted(current.items()):
+            month = datetime.date.fromisoformat(f"{key}-01")
+            path = partition_path(output_dir, month)
+            exported = previous.get(key)
+            if exported and exported["rows"] == state["rows"] \
+                    and exported["last_updated_at"] == state["last_updated_at"] and os.path.exists(path):
+                continue
+            self.export_month(path, month, options["chunk_size"])
+            manifest[key] = {**state, "path": os.path.relpath(path, output_dir)}
+            written += 1
+            self.stdout.write(f"Exported {state['rows']} delivery notes of {key}.")
+
+        removed = 0
+        for key in sorted(set(manifest) - set(current)):
+            path = os.path.join(output_dir, manifest.pop(key)["path"])
+            if os.path.exists(path):
+                os.remove(path)
+            removed += 1
+
+        self.save_manifest(output_dir, manifest)
+        self.stdout.write(
+            f"{written} months exported, {len(current) - written} unchanged, {removed} removed."
+        )
+
+    def export_month(self, path, month, chunk_size):
+        qs = (
+            DeliveryNote.objects.in_month(month.year, month.month).with_line_amount()
+            .order_by("date", "pk").values_list(*FIELDS)
+        )
+        # `iterator()` uses a server-side cursor on PostgreSQL: memory does not depend on the month size
+        rows = (
+            [_isoformat(value) if isinstance(value, datetime.datetime) else value for value in row]
+            for row in qs.iterator(chunk_size=chunk_size)
+        )
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial_path = path + ".partial"
+        try:
+            # mtime=0: the same data always gives the same file
+            with gzip.GzipFile(partial_path, mode="wb", mtime=0) as archive, \
+                    io.TextIOWrapper(archive, encoding="utf-8", newline="") as output:
+                for line in stream_csv(HEADER, rows):
+                    output.write(line)
+        except BaseException:
+            os.remove(partial_path)
+            raise
+        os.replace(partial_path, path)
+
+    def load_manifest(self, output_dir):
+        try:
+            with open(os.path.join(output_dir, MANIFEST_FILENAME)) as manifest_file:
+                return json.load(manifest_file)
+        except FileNotFoundError:
+            return {}
+
+    def save_manifest(self, output_dir, manifest):
+        path = os.path.join(output_dir, MANIFEST_FILENAME)
+        with open(path + ".partial", "w") as manifest_file:
+            json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+        os.replace(path + ".partial", path)
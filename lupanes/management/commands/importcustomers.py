@@ -1,33 +1,94 @@
 import argparse
 import csv
+from itertools import islice
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
+from lupanes.models import CUSTOMERS, bump_data_version
 from lupanes.users import CUSTOMERS_GROUP
 
 User = get_user_model()
 
 
 class Command(BaseCommand):
+    help = (
+        "Import neveras from a CSV (Nombre nevera, E-mail): create the new ones, update the e-mail "
+        "of the existing ones and add all of them to the customers group."
+    )
+
     def add_arguments(self, parser):
         parser.add_argument('input_file', type=argparse.FileType('r'))
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Show what would be imported without saving anything.")
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help="Number of rows processed at once.")
 
     def handle(self, *args, **options):
-        customers = []
-        csv_reader = csv.DictReader(options["input_file"])
-        usrs = []
-        for row in csv_reader:
-            username = row['Nombre nevera'].strip()
-            email = row['E-mail'].strip()
-            if username not in usrs:
-                user = User.objects.create(username=username, email=email)
-                customers.append(user)
-                usrs.append(username)
-
-        customers_group, _ = Group.objects.get_or_create(name=CUSTOMERS_GROUP)
-        qs_current_users = list(customers_group.user_set.all())
-        customers_group.user_set.set(qs_current_users + customers)
-
-        self.stdout.write(f"Imported {len(customers)} customers.")
+        self.summary = {"created": 0, "updated": 0, "added_to_group": 0, "duplicated": 0}
+        self.seen = set()
+
+        with transaction.atomic():
+            self.customers_group, _ = Group.objects.get_or_create(name=CUSTOMERS_GROUP)
+            rows = csv.DictReader(options["input_file"])
+            while chunk := list(islice(rows, options["chunk_size"])):
+                self.import_chunk(chunk)
+
+            # bulk operations do not call User.save()
+            if self.summary["created"] or self.summary["updated"] or self.summary["added_to_group"]:
+                bump_data_version(CUSTOMERS)
+
+            if options["dry_run"]:
+                transaction.set_rollback(True)
+
+        prefix = "Dry run: " if options["dry_run"] else ""
+        self.stdout.write(
+            f"{prefix}Imported {self.summary['created']} customers, updated {self.summary['updated']} e-mails, "
+            f"added {self.summary['added_to_group']} to {CUSTOMERS_GROUP} "
+            f"({self.summary['duplicated']} duplicated rows skipped)."
+        )
+
+    def import_chunk(self, chunk):
+        emails = {}
+        for row in chunk:
+            username = (row['Nombre nevera'] or "").strip()
+            if not username:
+                continue
+            if username in self.seen:
+                self.summary["duplicated"] += 1
+                continue
+            self.seen.add(username)
+            emails[username] = (row['E-mail'] or "").strip()
+
+        existing = User.objects.in_bulk(emails.keys(), field_name="username")
+        new_users = []
+        for username, email in emails.items():
+            if username not in existing:
+                user = User(username=username, email=email)
+                user.set_unusable_password()
+                new_users.append(user)
+        User.objects.bulk_create(new_users)
+
+        # a blank e-mail in the CSV does not remove the one already stored
+        updated_users = []
+        for user in existing.values():
+            if emails[user.username] and user.email != emails[user.username]:
+                user.email = emails[user.username]
+                updated_users.append(user)
+        User.objects.bulk_update(updated_users, ["email"])
+
+        user_ids = set(User.objects.filter(username__in=emails.keys()).values_list("pk", flat=True))
+        Membership = User.groups.through
+        members = set(Membership.objects.filter(
+            group=self.customers_group, user_id__in=user_ids,
+        ).values_list("user_id", flat=True))
+        Membership.objects.bulk_create(
+            [Membership(user_id=user_id, group=self.customers_group) for user_id in user_ids - members],
+            ignore_conflicts=True,
+        )
+
+        self.summary["created"] += len(new_users)
+        self.summary["updated"] += len(updated_users)
+        self.summary["added_to_group"] += len(user_ids - members)
@@ -0,0 +1,148 @@
+import argparse
+import csv
+import datetime
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from lupanes.models import ClosedMonth, DeliveryNote, PriceResolver, Product
+
+User = get_user_model()
+
+# same columns as the delivery notes export (other columns are ignored)
+SHEET_NUMBER = "Nº hoja"
+DATE = "Fecha"
+CUSTOMER = "Nevera"
+PRODUCT = "Producto"
+QUANTITY = "Cantidad"
+
+MAX_REPORTED_ERRORS = 50
+
+
+class Command(BaseCommand):
+    help = (
+        "Import delivery notes from a CSV file with the columns of the export "
+        f"({SHEET_NUMBER}, {DATE}, {CUSTOMER}, {PRODUCT}, {QUANTITY}). "
+        "Nothing is imported if any row is invalid."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('input_file', type=argparse.FileType('r'))
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Validate the file without importing anything.")
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help="Number of rows validated and inserted at once.")
+        parser.add_argument('--created-by', metavar='USERNAME',
+                            help="User registered as creator of the notes.")
+        parser.add_argument('--allow-missing-price', action='store_true',
+                            help="Import notes of products without price on their date.")
+
+    def handle(self, *args, **options):
+        created_by = None
+        if options["created_by"]:
+            created_by = User.objects.filter(username=options["created_by"]).first()
+            if created_by is None:
+                raise CommandError(f"User {options['created_by']} does not exist.")
+
+        # in-memory lookups: the file is read only once, in chunks
+        self.customers = {username.lower(): pk for pk, username in User.objects.values_list("pk", "username")}
+        self.products = {name.lower(): pk for pk, name in Product.objects.values_list("pk", "name")}
+        self.resolver = PriceResolver(self.products.values())
+        self.closed_months = set(ClosedMonth.objects.values_list("year", "month"))
+        self.allow_missing_price = options["allow_missing_price"]
+        self.created_by = created_by
+        self.errors = 0
+
+        reader = csv.DictReader(options["input_file"])
+        missing_columns = {SHEET_NUMBER, DATE, CUSTOMER, PRODUCT, QUANTITY} - set(reader.fieldnames or [])
+        if missing_columns:
+            raise CommandError(f"Missing columns: {', '.join(sorted(missing_columns))}")
+
+        try:
+            with transaction.atomic():
+                imported = self.import_rows(reader, options["chunk_size"], options["dry_run"])
+                if self.errors:
+                    raise CommandError(f"{self.errors} invalid rows, nothing has been imported.")
+                if options["dry_run"]:
+                    transaction.set_rollback(True)
+        finally:
+            options["input_file"].close()
+
+        if options["dry_run"]:
+            self.stdout.write(f"Dry run: {imported} delivery notes are valid.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Imported {imported} delivery notes."))
+
+    def import_rows(self, reader, chunk_size, dry_run):
+        imported = 0
+        start = time.monotonic()
+        # data rows start on the second line of the file
+        rows = enumerate(reader, start=2)
+        while chunk := list(islice(rows, chunk_size)):
+            notes = [note for note in (self.build_note(line, row) for line, row in chunk) if note is not None]
+            # keep validating the rest of the file to report all the errors
+            if not dry_run and not self.errors:
+                DeliveryNote.objects.create_many(notes, resolver=self.resolver)
+            imported += len(notes)
+
+            elapsed = time.monotonic() - start
+            self.stdout.write(f"{chunk[-1][0] - 1} rows processed ({imported / elapsed:.0f} notes/s)")
+        return imported
+
+    def build_note(self, line, row):
+        # short rows have None values
+        row = {column: (value or "").strip() for column, value in row.items() if column}
+        errors = []
+        customer_id = self.customers.get(row[CUSTOMER].lower())
+        if customer_id is None:
+            errors.append(f"unknown customer {row[CUSTOMER]!r}")
+        product_id = self.products.get(row[PRODUCT].lower())
+        if product_id is None:
+            errors.append(f"unknown product {row[PRODUCT]!r}")
+
+        try:
+            quantity = Decimal(row[QUANTITY].replace(",", "."))
+            # as DeliveryNote.quantity: up to 3 digits and 3 decimals
+            if not (quantity.is_finite() and 0 < quantity < 1000 and quantity == round(quantity, 3)):
+                raise InvalidOperation
+        except InvalidOperation:
+            errors.append(f"invalid quantity {row[QUANTITY]!r}")
+
+        try:
+            date = datetime.datetime.fromisoformat(row[DATE])
+            if timezone.is_naive(date):
+                date = timezone.make_aware(date)
+        except ValueError:
+            errors.append(f"invalid date {row[DATE]!r}")
+        else:
+            local_date = timezone.localtime(date)
+            if (local_date.year, local_date.month) in self.closed_months:
+                errors.append(f"month {local_date:%m/%Y} is closed")
+            elif (product_id is not None and not self.allow_missing_price
+                    and self.resolver.get_price_or_none(product_id, date) is None):
+                errors.append(f"product {row[PRODUCT]!r} has no price on {local_date:%d/%m/%Y}")
+
+        if errors:
+            self.report_error(line, errors)
+            return None
+
+        return DeliveryNote(
+            sheet_number=row[SHEET_NUMBER],
+            date=date,
+            customer_id=customer_id,
+            product_id=product_id,
+            quantity=quantity,
+            created_by=self.created_by,
+        )
+
+    def report_error(self, line, errors):
+        self.errors += 1
+        if self.errors <= MAX_REPORTED_ERRORS:
+            self.stderr.write(f"Line {line}: {'; '.join(errors)}")
+        elif self.errors == MAX_REPORTED_ERRORS + 1:
+            self.stderr.write("Too many errors, the rest are not reported.")
@@ -1,55 +1,131 @@
 import logging
 import argparse
 import csv
+import datetime
 from decimal import Decimal
 
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
 
-from lupanes.models import DeliveryNote, Producer, Product, ProductPrice
+from lupanes.models import (CATALOG, DeliveryNote, Producer, Product,
+                            ProductPrice, bump_data_version,
+                            local_day_start)
 
 logger = logging.getLogger(__name__)
 
 
 class Command(BaseCommand):
+    help = (
+        "Import products, producers and prices from a CSV (producto, precio, productor, unidad). "
+        "Existing producers and products are matched by name and only new prices are added."
+    )
+
     def add_arguments(self, parser):
         parser.add_argument('input_file', type=argparse.FileType('r'))
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Show what would be imported without saving anything.")
+        parser.add_argument('--debug', action='store_true',
+                            help="Write the parsed rows (as CSV) to the output.")
+        parser.add_argument('--drop', action='store_true',
+                            help="DELETE all the delivery notes, products and producers before importing.")
 
     def handle(self, *args, **options):
-        debug = False   # TODO(@slamora): add_argument
-        drop = True | False   # TODO(@slamora): add_argument
-
-        csv_reader = csv.DictReader(options["input_file"])
-
-        if debug:
-            with open("/tmp/outfile.csv", mode="w") as outfile:
-                csv_writer = csv.DictWriter(outfile, fieldnames=csv_reader.fieldnames)
-                csv_writer.writeheader()
-                for row in csv_reader:
-                    item = Row(row)
-                    value = {
-                        "producto": item.product,
-                        "fecha": item.date,
-                        "precio": item.price,
-                        "productor": item.producer,
-                    }
-                    csv_writer.writerow(value)
-
-        if drop:
-            DeliveryNote.objects.all().delete()
-            Product.objects.all().delete()
-            Producer.objects.all().delete()
-
-        products = {}
-        for row in csv_reader:
+        items = []
+        for row in csv.DictReader(options["input_file"]):
             item = Row(row)
-            if item.product in products:
-                product = products[item.product]
-            else:
-                producer, _ = Producer.objects.get_or_create(name=item.producer)
-                product = Product.objects.create(name=item.product, unit=item.unit, producer=producer)
-                products[item.product] = product
-
-            ProductPrice.objects.create(value=item.price, start_date=item.date, product=product)
+            if item.price is None:
+                self.stderr.write(f"Skipped {item.product}: invalid price {row['precio']!r}")
+                continue
+            items.append(item)
+
+        if options["debug"]:
+            csv_writer = csv.DictWriter(self.stdout, fieldnames=["producto", "fecha", "precio", "productor"])
+            csv_writer.writeheader()
+            for item in items:
+                csv_writer.writerow({
+                    "producto": item.product,
+                    "fecha": item.date,
+                    "precio": item.price,
+                    "productor": item.producer,
+                })
+
+        with transaction.atomic():
+            if options["drop"]:
+                DeliveryNote.objects.all().delete()
+                Product.objects.all().delete()
+                Producer.objects.all().delete()
+
+            summary = self.upsert(items)
+
+            if options["dry_run"]:
+                transaction.set_rollback(True)
+
+        prefix = "Dry run: " if options["dry_run"] else ""
+        self.stdout.write(
+            f"{prefix}{summary['producers']} new producers, {summary['products']} new products, "
+            f"{summary['updated_products']} updated products, {summary['prices']} new prices "
+            f"({summary['existing_prices']} already existing)."
+        )
+
+    def upsert(self, items):
+        summary = {}
+
+        # producers
+        names = {item.producer for item in items}
+        producers = dict(Producer.objects.filter(name__in=names).values_list("name", "pk"))
+        new_producers = [Producer(name=name) for name in names - producers.keys()]
+        Producer.objects.bulk_create(new_producers)
+        producers = dict(Producer.objects.filter(name__in=names).values_list("name", "pk"))
+        summary["producers"] = len(new_producers)
+
+        # products: the last row of each one sets its unit and producer
+        product_data = {item.product: (item.unit, producers[item.producer]) for item in items}
+        existing = Product.objects.in_bulk(product_data.keys(), field_name="name")
+        new_products, updated_products = [], []
+        for name, (unit, producer_id) in product_data.items():
+            product = existing.get(name)
+            if product is None:
+                new_products.append(Product(name=name, unit=unit, producer_id=producer_id))
+            elif (product.unit, product.producer_id) != (unit, producer_id):
+                product.unit, product.producer_id = unit, producer_id
+                updated_products.append(product)
+        Product.objects.bulk_create(new_products)
+        Product.objects.bulk_update(updated_products, ["unit", "producer"])
+        products = dict(Product.objects.filter(name__in=product_data.keys()).values_list("name", "pk"))
+        summary["products"] = len(new_products)
+        summary["updated_products"] = len(updated_products)
+
+        # prices: only new (product, start_date), existing ones are kept as they are
+        prices = {}
+        for item in items:
+            prices.setdefault((products[item.product], datetime.date.fromisoformat(item.date)), item.price)
+        existing_prices = set(ProductPrice.objects.filter(
+            product_id__in=products.values(),
+        ).values_list("product_id", "start_date"))
+        new_prices = [
+            ProductPrice(product_id=product_id, start_date=start_date, value=value)
+            for (product_id, start_date), value in prices.items()
+            if (product_id, start_date) not in existing_prices
+        ]
+        ProductPrice.objects.bulk_create(new_prices, ignore_conflicts=True)
+        summary["prices"] = len(new_prices)
+        summary["existing_prices"] = len(prices) - len(new_prices)
+
+        # bulk_create does not call ProductPrice.save(): reprice the affected notes
+        since = {}
+        for price in new_prices:
+            since[price.product_id] = min(price.start_date, since.get(price.product_id, price.start_date))
+        if since:
+            affected = Q()
+            for product_id, start_date in since.items():
+                affected |= Q(product_id=product_id, date__gte=local_day_start(start_date))
+            DeliveryNote.objects.filter(affected).exclude_closed_months().reprice()
+
+        if new_products or updated_products or new_prices or new_producers:
+            bump_data_version(CATALOG)
+
+        return summary
 
 
 class Row:
@@ -103,8 +179,7 @@ class Row:
         try:
             return Decimal(value)
         except Exception as e:
-            print(e)
-            print(value)
+            logger.debug(e)
 
     def clean_producer(self):
         value = self.data['productor']
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from lupanes.models import DailyDelivery
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily deliveries summary from the delivery notes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help="Number of summary rows inserted at once.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = DailyDelivery.objects.rebuild(chunk_size=options["chunk_size"])
+
+        self.stdout.write(f"Rebuilt {total} daily deliveries.")
@@ -0,0 +1,39 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from lupanes.models import DeliveryNote
+
+
+class Command(BaseCommand):
+    help = "Fill (or refresh) the stored unit price and amount of the delivery notes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help="Number of notes loaded and updated at once.")
+        parser.add_argument('--product', type=int, action='append', dest='products',
+                            help="Only reprice notes of this product id (can be repeated).")
+        parser.add_argument('--since', type=datetime.date.fromisoformat,
+                            help="Only reprice notes on or after this date (YYYY-MM-DD).")
+        parser.add_argument('--only-missing', action='store_true',
+                            help="Only fill notes without stored price.")
+        parser.add_argument('--include-closed', action='store_true',
+                            help="Also reprice notes of closed months.")
+
+    def handle(self, *args, **options):
+        qs = DeliveryNote.objects.all()
+        if options["products"]:
+            qs = qs.filter(product_id__in=options["products"])
+        if options["since"]:
+            qs = qs.since_day(options["since"])
+        if options["only_missing"]:
+            qs = qs.filter(unit_price__isnull=True)
+        if not options["include_closed"]:
+            qs = qs.exclude_closed_months()
+
+        updated = qs.reprice(chunk_size=options["chunk_size"])
+        missing = qs.filter(unit_price__isnull=True).count()
+
+        self.stdout.write(f"Repriced {updated} delivery notes.")
+        if missing:
+            self.stdout.write(self.style.WARNING(f"{missing} delivery notes have no price on their date."))
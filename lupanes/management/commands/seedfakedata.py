@@ -0,0 +1,233 @@
+import datetime
+import random
+import time
+from decimal import Decimal
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from lupanes.models import (CATALOG, CUSTOMERS, DailyDelivery, DeliveryNote,
+                            PriceResolver, Producer, Product, ProductPrice,
+                            bump_data_version, local_day_start)
+from lupanes.users import CUSTOMERS_GROUP, MANAGERS_GROUP
+
+User = get_user_model()
+
+CUSTOMER_PASSWORD = "password123"
+MANAGER_PASSWORD = "manager123"
+
+FIRST_NAMES = [
+    "María", "Carmen", "Ana", "Isabel", "Dolores", "Pilar", "Teresa", "Rosa",
+    "Antonio", "José", "Manuel", "Francisco", "Juan", "David", "Javier", "Daniel",
+    "Laura", "Marta", "Paula", "Cristina", "Sara", "Lucía", "Elena", "Beatriz",
+    "Carlos", "Miguel", "Pedro", "Ángel", "Luis", "Sergio", "Jorge", "Alberto",
+]
+
+LAST_NAMES = [
+    "García", "Rodríguez", "González", "Fernández", "López", "Martínez", "Sánchez",
+    "Pérez", "Martín", "Gómez", "Ruiz", "Hernández", "Jiménez", "Díaz", "Moreno",
+    "Álvarez", "Muñoz", "Romero", "Alonso", "Gutiérrez", "Navarro", "Torres",
+    "Domínguez", "Vázquez", "Ramos", "Gil", "Ramírez", "Serrano", "Blanco", "Molina",
+]
+
+PRODUCTS = [
+    # (name, producer name, unit, base price)
+    ("Aceite de Oliva Virgen Extra", "Aceites del Sur", Product.Unit.LITRO, "8.50"),
+    ("Aceite de Girasol", "Aceites del Sur", Product.Unit.LITRO, "3.20"),
+    ("Tomate Frito Casero", "Conservas Artesanas", Product.Unit.BOTE, "2.80"),
+    ("Mermelada de Fresa", "Conservas Artesanas", Product.Unit.BOTE, "3.50"),
+    ("Lechugas", "Huerta Orgánica", Product.Unit.UNIDAD, "1.20"),
+    ("Tomates", "Huerta Orgánica", Product.Unit.KG, "2.50"),
+    ("Patatas", "Huerta Orgánica", Product.Unit.KG, "1.80"),
+    ("Zanahorias", "Verduras Frescas S.L.", Product.Unit.KG, "1.50"),
+    ("Huevos Camperos", "Granja La Esperanza", Product.Unit.DOCENA, "4.20"),
+    ("Pollo Ecológico", "Granja La Esperanza", Product.Unit.KG, "8.90"),
+    ("Vino Tinto Crianza", "Bodega Los Viñedos", Product.Unit.BOTELLA, "6.50"),
+    ("Vino Blanco", "Bodega Los Viñedos", Product.Unit.BOTELLA, "5.20"),
+    ("Leche Entera", "Lácteos Naturales", Product.Unit.LITRO, "1.10"),
+    ("Yogur Natural", "Lácteos Naturales", Product.Unit.PAQUETE, "2.80"),
+    ("Queso Curado", "Lácteos Naturales", Product.Unit.KG, "12.50"),
+    ("Pan de Pueblo", "Pan de Pueblo", Product.Unit.UNIDAD, "1.80"),
+    ("Barra Integral", "Pan de Pueblo", Product.Unit.UNIDAD, "2.00"),
+    ("Miel de Romero", "Miel de las Sierras", Product.Unit.BOTE, "7.50"),
+    ("Miel de Azahar", "Miel de las Sierras", Product.Unit.BOTE, "8.20"),
+    ("Naranjas", "Frutas del Campo", Product.Unit.KG, "1.90"),
+    ("Manzanas", "Frutas del Campo", Product.Unit.KG, "2.20"),
+    ("Pimientos", "Verduras Frescas S.L.", Product.Unit.KG, "3.10"),
+    ("Calabacines", "Verduras Frescas S.L.", Product.Unit.KG, "2.40"),
+    ("Aceitunas Aliñadas", "Conservas Artesanas", Product.Unit.GARRAFA, "15.50"),
+]
+
+
+def first_day_of_period(until, months):
+    """First day of the month `months - 1` months before the month of `until`"""
+    month_index = until.year * 12 + until.month - 1 - (months - 1)
+    return datetime.date(month_index // 12, month_index % 12 + 1, 1)
+
+
+class Command(BaseCommand):
+    help = (
+        "Populate the database with fake customers, products, prices and delivery notes "
+        "(for development and load testing). The same --seed and --until give the same data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=15)
+        parser.add_argument('--managers', type=int, default=3)
+        parser.add_argument('--products', type=int, default=len(PRODUCTS))
+        parser.add_argument('--price-changes', type=int, default=3,
+                            help="Price changes of every product during the period.")
+        parser.add_argument('--months', type=int, default=3,
+                            help="Months of delivery notes, the last one is the month of --until.")
+        parser.add_argument('--notes-per-day', type=int, default=5)
+        parser.add_argument('--until', type=datetime.date.fromisoformat, default=None,
+                            help="Last day with delivery notes (YYYY-MM-DD), today by default.")
+        parser.add_argument('--seed', type=int, default=0,
+                            help="Seed of the random generator.")
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help="Number of rows inserted at once.")
+
+    def handle(self, *args, **options):
+        for option in ["customers", "products", "months", "notes_per_day", "price_changes", "chunk_size"]:
+            if options[option] < 1:
+                raise CommandError(f"--{option.replace('_', '-')} must be positive.")
+        if options["managers"] < 0:
+            raise CommandError("--managers cannot be negative.")
+
+        self.random = random.Random(options["seed"])
+        self.chunk_size = options["chunk_size"]
+        until = options["until"] or timezone.localdate()
+        since = first_day_of_period(until, options["months"])
+        start = time.monotonic()
+
+        customers = self.create_users(CUSTOMERS_GROUP, options["customers"], CUSTOMER_PASSWORD)
+        managers = self.create_users(MANAGERS_GROUP, options["managers"], MANAGER_PASSWORD, prefix="tienda.")
+        bump_data_version(CUSTOMERS)
+        self.stdout.write(f"Created {len(customers)} customers and {len(managers)} managers.")
+
+        products = self.create_products(options["products"])
+        prices = self.create_prices(products, since, until, options["price_changes"])
+        bump_data_version(CATALOG)
+        self.stdout.write(f"Created {len(products)} products and {prices} prices.")
+
+        notes = self.create_notes(customers, managers, products, since, until, options["notes_per_day"])
+        self.stdout.write(f"Created {notes} delivery notes from {since} to {until}.")
+
+        # bulk_create does not refresh the daily rollup
+        rows = DailyDelivery.objects.rebuild(chunk_size=self.chunk_size)
+        self.stdout.write(f"Rebuilt {rows} daily deliveries in {time.monotonic() - start:.1f}s.")
+
+    def create_users(self, group_name, count, password, prefix=""):
+        group, _ = Group.objects.get_or_create(name=group_name)
+        used_usernames = set(User.objects.values_list("username", flat=True))
+        # hashing is slow on purpose: hash the password once for all the users
+        password = make_password(password)
+
+        users = []
+        for _ in range(count):
+            first_name = self.random.choice(FIRST_NAMES)
+            last_name = self.random.choice(LAST_NAMES)
+            base_username = username = f"{prefix}{first_name.lower()}.{last_name.lower()}"
+            counter = 1
+            while username in used_usernames:
+                username = f"{base_username}{counter}"
+                counter += 1
+            used_usernames.add(username)
+            users.append(User(
+                username=username, first_name=first_name, last_name=last_name,
+                email=f"{username}@example.com", password=password,
+            ))
+        users = User.objects.bulk_create(users, batch_size=self.chunk_size)
+
+        # bulk_create only returns the primary keys on some databases
+        user_ids = list(User.objects.filter(
+            username__in=[user.username for user in users],
+        ).values_list("pk", flat=True))
+        Membership = User.groups.through
+        Membership.objects.bulk_create(
+            [Membership(user_id=user_id, group=group) for user_id in user_ids], batch_size=self.chunk_size,
+        )
+        return user_ids
+
+    def create_products(self, count):
+        """Return (product id, unit, base price) of the fake products, reusing those already created"""
+        definitions = []
+        for number in range(count):
+            name, producer_name, unit, base_price = PRODUCTS[number % len(PRODUCTS)]
+            if number >= len(PRODUCTS):
+                name = f"{name} {number // len(PRODUCTS) + 1}"
+            definitions.append((name, producer_name, unit, Decimal(base_price)))
+
+        Producer.objects.bulk_create(
+            [Producer(name=name) for name in {producer for _, producer, _, _ in definitions}],
+            ignore_conflicts=True,
+        )
+        producer_ids = dict(Producer.objects.values_list("name", "pk"))
+        Product.objects.bulk_create(
+            [
+                Product(name=name, producer_id=producer_ids[producer_name], unit=unit,
+                        description=f"{name} producido por {producer_name}")
+                for name, producer_name, unit, _ in definitions
+            ],
+            batch_size=self.chunk_size, ignore_conflicts=True,
+        )
+        product_ids = Product.objects.in_bulk([name for name, _, _, _ in definitions], field_name="name")
+        return [
+            (product_ids[name].pk, product_ids[name].unit, base_price)
+            for name, _, _, base_price in definitions
+        ]
+
+    def create_prices(self, products, since, until, price_changes):
+        """A price from the start of the period, plus `price_changes` on random days"""
+        days = (until - since).days
+        prices = []
+        for product_id, _, base_price in products:
+            start_dates = {since} | {
+                since + datetime.timedelta(days=self.random.randint(1, days)) for _ in range(price_changes) if days
+            }
+            for start_date in sorted(start_dates):
+                variation = Decimal(self.random.randint(85, 115)) / 100
+                prices.append(ProductPrice(
+                    product_id=product_id, start_date=start_date,
+                    value=(base_price * variation).quantize(Decimal("0.01")),
+                ))
+        # bulk_create does not call ProductPrice.save(): the notes are created afterwards
+        ProductPrice.objects.bulk_create(prices, batch_size=self.chunk_size, ignore_conflicts=True)
+        return len(prices)
+
+    def generate_notes(self, customers, managers, products, since, until, notes_per_day):
+        fractional_units = Product.Unit.fractional_units()
+        day = since
+        while day <= until:
+            day_start = local_day_start(day)
+            for _ in range(notes_per_day):
+                product_id, unit, _ = self.random.choice(products)
+                if unit in fractional_units:
+                    quantity = Decimal(self.random.randint(500, 5000)) / 1000
+                else:
+                    quantity = Decimal(self.random.randint(1, 10))
+                yield DeliveryNote(
+                    customer_id=self.random.choice(customers),
+                    created_by_id=self.random.choice(managers) if managers else None,
+                    date=day_start + datetime.timedelta(seconds=self.random.randint(9 * 3600, 21 * 3600)),
+                    product_id=product_id,
+                    quantity=quantity,
+                    sheet_number=str(self.random.randint(1000, 9999)) if self.random.random() < 0.5 else "",
+                )
+            day += datetime.timedelta(days=1)
+
+    def create_notes(self, customers, managers, products, since, until, notes_per_day):
+        resolver = PriceResolver(product_id for product_id, _, _ in products)
+        notes = self.generate_notes(customers, managers, products, since, until, notes_per_day)
+        total = 0
+        while batch := list(islice(notes, self.chunk_size)):
+            for note in batch:
+                note.set_price(resolver)
+            DeliveryNote.objects.bulk_create(batch)
+            total += len(batch)
+            self.stdout.write(f"  {total} delivery notes...", ending="\r")
+        return total
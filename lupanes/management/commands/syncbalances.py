@@ -0,0 +1,46 @@
+import time
+
+import requests.exceptions
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from gspread.exceptions import APIError
+
+from lupanes import utils
+from lupanes.exceptions import CircuitOpen, RetryExhausted
+from lupanes.users.models import NeveraBalance
+
+
+FETCH_ERRORS = (APIError, RetryExhausted, CircuitOpen, requests.exceptions.RequestException)
+
+
+class Command(BaseCommand):
+    help = "Copy the neveras balances from the Google spreadsheet to the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help="Keep running and sync every --interval seconds.")
+        parser.add_argument('--interval', type=int, default=settings.LUPIERRA_BALANCE_SYNC_INTERVAL,
+                            help="Seconds between syncs when running with --loop.")
+
+    def handle(self, *args, **options):
+        if not options["loop"]:
+            try:
+                self.sync()
+            except FETCH_ERRORS as e:
+                raise CommandError(f"Cannot fetch neveras balances: {e}")
+            return
+
+        while True:
+            try:
+                self.sync()
+            except FETCH_ERRORS as e:
+                # keep the previous balances and try again on next round
+                self.stderr.write(f"Cannot fetch neveras balances: {e}")
+            time.sleep(options["interval"])
+
+    def sync(self):
+        balances = utils.fetch_nevera_balances()
+        if NeveraBalance.objects.sync(balances):
+            self.stdout.write(f"Synced {len(balances)} neveras balances.")
+        else:
+            self.stderr.write("No neveras balances read, the stored ones are kept (check the spreadsheet range).")
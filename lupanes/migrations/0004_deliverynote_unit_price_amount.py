@@ -0,0 +1,23 @@
+# Generated by Django 4.2.28 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lupanes', '0003_deliverynote_sheet_number'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deliverynote',
+            name='amount',
+            field=models.DecimalField(blank=True, decimal_places=5, editable=False, max_digits=11, null=True, verbose_name='Importe'),
+        ),
+        migrations.AddField(
+            model_name='deliverynote',
+            name='unit_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=5, null=True, verbose_name='Precio unitario'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.28 on 2026-10-18 15:44
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('lupanes', '0004_deliverynote_unit_price_amount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('quantity', models.DecimalField(decimal_places=3, default=0, max_digits=12)),
+                ('amount', models.DecimalField(decimal_places=5, default=0, max_digits=14)),
+                ('notes', models.PositiveIntegerField(default=0)),
+                ('missing_prices', models.PositiveIntegerField(default=0)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_deliveries', to=settings.AUTH_USER_MODEL)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='lupanes.product')),
+            ],
+            options={
+                'unique_together': {('day', 'customer', 'product')},
+            },
+        ),
+    ]
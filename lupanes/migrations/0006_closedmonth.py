@@ -0,0 +1,42 @@
+# Generated by Django 4.2.28 on 2026-10-18 15:46
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('lupanes', '0005_dailydelivery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClosedMonth',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('closed_at', models.DateTimeField(auto_now_add=True)),
+                ('closed_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='closed_months', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('year', 'month')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CustomerMonthTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total', models.DecimalField(decimal_places=5, max_digits=14)),
+                ('missing_prices', models.PositiveIntegerField(default=0)),
+                ('closed_month', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='totals', to='lupanes.closedmonth')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='month_totals', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('closed_month', 'customer')},
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.28 on 2026-10-18 16:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lupanes', '0006_closedmonth'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='deliverynote',
+            index=models.Index(fields=['customer', 'date'], name='deliverynote_customer_date'),
+        ),
+        migrations.AddIndex(
+            model_name='deliverynote',
+            index=models.Index(fields=['product', 'date'], name='deliverynote_product_date'),
+        ),
+        migrations.AddIndex(
+            model_name='deliverynote',
+            index=models.Index(fields=['date'], name='deliverynote_date'),
+        ),
+    ]
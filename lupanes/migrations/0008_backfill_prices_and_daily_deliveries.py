@@ -0,0 +1,76 @@
+from bisect import bisect_right
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+CHUNK_SIZE = 2000
+
+
+def fill_prices(apps, schema_editor):
+    """Store the price of the notes created before it was stored (0004)"""
+    DeliveryNote = apps.get_model("lupanes", "DeliveryNote")
+    ProductPrice = apps.get_model("lupanes", "ProductPrice")
+
+    timelines = {}
+    for product_id, start_date, value in ProductPrice.objects.order_by(
+        "product_id", "start_date",
+    ).values_list("product_id", "start_date", "value"):
+        dates, values = timelines.setdefault(product_id, ([], []))
+        dates.append(start_date)
+        values.append(value)
+
+    last_pk = 0
+    qs = DeliveryNote.objects.filter(unit_price__isnull=True).order_by("pk")
+    while batch := list(qs.filter(pk__gt=last_pk)[:CHUNK_SIZE]):
+        changed = []
+        for note in batch:
+            dates, values = timelines.get(note.product_id, ((), ()))
+            day = timezone.make_naive(note.date, timezone.get_default_timezone()).date()
+            position = bisect_right(dates, day)
+            if position:
+                note.unit_price = values[position - 1]
+                note.amount = note.quantity * note.unit_price
+                changed.append(note)
+        DeliveryNote.objects.bulk_update(changed, ["unit_price", "amount"])
+        last_pk = batch[-1].pk
+
+
+def rebuild_daily_deliveries(apps, schema_editor):
+    """Fill the rollup (0005) with the notes that already existed"""
+    DeliveryNote = apps.get_model("lupanes", "DeliveryNote")
+    DailyDelivery = apps.get_model("lupanes", "DailyDelivery")
+
+    DailyDelivery.objects.all().delete()
+    rows = DeliveryNote.objects.annotate(local_date=TruncDate("date")).values(
+        "local_date", "customer", "product",
+    ).annotate(
+        total_quantity=models.Sum("quantity"),
+        total_amount=Coalesce(models.Sum("amount"), models.Value(0), output_field=models.DecimalField()),
+        notes_count=models.Count("pk"),
+        missing_count=models.Count("pk", filter=models.Q(amount__isnull=True)),
+    ).order_by().iterator(chunk_size=CHUNK_SIZE)
+
+    batch = []
+    for row in rows:
+        batch.append(DailyDelivery(
+            day=row["local_date"], customer_id=row["customer"], product_id=row["product"],
+            quantity=row["total_quantity"], amount=row["total_amount"],
+            notes=row["notes_count"], missing_prices=row["missing_count"],
+        ))
+        if len(batch) == CHUNK_SIZE:
+            DailyDelivery.objects.bulk_create(batch)
+            batch = []
+    DailyDelivery.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lupanes', '0007_deliverynote_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_prices, migrations.RunPython.noop),
+        migrations.RunPython(rebuild_daily_deliveries, migrations.RunPython.noop),
+    ]
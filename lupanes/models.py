@@ -1,9 +1,165 @@
+import datetime
+import decimal
+import time
+from bisect import bisect_right
+from itertools import islice
+
 from django.conf import settings
-from django.db import models
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import models, transaction
+from django.db.models.functions import Coalesce, TruncDate
+from django.db.models.query import ModelIterable
 from django.utils import timezone
 from django.utils.formats import date_format
 
-from lupanes.exceptions import PriceDoesNotExistOnDate
+from lupanes.exceptions import (MonthAlreadyClosed, MonthClosed,
+                                MonthNotFinished, PriceDoesNotExistOnDate)
+
+
+class PricedDeliveryNoteIterable(ModelIterable):
+    """Yield delivery notes with their prices resolved in bulk"""
+    chunk_size_on_iterator = 2000
+
+    def __iter__(self):
+        notes = super().__iter__()
+        if not self.chunked_fetch:
+            notes = list(notes)
+            PriceResolver.for_notes(notes)
+            yield from notes
+            return
+
+        while batch := list(islice(notes, self.chunk_size_on_iterator)):
+            PriceResolver.for_notes(batch)
+            yield from batch
+
+
+# fields that change the price of a note or the `DailyDelivery` row where it is summed up
+PRICE_FIELDS = {"date", "product", "product_id", "quantity"}
+ROLLUP_FIELDS = PRICE_FIELDS | {"customer", "customer_id"}
+
+
+class DeliveryNoteQuerySet(models.QuerySet):
+    def with_prices(self):
+        """Resolve the price of every note with one extra query instead of one per note"""
+        clone = self._chain()
+        clone._iterable_class = PricedDeliveryNoteIterable
+        return clone
+
+    def with_line_amount(self):
+        """
+        Annotate `line_unit_price` and `line_amount` computed by the database.
+
+        The stored price is used when available, otherwise the price on the note
+        date is looked up with a correlated subquery. Both are NULL when the
+        product has no price on that date.
+        """
+        price_on_date = ProductPrice.objects.filter(
+            product=models.OuterRef("product"),
+            start_date__lte=models.OuterRef("local_date"),
+        ).order_by("-start_date").values("value")[:1]
+
+        return self.annotate(
+            local_date=TruncDate("date"),
+            line_unit_price=Coalesce(models.F("unit_price"), models.Subquery(price_on_date)),
+            line_amount=Coalesce(
+                models.F("amount"),
+                models.ExpressionWrapper(
+                    models.F("quantity") * models.F("line_unit_price"),
+                    output_field=models.DecimalField(max_digits=11, decimal_places=5),
+                ),
+            ),
+        )
+
+    def on_days(self, first_day, last_day=None):
+        """Notes of the local days from `first_day` to `last_day` (or only `first_day`)"""
+        start, end = local_date_range(first_day, last_day)
+        return self.filter(date__gte=start, date__lt=end)
+
+    def since_day(self, day):
+        return self.filter(date__gte=local_day_start(day))
+
+    def in_month(self, year, month):
+        start, end = local_month_range(year, month)
+        return self.filter(date__gte=start, date__lt=end)
+
+    def exclude_closed_months(self):
+        """Exclude notes of closed months, which keep the amounts they had when closed"""
+        closed = models.Q()
+        for year, month in ClosedMonth.objects.values_list("year", "month"):
+            start, end = local_month_range(year, month)
+            closed |= models.Q(date__gte=start, date__lt=end)
+        if not closed:
+            return self
+        return self.exclude(closed)
+
+    def _rollup_keys(self):
+        return {
+            (_as_local_date(date), customer_id, product_id)
+            for date, customer_id, product_id in self.values_list("date", "customer_id", "product_id")
+        }
+
+    def delete(self):
+        """Delete the notes and refresh their daily rollup (the admin bulk action uses this)"""
+        with transaction.atomic():
+            keys = self._rollup_keys()
+            ClosedMonth.objects.check_open(day for day, _, _ in keys)
+            result = super().delete()
+            DailyDelivery.objects.refresh(keys)
+        return result
+
+    def update(self, **kwargs):
+        """Update the notes, repricing them and refreshing the daily rollup when needed"""
+        if not ROLLUP_FIELDS & set(kwargs):
+            return super().update(**kwargs)
+
+        with transaction.atomic():
+            pks = list(self.values_list("pk", flat=True))
+            keys = self._rollup_keys()
+            ClosedMonth.objects.check_open([day for day, _, _ in keys] + [kwargs.get("date")])
+            rows = super().update(**kwargs)
+            notes = self.model.objects.filter(pk__in=pks)
+            if PRICE_FIELDS & set(kwargs):
+                notes.reprice()
+            DailyDelivery.objects.refresh(keys | notes._rollup_keys())
+        return rows
+
+    def reprice(self, chunk_size=2000):
+        """Recompute the stored price of the notes in chunks, returns how many have changed"""
+        updated = 0
+        last_pk = 0
+        qs = self.order_by("pk")
+        while batch := list(qs.filter(pk__gt=last_pk)[:chunk_size]):
+            resolver = PriceResolver.for_notes(batch)
+            now = timezone.now()
+            changed = []
+            for note in batch:
+                if note.set_price(resolver):
+                    note.updated_at = now
+                    changed.append(note)
+
+            self.model.objects.bulk_update(changed, ["unit_price", "amount", "updated_at"])
+            DailyDelivery.objects.refresh(note.rollup_key for note in changed)
+            updated += len(changed)
+            last_pk = batch[-1].pk
+
+        return updated
+
+    @transaction.atomic
+    def create_many(self, notes, batch_size=None, resolver=None):
+        """
+        Insert `notes` with `bulk_create`, storing their price and refreshing
+        the daily rollup (as `save()` is not called).
+        """
+        notes = list(notes)
+        ClosedMonth.objects.check_open(note.date for note in notes)
+        if resolver is None:
+            resolver = PriceResolver.for_notes(notes)
+        for note in notes:
+            note.set_price(resolver)
+        notes = self.bulk_create(notes, batch_size=batch_size)
+        DailyDelivery.objects.refresh(note.rollup_key for note in notes)
+        return notes
 
 
 class DeliveryNote(models.Model):
@@ -17,12 +173,181 @@ class DeliveryNote(models.Model):
     product = models.ForeignKey("Product", on_delete=models.PROTECT)
     quantity = models.DecimalField("Cantidad", max_digits=6, decimal_places=3)
     sheet_number = models.CharField("Nº de hoja", max_length=6, blank=True, default='')
+    # price applied to the note, NULL when the product has no price on `date`
+    unit_price = models.DecimalField("Precio unitario", max_digits=5, decimal_places=2,
+                                     null=True, blank=True, editable=False)
+    amount = models.DecimalField("Importe", max_digits=11, decimal_places=5,
+                                 null=True, blank=True, editable=False)
+
+    objects = DeliveryNoteQuerySet.as_manager()
+
+    class Meta:
+        # filter by date ranges (see `local_date_range`), usually of a customer or a product
+        indexes = [
+            models.Index(fields=["customer", "date"], name="deliverynote_customer_date"),
+            models.Index(fields=["product", "date"], name="deliverynote_product_date"),
+            models.Index(fields=["date"], name="deliverynote_date"),
+        ]
 
-    def amount(self):
-        return self.quantity * self.product.get_price_on(self.date)
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or {"date", "product", "quantity"} & set(update_fields):
+            self.set_price()
+            if update_fields is not None:
+                kwargs["update_fields"] = {"unit_price", "amount"} | set(update_fields)
+
+        previous_key = None
+        if not self._state.adding:
+            previous = DeliveryNote.objects.filter(pk=self.pk).values("date", "customer_id", "product_id").first()
+            if previous:
+                previous_key = (_as_local_date(previous["date"]), previous["customer_id"], previous["product_id"])
+        ClosedMonth.objects.check_open([self.date, previous_key and previous_key[0]])
+
+        super().save(*args, **kwargs)
+        DailyDelivery.objects.refresh([previous_key, self.rollup_key])
+
+    def delete(self, *args, **kwargs):
+        rollup_key = self.rollup_key
+        ClosedMonth.objects.check_open([self.date])
+        result = super().delete(*args, **kwargs)
+        DailyDelivery.objects.refresh([rollup_key])
+        return result
+
+    @property
+    def rollup_key(self):
+        """Key of the `DailyDelivery` row that includes this note"""
+        return (_as_local_date(self.date), self.customer_id, self.product_id)
+
+    def get_unit_price(self):
+        resolver = getattr(self, "_price_resolver", None)
+        if resolver is not None:
+            return resolver.get_price_on(self.product_id, self.date)
+        return self.product.get_price_on(self.date)
+
+    def set_price(self, resolver=None):
+        """Fill `unit_price` and `amount` from the product price on `date`, returns if they changed"""
+        previous = (self.unit_price, self.amount)
+        self._price_resolver = resolver
+        if resolver is not None:
+            self.unit_price = resolver.get_price_or_none(self.product_id, self.date)
+        else:
+            try:
+                self.unit_price = self.get_unit_price()
+            except PriceDoesNotExistOnDate:
+                self.unit_price = None
+        self.amount = None if self.unit_price is None else self.quantity * self.unit_price
+        return previous != (self.unit_price, self.amount)
 
     def get_amount_export_format(self):
-        return '{0:.2f}'.format(self.amount())
+        if self.amount is None:
+            return ''
+        return '{0:.2f}'.format(self.amount)
+
+
+class DailyDeliveryQuerySet(models.QuerySet):
+    def customer_month_amount(self, customer_id, year, month):
+        """Amount of the notes with price of a customer in a month"""
+        return self.filter(
+            customer_id=customer_id, day__year=year, day__month=month,
+        ).aggregate(total=models.Sum("amount"))["total"] or decimal.Decimal(0)
+
+    def summarize_notes(self, notes):
+        """Aggregate `notes` by (day, customer, product) as `DailyDelivery` field values"""
+        return notes.with_line_amount().values("local_date", "customer", "product").annotate(
+            total_quantity=models.Sum("quantity"),
+            total_amount=models.Sum("line_amount"),
+            notes_count=models.Count("pk"),
+            missing_count=models.Count("pk", filter=models.Q(line_amount__isnull=True)),
+        ).order_by()
+
+    def _build(self, row):
+        return self.model(
+            day=row["local_date"], customer_id=row["customer"], product_id=row["product"],
+            quantity=row["total_quantity"], amount=row["total_amount"] or 0,
+            notes=row["notes_count"], missing_prices=row["missing_count"],
+        )
+
+    def _lock(self, keys):
+        """
+        Lock the rows of `keys` (created empty when missing) until the end of the transaction.
+
+        Concurrent refreshes of the same key wait for each other, so each one reads
+        the notes committed by the previous one instead of overwriting its total.
+        """
+        self.bulk_create(
+            [self.model(day=day, customer_id=customer_id, product_id=product_id)
+             for day, customer_id, product_id in sorted(keys)],
+            ignore_conflicts=True,
+        )
+        list(self.select_for_update().filter(
+            day__in={day for day, _, _ in keys},
+            customer_id__in={customer_id for _, customer_id, _ in keys},
+            product_id__in={product_id for _, _, product_id in keys},
+        ).order_by("day", "customer", "product").values_list("pk", flat=True))
+
+    @transaction.atomic
+    def refresh(self, keys):
+        """Recompute the rows of the (day, customer_id, product_id) `keys` from their delivery notes"""
+        keys = {key for key in keys if key is not None}
+        if not keys:
+            return
+        self._lock(keys)
+
+        notes = DeliveryNote.objects.filter(
+            _days_condition({day for day, _, _ in keys}),
+            customer_id__in={customer_id for _, customer_id, _ in keys},
+            product_id__in={product_id for _, _, product_id in keys},
+        )
+        rows = []
+        for row in self.summarize_notes(notes):
+            key = (row["local_date"], row["customer"], row["product"])
+            if key in keys:
+                keys.remove(key)
+                rows.append(self._build(row))
+
+        self.bulk_create(
+            rows, update_conflicts=True,
+            unique_fields=["day", "customer", "product"],
+            update_fields=["quantity", "amount", "notes", "missing_prices"],
+        )
+
+        # remaining keys have no notes anymore
+        if keys:
+            stale = models.Q()
+            for day, customer_id, product_id in keys:
+                stale |= models.Q(day=day, customer_id=customer_id, product_id=product_id)
+            self.filter(stale).delete()
+
+    def rebuild(self, chunk_size=2000):
+        """Recreate every row from the delivery notes, returns the number of rows"""
+        self.all().delete()
+        total = 0
+        rows = self.summarize_notes(DeliveryNote.objects.all()).iterator(chunk_size=chunk_size)
+        while batch := [self._build(row) for row in islice(rows, chunk_size)]:
+            self.bulk_create(batch)
+            total += len(batch)
+        return total
+
+
+class DailyDelivery(models.Model):
+    """Resumen diario de albaranes por nevera y producto"""
+    day = models.DateField()
+    customer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+                                 related_name="daily_deliveries")
+    product = models.ForeignKey("Product", on_delete=models.CASCADE)
+    quantity = models.DecimalField(max_digits=12, decimal_places=3, default=0)
+    # sum of the notes with price, `missing_prices` counts the notes without it
+    amount = models.DecimalField(max_digits=14, decimal_places=5, default=0)
+    notes = models.PositiveIntegerField(default=0)
+    missing_prices = models.PositiveIntegerField(default=0)
+
+    objects = DailyDeliveryQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ["day", "customer", "product"]
+
+    def __str__(self) -> str:
+        return f"{self.day} {self.customer_id} {self.product_id}: {self.quantity}"
 
 
 class Producer(models.Model):
@@ -31,6 +356,11 @@ class Producer(models.Model):
     def __str__(self) -> str:
         return f"{self.name}"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # the producer name is part of the products labels
+        bump_data_version(CATALOG)
+
 
 class Product(models.Model):
     class Unit(models.TextChoices):
@@ -58,6 +388,15 @@ class Product(models.Model):
             return f"{self.name} ({self.producer.name})"
         return f"{self.name}"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        bump_data_version(CATALOG)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        bump_data_version(CATALOG)
+        return result
+
     def unit_accept_decimals(self):
         return self.unit in Product.Unit.fractional_units()
 
@@ -81,7 +420,254 @@ class ProductPrice(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
 
     class Meta:
+        # its index also serves `get_price_on` (scanned backwards to find the latest start date)
         unique_together = ["product", "start_date"]
 
     def __str__(self) -> str:
         return f"{self.product.name} - {self.value} ({self.start_date})"
+
+    def save(self, *args, **kwargs):
+        previous_start_date = None
+        if self.pk:
+            previous_start_date = ProductPrice.objects.filter(pk=self.pk).values_list("start_date", flat=True).first()
+        super().save(*args, **kwargs)
+        self.reprice_notes(previous_start_date)
+        bump_data_version(CATALOG)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self.reprice_notes()
+        bump_data_version(CATALOG)
+        return result
+
+    def reprice_notes(self, previous_start_date=None):
+        """Update the stored price of the notes affected by adding, changing or removing this price"""
+        since = self.start_date
+        if isinstance(since, str):
+            since = datetime.date.fromisoformat(since)
+        if previous_start_date is not None:
+            since = min(since, previous_start_date)
+        DeliveryNote.objects.filter(product_id=self.product_id).since_day(since).exclude_closed_months().reprice()
+
+
+class ClosedMonthQuerySet(models.QuerySet):
+    def is_closed(self, date):
+        date = _as_local_date(date)
+        return self.filter(year=date.year, month=date.month).exists()
+
+    def check_open(self, dates):
+        """Raise `MonthClosed` if any of `dates` is in a closed month"""
+        months = {
+            (date.year, date.month) for date in map(_as_local_date, dates) if isinstance(date, datetime.date)
+        }
+        if not months:
+            return
+        condition = models.Q()
+        for year, month in months:
+            condition |= models.Q(year=year, month=month)
+        closed = self.filter(condition).first()
+        if closed is not None:
+            raise MonthClosed(f"{closed} is closed, its delivery notes cannot be changed")
+
+    @transaction.atomic
+    def close(self, year, month, closed_by=None):
+        """
+        Freeze the amounts of the notes of the month and save the total of each customer.
+
+        Returns the `ClosedMonth`, or raises `MonthNotFinished` or `MonthAlreadyClosed`.
+        """
+        if datetime.date(year, month, 1) >= timezone.localdate().replace(day=1):
+            raise MonthNotFinished(f"{month:02}/{year} has not finished yet")
+        if self.filter(year=year, month=month).exists():
+            raise MonthAlreadyClosed(f"{month:02}/{year} is already closed")
+
+        notes = DeliveryNote.objects.in_month(year, month)
+        notes.reprice()
+        totals = {
+            item["customer"]: item
+            for item in notes.with_line_amount().values("customer").annotate(
+                total=models.Sum("line_amount"),
+                missing_prices=models.Count("pk", filter=models.Q(line_amount__isnull=True)),
+            ).order_by()
+        }
+
+        closed_month = self.create(year=year, month=month, closed_by=closed_by)
+        customer_ids = set(totals) | set(
+            get_user_model().objects.get_active_customers().values_list("pk", flat=True))
+        CustomerMonthTotal.objects.bulk_create(
+            CustomerMonthTotal(
+                closed_month=closed_month,
+                customer_id=customer_id,
+                total=totals.get(customer_id, {}).get("total") or 0,
+                missing_prices=totals.get(customer_id, {}).get("missing_prices", 0),
+            )
+            for customer_id in customer_ids
+        )
+        return closed_month
+
+
+class ClosedMonth(models.Model):
+    """Mes cerrado: sus albaranes e importes ya no cambian"""
+    year = models.PositiveIntegerField()
+    month = models.PositiveSmallIntegerField()
+    closed_at = models.DateTimeField(auto_now_add=True)
+    closed_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, on_delete=models.SET_NULL,
+                                  related_name="closed_months")
+
+    objects = ClosedMonthQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ["year", "month"]
+
+    def __str__(self) -> str:
+        return f"{self.month:02}/{self.year}"
+
+
+class CustomerMonthTotal(models.Model):
+    """Total of a customer on a closed month"""
+    closed_month = models.ForeignKey(ClosedMonth, on_delete=models.CASCADE, related_name="totals")
+    customer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+                                 related_name="month_totals")
+    total = models.DecimalField(max_digits=14, decimal_places=5)
+    missing_prices = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ["closed_month", "customer"]
+
+
+# data versions: products (with their producers and prices) and customers
+CATALOG = "catalog"
+CUSTOMERS = "customers"
+
+
+def get_data_version(name):
+    """
+    Time of the last change of the `name` data (e.g. `CATALOG`), used to
+    version what is built from it (HTTP validators, cached lists...).
+    """
+    durable_cache = caches["durable"]
+    key = f"data_version:{name}"
+    version = durable_cache.get(key)
+    if version is None:
+        # unknown (e.g. cache table recreated): consider it changed now
+        durable_cache.add(key, time.time(), timeout=None)
+        version = durable_cache.get(key)
+    return version
+
+
+def bump_data_version(name):
+    caches["durable"].set(f"data_version:{name}", time.time(), timeout=None)
+
+
+def local_day_start(day):
+    """Aware datetime of the start of the local `day`"""
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def local_date_range(first_day, last_day=None):
+    """
+    Half-open range `(start, end)` of aware datetimes with the local days from
+    `first_day` to `last_day`, both included.
+
+    Unlike `date__date`, which converts the date of every row, filtering with
+    `date__gte=start, date__lt=end` can use the indexes on `date`.
+    """
+    if last_day is None:
+        last_day = first_day
+    return local_day_start(first_day), local_day_start(last_day + datetime.timedelta(days=1))
+
+
+def local_month_range(year, month):
+    first_day = datetime.date(year, month, 1)
+    next_month = (first_day + datetime.timedelta(days=32)).replace(day=1)
+    return local_day_start(first_day), local_day_start(next_month)
+
+
+MAX_DAY_RANGES = 50
+
+
+def _days_condition(days):
+    """Condition on `date` matching the local `days`, with consecutive days merged in one range"""
+    ranges = []
+    for day in sorted(days):
+        if ranges and ranges[-1][1] + datetime.timedelta(days=1) == day:
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+    if len(ranges) > MAX_DAY_RANGES:
+        # may include other days, callers only use the rows of the days they look for
+        ranges = [[ranges[0][0], ranges[-1][1]]]
+
+    condition = models.Q()
+    for first_day, last_day in ranges:
+        start, end = local_date_range(first_day, last_day)
+        condition |= models.Q(date__gte=start, date__lt=end)
+    return condition
+
+
+def _as_local_date(value):
+    """Convert `value` to the local date used to compare it with `ProductPrice.start_date`"""
+    if isinstance(value, datetime.datetime):
+        if timezone.is_aware(value):
+            value = timezone.make_naive(value, timezone.get_default_timezone())
+        return value.date()
+    return value
+
+
+class PriceResolver:
+    """
+    Resolve the price of many (product, date) pairs with a single query.
+
+    All the prices of the involved products are loaded at once and kept
+    as a timeline sorted by `start_date` per product, so each lookup is
+    a binary search in memory.
+    """
+
+    def __init__(self, product_ids):
+        self._product_ids = set(product_ids)
+        self._product_names = None
+        self._timelines = {}
+        prices = ProductPrice.objects.filter(
+            product_id__in=self._product_ids,
+        ).order_by("product_id", "start_date").values_list("product_id", "start_date", "value")
+
+        for product_id, start_date, value in prices:
+            dates, values = self._timelines.setdefault(product_id, ([], []))
+            dates.append(start_date)
+            values.append(value)
+
+    @classmethod
+    def for_notes(cls, notes):
+        """Build a resolver for `notes` and attach it so `note.get_unit_price()` does not hit the database"""
+        notes = list(notes)
+        resolver = cls(note.product_id for note in notes)
+        for note in notes:
+            note._price_resolver = resolver
+        return resolver
+
+    @classmethod
+    def for_pairs(cls, pairs):
+        """Resolve an iterable of (product_id, date) pairs: returns {pair: price or None}"""
+        pairs = list(pairs)
+        resolver = cls(product_id for product_id, _ in pairs)
+        return {pair: resolver.get_price_or_none(*pair) for pair in pairs}
+
+    def get_price_or_none(self, product_id, date):
+        dates, values = self._timelines.get(product_id, ((), ()))
+        position = bisect_right(dates, _as_local_date(date))
+        if position == 0:
+            return None
+        return values[position - 1]
+
+    def get_price_on(self, product_id, date):
+        price = self.get_price_or_none(product_id, date)
+        if price is None:
+            if self._product_names is None:
+                # only for the error message: loaded once for all the products
+                self._product_names = dict(
+                    Product.objects.filter(pk__in=self._product_ids).values_list("pk", "name")
+                )
+            name = self._product_names.get(product_id)
+            short_date = date_format(date, settings.SHORT_DATE_FORMAT)
+            raise PriceDoesNotExistOnDate(f"Price for product {product_id} {name} does not exist on {short_date}")
+        return price
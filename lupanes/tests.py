@@ -1,20 +1,45 @@
+import contextlib
+import csv
+import gzip
+import importlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
 from datetime import date
 from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import skipUnless
 from unittest.mock import MagicMock, patch
 
 import requests.exceptions
+from django.apps import apps as django_apps
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
-from django.core.cache import cache
-from django.test import TestCase
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from gspread.exceptions import APIError
 
 import lupanes.utils
-from lupanes.exceptions import RetryExhausted
-from lupanes.models import DeliveryNote, Producer, Product, ProductPrice
+from lupanes.exceptions import (CircuitOpen, MonthAlreadyClosed, MonthClosed,
+                                MonthNotFinished, PriceDoesNotExistOnDate,
+                                RetryExhausted)
+from lupanes.forms import DeliveryNoteCreateForm, DeliveryNoteForm
+from lupanes.models import (ClosedMonth, DailyDelivery, DeliveryNote,
+                            PriceResolver, Producer, Product, ProductPrice,
+                            local_date_range, local_month_range)
 from lupanes.users import CUSTOMERS_GROUP
+from lupanes.users.models import NeveraBalance
 from lupanes.utils import _get_nevera_cache_key, search_nevera_balance
 
 User = get_user_model()
@@ -216,6 +241,12 @@ class UserMonthlyConsumptionTestCase(TestCase):
 class RetryLogicTestCase(TestCase):
     """Tests for retry logic with exponential backoff"""
 
+    def setUp(self):
+        lupanes.utils.reset_spreadsheet()
+
+    def tearDown(self):
+        lupanes.utils.reset_spreadsheet()
+
     def _create_503_response(self):
         """Helper to create a mock 503 response for APIError"""
         mock_response = MagicMock()
@@ -325,7 +356,7 @@ class CachingTestCase(TestCase):
     def test_search_nevera_balance_caches_result(self, mock_load):
         """Verify balance is cached after first fetch"""
         mock_worksheet = MagicMock()
-        mock_worksheet.get_all_values.return_value = [
+        mock_worksheet.get.return_value = [
             ['nevera1', '100.50'],
         ]
         mock_load.return_value = mock_worksheet
@@ -345,7 +376,7 @@ class CachingTestCase(TestCase):
     def test_search_nevera_balance_caches_not_found(self, mock_load):
         """Verify 'N/A' is cached to avoid repeated lookups"""
         mock_worksheet = MagicMock()
-        mock_worksheet.get_all_values.return_value = [
+        mock_worksheet.get.return_value = [
             ['nevera1', '100.50'],
         ]
         mock_load.return_value = mock_worksheet
@@ -365,7 +396,7 @@ class CachingTestCase(TestCase):
     def test_search_nevera_balance_case_insensitive_cache(self, mock_load):
         """Verify cache keys are case-insensitive"""
         mock_worksheet = MagicMock()
-        mock_worksheet.get_all_values.return_value = [
+        mock_worksheet.get.return_value = [
             ['nevera1', '100.50'],
         ]
         mock_load.return_value = mock_worksheet
@@ -385,7 +416,7 @@ class CachingTestCase(TestCase):
     def test_search_nevera_balance_respects_cache_ttl(self, mock_load):
         """Verify cache respects TTL setting"""
         mock_worksheet = MagicMock()
-        mock_worksheet.get_all_values.return_value = [
+        mock_worksheet.get.return_value = [
             ['nevera1', '100.50'],
         ]
         mock_load.return_value = mock_worksheet
@@ -412,7 +443,7 @@ class CachingTestCase(TestCase):
     def test_search_nevera_balance_caches_all_customers(self, mock_load):
         """Verify that one API call caches ALL customers from spreadsheet"""
         mock_worksheet = MagicMock()
-        mock_worksheet.get_all_values.return_value = [
+        mock_worksheet.get.return_value = [
             ['nevera1', '100.50'],
             ['nevera2', '200.75'],
             ['nevera3', '50.00'],
@@ -690,3 +721,2089 @@ class ProductSummaryAggregationTest(ProductSummaryTestMixin, TestCase):
         })
         products = response.context["product_summary"]
         self.assertEqual(len(products), 0)
+
+
+# --- Price Resolver Tests ---
+
+
+class PriceResolverTestCase(TestCase):
+    """Tests for resolving prices of many notes at once"""
+
+    def setUp(self):
+        self.customers_group = Group.objects.create(name=CUSTOMERS_GROUP)
+        self.customer = User.objects.create_user(username="ana", password="test1234")
+        self.customer.groups.add(self.customers_group)
+
+        producer = Producer.objects.create(name="Frutas Garcia")
+        self.manzana = Product.objects.create(name="Manzana", producer=producer, unit="Kg")
+        ProductPrice.objects.create(product=self.manzana, value=Decimal("2.00"), start_date=date(2026, 1, 1))
+        ProductPrice.objects.create(product=self.manzana, value=Decimal("3.00"), start_date=date(2026, 3, 1))
+        self.pan = Product.objects.create(name="Pan", producer=producer, unit="unidad")
+
+    def test_resolves_price_on_each_date(self):
+        prices = PriceResolver.for_pairs([
+            (self.manzana.pk, date(2026, 2, 28)),
+            (self.manzana.pk, date(2026, 3, 1)),
+            (self.manzana.pk, date(2025, 12, 31)),
+            (self.pan.pk, date(2026, 3, 1)),
+        ])
+        self.assertEqual(prices[(self.manzana.pk, date(2026, 2, 28))], Decimal("2.00"))
+        self.assertEqual(prices[(self.manzana.pk, date(2026, 3, 1))], Decimal("3.00"))
+        self.assertIsNone(prices[(self.manzana.pk, date(2025, 12, 31))])
+        self.assertIsNone(prices[(self.pan.pk, date(2026, 3, 1))])
+
+    def test_with_prices_uses_a_single_price_query(self):
+        for day in range(1, 11):
+            DeliveryNote.objects.create(
+                customer=self.customer, product=self.manzana, quantity=Decimal("1"),
+                date=timezone.datetime(2026, 2, day, 10, 0, tzinfo=timezone.utc),
+            )
+
+        with self.assertNumQueries(2):
+            notes = list(DeliveryNote.objects.with_prices())
+            total = sum(note.quantity * note.get_unit_price() for note in notes)
+
+        self.assertEqual(total, Decimal("20.00"))
+
+    def test_with_prices_matches_get_price_on(self):
+        note = DeliveryNote.objects.create(
+            customer=self.customer, product=self.manzana, quantity=Decimal("2"),
+            date=timezone.datetime(2026, 2, 28, 23, 30, tzinfo=timezone.utc),
+        )
+        priced_note = DeliveryNote.objects.with_prices().get(pk=note.pk)
+        self.assertEqual(priced_note.get_unit_price(), self.manzana.get_price_on(note.date))
+
+    def test_with_prices_raises_on_missing_price(self):
+        DeliveryNote.objects.create(
+            customer=self.customer, product=self.pan, quantity=Decimal("1"),
+            date=timezone.datetime(2026, 3, 1, 10, 0, tzinfo=timezone.utc),
+        )
+        note = DeliveryNote.objects.with_prices().get()
+        with self.assertRaises(PriceDoesNotExistOnDate):
+            note.get_unit_price()
+
+    def test_missing_prices_do_not_add_queries(self):
+        notes = [
+            DeliveryNote(customer=self.customer, product=self.pan, quantity=Decimal("1"),
+                         date=timezone.datetime(2026, 3, day, 10, 0, tzinfo=timezone.utc))
+            for day in range(1, 11)
+        ]
+        resolver = PriceResolver([self.pan.pk])
+
+        with self.assertNumQueries(0):
+            for note in notes:
+                note.set_price(resolver)
+        self.assertTrue(all(note.unit_price is None and note.amount is None for note in notes))
+
+        with self.assertNumQueries(1):
+            for note in notes:
+                with self.assertRaisesMessage(PriceDoesNotExistOnDate, "Pan"):
+                    note.get_unit_price()
+
+
+# --- Stored Price Tests ---
+
+
+class DeliveryNoteStoredPriceTestCase(TestCase):
+    """Tests for the unit price and amount stored on each delivery note"""
+
+    def setUp(self):
+        self.customer = User.objects.create_user(username="ana", password="test1234")
+        producer = Producer.objects.create(name="Frutas Garcia")
+        self.manzana = Product.objects.create(name="Manzana", producer=producer, unit="Kg")
+        self.price = ProductPrice.objects.create(
+            product=self.manzana, value=Decimal("2.00"), start_date=date(2026, 1, 1))
+
+    def _create_note(self, day, quantity="1.5"):
+        return DeliveryNote.objects.create(
+            customer=self.customer, product=self.manzana, quantity=Decimal(quantity),
+            date=timezone.datetime(2026, 3, day, 10, 0, tzinfo=timezone.utc),
+        )
+
+    def test_price_is_stored_on_save(self):
+        note = self._create_note(10)
+        note.refresh_from_db()
+        self.assertEqual(note.unit_price, Decimal("2.00"))
+        self.assertEqual(note.amount, Decimal("3.00"))
+        self.assertEqual(note.get_amount_export_format(), "3.00")
+
+    def test_price_is_updated_when_quantity_changes(self):
+        note = self._create_note(10)
+        note.quantity = Decimal("2")
+        note.save()
+        note.refresh_from_db()
+        self.assertEqual(note.amount, Decimal("4.00"))
+
+    def test_missing_price_is_stored_as_null(self):
+        note = DeliveryNote.objects.create(
+            customer=self.customer, product=self.manzana, quantity=Decimal("1"),
+            date=timezone.datetime(2025, 12, 1, 10, 0, tzinfo=timezone.utc),
+        )
+        note.refresh_from_db()
+        self.assertIsNone(note.unit_price)
+        self.assertIsNone(note.amount)
+        self.assertEqual(note.get_amount_export_format(), "")
+
+    def test_new_price_reprices_affected_notes(self):
+        before = self._create_note(10)
+        after = self._create_note(20)
+        ProductPrice.objects.create(product=self.manzana, value=Decimal("3.00"), start_date=date(2026, 3, 15))
+
+        before.refresh_from_db()
+        after.refresh_from_db()
+        self.assertEqual(before.amount, Decimal("3.00"))
+        self.assertEqual(after.amount, Decimal("4.50"))
+
+    def test_edited_price_reprices_affected_notes(self):
+        note = self._create_note(10)
+        self.price.value = Decimal("4.00")
+        self.price.save()
+
+        note.refresh_from_db()
+        self.assertEqual(note.unit_price, Decimal("4.00"))
+
+    def test_backfill_command(self):
+        note = self._create_note(10)
+        DeliveryNote.objects.update(unit_price=None, amount=None)
+
+        out = StringIO()
+        call_command("repricedeliverynotes", "--chunk-size", "1", stdout=out)
+
+        note.refresh_from_db()
+        self.assertEqual(note.amount, Decimal("3.00"))
+        self.assertIn("Repriced 1 delivery notes.", out.getvalue())
+
+
+# --- SQL Price Annotation Tests ---
+
+
+class DeliveryNoteLineAmountTestCase(TestCase):
+    """Tests for the price-as-of-date computed by the database"""
+
+    def setUp(self):
+        self.managers_group = Group.objects.create(name="tienda")
+        self.customers_group = Group.objects.create(name=CUSTOMERS_GROUP)
+        self.manager = User.objects.create_user(username="manager", password="test1234")
+        self.manager.groups.add(self.managers_group)
+        self.ana = User.objects.create_user(username="ana", password="test1234")
+        self.ana.groups.add(self.customers_group)
+        self.pedro = User.objects.create_user(username="pedro", password="test1234")
+        self.pedro.groups.add(self.customers_group)
+
+        producer = Producer.objects.create(name="Frutas Garcia")
+        self.manzana = Product.objects.create(name="Manzana", producer=producer, unit="Kg")
+        ProductPrice.objects.create(product=self.manzana, value=Decimal("2.00"), start_date=date(2026, 1, 1))
+        ProductPrice.objects.create(product=self.manzana, value=Decimal("3.00"), start_date=date(2026, 3, 15))
+        self.pan = Product.objects.create(name="Pan", producer=producer, unit="unidad")
+
+    def _create_note(self, customer, product, day, quantity="1"):
+        return DeliveryNote.objects.create(
+            customer=customer, product=product, quantity=Decimal(quantity),
+            date=timezone.datetime(2026, 3, day, 10, 0, tzinfo=timezone.utc),
+        )
+
+    def test_line_amount_is_computed_without_stored_price(self):
+        before = self._create_note(self.ana, self.manzana, 10, "2")
+        after = self._create_note(self.ana, self.manzana, 20, "2")
+        DeliveryNote.objects.update(unit_price=None, amount=None)
+
+        notes = {note.pk: note for note in DeliveryNote.objects.with_line_amount()}
+        self.assertEqual(notes[before.pk].line_unit_price, Decimal("2.00"))
+        self.assertEqual(notes[before.pk].line_amount, Decimal("4.00"))
+        self.assertEqual(notes[after.pk].line_amount, Decimal("6.00"))
+
+    def test_line_amount_is_null_without_price(self):
+        self._create_note(self.ana, self.pan, 10)
+        note = DeliveryNote.objects.with_line_amount().get()
+        self.assertIsNone(note.line_unit_price)
+        self.assertIsNone(note.line_amount)
+
+    def test_summary_groups_by_customer_and_flags_missing_prices(self):
+        self._create_note(self.ana, self.manzana, 10, "2")
+        self._create_note(self.ana, self.manzana, 20, "1")
+        self._create_note(self.pedro, self.manzana, 10, "1")
+        self._create_note(self.pedro, self.pan, 10, "1")
+
+        self.client.login(username="manager", password="test1234")
+        response = self.client.get(reverse("lupanes:deliverynote-summary", args=(2026, 3)))
+
+        customers = {customer.username: customer for customer in response.context["object_list"]}
+        self.assertEqual(customers["ana"].total_export_format, "7.00")
+        self.assertIsNone(customers["pedro"].total)
+        self.assertEqual(len(response.context["messages"]), 1)
+
+
+class ProductSummaryQueriesTest(ProductSummaryTestMixin, TestCase):
+    def setUp(self):
+        self.client.login(username="manager", password="test1234")
+
+    def test_amounts_do_not_query_per_product(self):
+        DeliveryNote.objects.update(unit_price=None, amount=None)
+        params = {"date_from": "2026-03-31", "date_to": "2026-04-01"}
+
+        # summarizing three products costs the same queries than summarizing one
+        with self.assertNumQueries(self._count_queries({"products": [self.pan.pk], **params})):
+            response = self.client.get(self.url, params)
+
+        totals = response.context["totals"]
+        self.assertEqual(totals["total_amount"], "28.60")
+
+    def test_skips_notes_without_price(self):
+        for price in ProductPrice.objects.filter(product=self.pan):
+            price.delete()
+        response = self.client.get(self.url, {"date_from": "2026-03-31", "date_to": "2026-04-01"})
+        products = {p["product__name"]: p for p in response.context["product_summary"]}
+        self.assertEqual(products["Pan"]["total_amount"], "0.00")
+        self.assertEqual(products["Pan"]["total_qty"], Decimal("2"))
+        self.assertEqual(response.context["totals"]["total_amount"], "26.20")
+
+    def _count_queries(self, params):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(self.url, params)
+        return len(ctx.captured_queries)
+
+
+# --- Daily Deliveries Rollup Tests ---
+
+
+class DailyDeliveryTestCase(TestCase):
+    """Tests for the daily deliveries summary kept up to date with the notes"""
+
+    def setUp(self):
+        self.customer = User.objects.create_user(username="ana", password="test1234")
+        producer = Producer.objects.create(name="Frutas Garcia")
+        self.manzana = Product.objects.create(name="Manzana", producer=producer, unit="Kg")
+        self.price = ProductPrice.objects.create(
+            product=self.manzana, value=Decimal("2.00"), start_date=date(2026, 1, 1))
+        self.pan = Product.objects.create(name="Pan", producer=producer, unit="unidad")
+
+    def _create_note(self, product, day, quantity="1"):
+        return DeliveryNote.objects.create(
+            customer=self.customer, product=product, quantity=Decimal(quantity),
+            date=timezone.datetime(2026, 3, day, 10, 0, tzinfo=timezone.utc),
+        )
+
+    def _rollup(self, day, product=None):
+        return DailyDelivery.objects.get(day=date(2026, 3, day), customer=self.customer,
+                                         product=product or self.manzana)
+
+    def test_notes_are_added_to_their_day(self):
+        self._create_note(self.manzana, 10, "2")
+        self._create_note(self.manzana, 10, "1.5")
+
+        rollup = self._rollup(10)
+        self.assertEqual(rollup.quantity, Decimal("3.5"))
+        self.assertEqual(rollup.amount, Decimal("7.00"))
+        self.assertEqual(rollup.notes, 2)
+        self.assertEqual(rollup.missing_prices, 0)
+
+    def test_moving_a_note_updates_both_days(self):
+        note = self._create_note(self.manzana, 10, "2")
+        self._create_note(self.manzana, 10, "1")
+
+        note.date = timezone.datetime(2026, 3, 11, 10, 0, tzinfo=timezone.utc)
+        note.save()
+
+        self.assertEqual(self._rollup(10).quantity, Decimal("1"))
+        self.assertEqual(self._rollup(11).quantity, Decimal("2"))
+
+    def test_deleting_last_note_removes_the_row(self):
+        note = self._create_note(self.manzana, 10)
+        note.delete()
+        self.assertFalse(DailyDelivery.objects.exists())
+
+    def test_missing_prices_are_counted(self):
+        self._create_note(self.pan, 10)
+        rollup = self._rollup(10, self.pan)
+        self.assertEqual(rollup.amount, Decimal("0"))
+        self.assertEqual(rollup.missing_prices, 1)
+
+        ProductPrice.objects.create(product=self.pan, value=Decimal("1.20"), start_date=date(2026, 3, 1))
+        rollup = self._rollup(10, self.pan)
+        self.assertEqual(rollup.amount, Decimal("1.20"))
+        self.assertEqual(rollup.missing_prices, 0)
+
+    def test_price_change_updates_amount(self):
+        self._create_note(self.manzana, 10, "2")
+        self.price.value = Decimal("3.00")
+        self.price.save()
+        self.assertEqual(self._rollup(10).amount, Decimal("6.00"))
+
+    def test_rebuild_command(self):
+        self._create_note(self.manzana, 10, "2")
+        self._create_note(self.manzana, 11, "1")
+        DailyDelivery.objects.all().delete()
+
+        out = StringIO()
+        call_command("rebuilddailydeliveries", stdout=out)
+
+        self.assertIn("Rebuilt 2 daily deliveries.", out.getvalue())
+        self.assertEqual(self._rollup(10).amount, Decimal("4.00"))
+        self.assertEqual(self._rollup(11).amount, Decimal("2.00"))
+
+    def test_queryset_delete(self):
+        self._create_note(self.manzana, 10, "2")
+        self._create_note(self.manzana, 10, "1")
+        self._create_note(self.manzana, 11, "1")
+
+        DeliveryNote.objects.filter(quantity=Decimal("1")).delete()
+
+        self.assertEqual(self._rollup(10).quantity, Decimal("2"))
+        self.assertFalse(DailyDelivery.objects.filter(day=date(2026, 3, 11)).exists())
+
+    def test_queryset_update(self):
+        note = self._create_note(self.manzana, 10, "2")
+
+        DeliveryNote.objects.filter(pk=note.pk).update(product=self.pan)
+        self.assertFalse(DailyDelivery.objects.filter(product=self.manzana).exists())
+        self.assertEqual(self._rollup(10, self.pan).missing_prices, 1)
+
+        DeliveryNote.objects.filter(pk=note.pk).update(product=self.manzana, quantity=Decimal("3"))
+        note.refresh_from_db()
+        self.assertEqual(note.amount, Decimal("6.00"))
+        self.assertEqual(self._rollup(10).amount, Decimal("6.00"))
+        self.assertFalse(DailyDelivery.objects.filter(product=self.pan).exists())
+
+    def test_admin_delete_selected(self):
+        manager = User.objects.create_superuser(username="admin", password="test1234")
+        self.client.force_login(manager)
+        note = self._create_note(self.manzana, 10, "2")
+
+        self.client.post(reverse("admin:lupanes_deliverynote_changelist"), {
+            "action": "delete_selected", "_selected_action": [note.pk], "post": "yes",
+        })
+
+        self.assertFalse(DeliveryNote.objects.exists())
+        self.assertFalse(DailyDelivery.objects.exists())
+
+    def test_backfill_migration(self):
+        backfill = importlib.import_module("lupanes.migrations.0008_backfill_prices_and_daily_deliveries")
+        self._create_note(self.manzana, 10, "2")
+        self._create_note(self.pan, 10, "1")
+        # as the notes created before the price and the rollup were stored
+        DeliveryNote.objects.update(unit_price=None, amount=None)
+        DailyDelivery.objects.all().delete()
+
+        backfill.fill_prices(django_apps, None)
+        backfill.rebuild_daily_deliveries(django_apps, None)
+
+        self.assertEqual(DeliveryNote.objects.get(product=self.manzana).amount, Decimal("4.00"))
+        self.assertEqual(self._rollup(10).amount, Decimal("4.00"))
+        self.assertEqual(self._rollup(10, self.pan).missing_prices, 1)
+
+
+@skipUnless(connection.vendor == "postgresql", "row locks checked on PostgreSQL")
+class DailyDeliveryConcurrencyTestCase(TransactionTestCase):
+    """Concurrent refreshes of the same row (run the tests against PostgreSQL)"""
+
+    def test_concurrent_notes_of_the_same_day(self):
+        customer = User.objects.create_user(username="ana")
+        producer = Producer.objects.create(name="Frutas Garcia")
+        manzana = Product.objects.create(name="Manzana", producer=producer, unit="Kg")
+        ProductPrice.objects.create(product=manzana, value=Decimal("2.00"), start_date=date(2026, 1, 1))
+        first_saved = threading.Event()
+        second_started = threading.Event()
+
+        def create_note():
+            DeliveryNote.objects.create(
+                customer=customer, product=manzana, quantity=Decimal("1"),
+                date=timezone.datetime(2026, 3, 10, 10, 0, tzinfo=timezone.utc),
+            )
+
+        def first():
+            try:
+                with transaction.atomic():
+                    create_note()
+                    first_saved.set()
+                    second_started.wait(5)
+                    # the second refresh is waiting for this transaction
+                    time.sleep(0.5)
+            finally:
+                connection.close()
+
+        def second():
+            try:
+                first_saved.wait(5)
+                second_started.set()
+                create_note()
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=first), threading.Thread(target=second)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        rollup = DailyDelivery.objects.get(day=date(2026, 3, 10), customer=customer, product=manzana)
+        self.assertEqual(rollup.notes, 2)
+        self.assertEqual(rollup.amount, Decimal("4.00"))
+
+
+# --- Closed Month Tests ---
+
+
+class ClosedMonthTestCase(TestCase):
+    """Tests for closing months and serving them from their snapshot"""
+
+    def setUp(self):
+        self.managers_group = Group.objects.create(name="tienda")
+        self.customers_group = Group.objects.create(name=CUSTOMERS_GROUP)
+        self.manager = User.objects.create_user(username="manager", password="test1234")
+        self.manager.groups.add(self.managers_group)
+        self.customer = User.objects.create_user(username="ana", password="test1234")
+        self.customer.groups.add(self.customers_group)
+
+        producer = Producer.objects.create(name="Frutas Garcia")
+        self.manzana = Product.objects.create(name="Manzana", producer=producer, unit="Kg")
+        self.price = ProductPrice.objects.create(
+            product=self.manzana, value=Decimal("2.00"), start_date=date(2026, 1, 1))
+        self.note = DeliveryNote.objects.create(
+            customer=self.customer, product=self.manzana, quantity=Decimal("2"),
+            date=timezone.datetime(2026, 3, 10, 10, 0, tzinfo=timezone.utc),
+        )
+        self.client.login(username="manager", password="test1234")
+
+    def test_close_saves_customer_totals(self):
+        closed_month = ClosedMonth.objects.close(2026, 3)
+        total = closed_month.totals.get(customer=self.customer)
+        self.assertEqual(total.total, Decimal("4.00"))
+        self.assertEqual(total.missing_prices, 0)
+
+    def test_close_twice_fails(self):
+        ClosedMonth.objects.close(2026, 3)
+        with self.assertRaises(MonthAlreadyClosed):
+            ClosedMonth.objects.close(2026, 3)
+
+    def test_price_changes_do_not_reprice_closed_months(self):
+        ClosedMonth.objects.close(2026, 3)
+        self.price.value = Decimal("5.00")
+        self.price.save()
+
+        self.note.refresh_from_db()
+        self.assertEqual(self.note.amount, Decimal("4.00"))
+
+    def test_summary_is_served_from_snapshot(self):
+        ClosedMonth.objects.close(2026, 3)
+        DailyDelivery.objects.all().delete()
+
+        response = self.client.get(reverse("lupanes:deliverynote-summary", args=(2026, 3)))
+
+        customers = list(response.context["object_list"])
+        self.assertEqual([c.username for c in customers], ["ana"])
+        self.assertEqual(customers[0].total_export_format, "4.00")
+        self.assertIn("no-cache", response["Cache-Control"])
+        self.assertNotIn("max-age", response["Cache-Control"])
+        self.assertTrue(response.has_header("Last-Modified"))
+
+    def test_closed_month_data_is_cached(self):
+        ClosedMonth.objects.close(2026, 3)
+        response = self.client.get(reverse("lupanes:deliverynote-month-data", args=(2026, 3)), {"draw": "1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("max-age", response["Cache-Control"])
+
+    def test_page_with_messages_is_not_cached(self):
+        response = self.client.post(reverse("lupanes:deliverynote-month-close", args=(2026, 3)), follow=True)
+
+        self.assertContains(response, "Mes cerrado correctamente.")
+        self.assertFalse(response.has_header("Last-Modified"))
+        self.assertNotIn("max-age", response.get("Cache-Control", ""))
+
+    def test_closed_archive_supports_conditional_requests(self):
+        ClosedMonth.objects.close(2026, 3)
+        url = reverse("lupanes:deliverynote-month", args=(2026, 3))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_notes_of_closed_months_cannot_be_changed(self):
+        ClosedMonth.objects.close(2026, 3)
+
+        self.note.quantity = Decimal("3")
+        with self.assertRaises(MonthClosed):
+            self.note.save()
+        with self.assertRaises(MonthClosed):
+            self.note.delete()
+        with self.assertRaises(MonthClosed):
+            DeliveryNote.objects.filter(pk=self.note.pk).update(quantity=Decimal("3"))
+        with self.assertRaises(MonthClosed):
+            DeliveryNote.objects.filter(pk=self.note.pk).delete()
+        with self.assertRaises(MonthClosed):
+            DeliveryNote.objects.create(
+                customer=self.customer, product=self.manzana, quantity=Decimal("1"),
+                date=timezone.datetime(2026, 3, 20, 10, 0, tzinfo=timezone.utc),
+            )
+
+        self.note.refresh_from_db()
+        self.assertEqual(self.note.quantity, Decimal("2"))
+
+    def test_notes_cannot_be_moved_into_a_closed_month(self):
+        ClosedMonth.objects.close(2026, 3)
+        april_note = DeliveryNote.objects.create(
+            customer=self.customer, product=self.manzana, quantity=Decimal("1"),
+            date=timezone.datetime(2026, 4, 10, 10, 0, tzinfo=timezone.utc),
+        )
+
+        with self.assertRaises(MonthClosed):
+            DeliveryNote.objects.filter(pk=april_note.pk).update(
+                date=timezone.datetime(2026, 3, 20, 10, 0, tzinfo=timezone.utc))
+        april_note.date = timezone.datetime(2026, 3, 20, 10, 0, tzinfo=timezone.utc)
+        with self.assertRaises(MonthClosed):
+            april_note.save()
+
+    def test_admin_does_not_change_notes_of_closed_months(self):
+        ClosedMonth.objects.close(2026, 3)
+        User.objects.create_superuser(username="admin", password="test1234")
+        self.client.login(username="admin", password="test1234")
+
+        response = self.client.post(
+            reverse("admin:lupanes_deliverynote_delete", args=(self.note.pk,)), {"post": "yes"})
+        self.assertEqual(response.status_code, 403)
+        response = self.client.post(reverse("admin:lupanes_deliverynote_changelist"), {
+            "action": "delete_selected", "_selected_action": [self.note.pk], "post": "yes",
+        })
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(DeliveryNote.objects.filter(pk=self.note.pk).exists())
+
+    def test_open_month_is_not_cached(self):
+        response = self.client.get(reverse("lupanes:deliverynote-month", args=(2026, 3)))
+        self.assertFalse(response.has_header("Last-Modified"))
+        self.assertTrue(response.context["can_be_closed"])
+
+    def test_notes_of_closed_months_are_read_only(self):
+        ClosedMonth.objects.close(2026, 3)
+        response = self.client.get(reverse("lupanes:deliverynote-edit-bulk", args=(self.note.pk,)))
+        self.assertEqual(response.status_code, 403)
+        response = self.client.post(reverse("lupanes:deliverynote-delete-bulk", args=(self.note.pk,)))
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(DeliveryNote.objects.filter(pk=self.note.pk).exists())
+
+    def test_close_view(self):
+        response = self.client.post(reverse("lupanes:deliverynote-month-close", args=(2026, 3)))
+        self.assertRedirects(response, reverse("lupanes:deliverynote-month", args=(2026, 3)),
+                             fetch_redirect_response=False)
+        self.assertTrue(ClosedMonth.objects.is_closed(date(2026, 3, 1)))
+
+    def test_close_view_rejects_current_month(self):
+        today = timezone.localdate()
+        self.client.post(reverse("lupanes:deliverynote-month-close", args=(today.year, today.month)))
+        self.assertFalse(ClosedMonth.objects.exists())
+
+    def test_close_command(self):
+        out = StringIO()
+        call_command("closemonth", "2026", "3", stdout=out)
+        self.assertIn("Closed 03/2026", out.getvalue())
+
+    def test_current_month_cannot_be_closed(self):
+        today = timezone.localdate()
+        with self.assertRaises(MonthNotFinished):
+            ClosedMonth.objects.close(today.year, today.month)
+        with self.assertRaisesMessage(CommandError, "has not finished yet"):
+            call_command("closemonth", str(today.year), str(today.month), stdout=StringIO())
+        self.assertFalse(ClosedMonth.objects.exists())
+
+    def test_customer_gets_a_form_error_on_a_closed_month(self):
+        today_note = DeliveryNote.objects.create(customer=self.customer, product=self.manzana, quantity=Decimal("1"))
+        # e.g. closed before the month ended by an older version
+        today = timezone.localdate()
+        ClosedMonth.objects.create(year=today.year, month=today.month)
+        self.client.login(username="ana", password="test1234")
+
+        response = self.client.post(reverse("lupanes:deliverynote-new"), {
+            "product": self.manzana.pk, "quantity": "1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("El mes de esa fecha está cerrado", response.context["form"].non_field_errors())
+
+        response = self.client.post(reverse("lupanes:deliverynote-edit", args=(today_note.pk,)), {
+            "product": self.manzana.pk, "quantity": "3"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("El mes de esa fecha está cerrado", response.context["form"].non_field_errors())
+
+        response = self.client.post(reverse("lupanes:deliverynote-delete", args=(today_note.pk,)))
+        self.assertRedirects(response, reverse("lupanes:deliverynote-new"), fetch_redirect_response=False)
+        self.assertEqual(DeliveryNote.objects.filter(customer=self.customer).count(), 2)
+
+
+# --- Month Archive Data (DataTables) Tests ---
+
+
+class DeliveryNoteMonthArchiveDataTestCase(TestCase):
+    """Tests for the server-side processing of the month archive table"""
+
+    @classmethod
+    def setUpTestData(cls):
+        managers_group = Group.objects.create(name="tienda")
+        cls.manager = User.objects.create_user(username="manager", password="test1234")
+        cls.manager.groups.add(managers_group)
+        cls.ana = User.objects.create_user(username="ana", password="test1234")
+        cls.pedro = User.objects.create_user(username="pedro", password="test1234")
+
+        producer = Producer.objects.create(name="Frutas Garcia")
+        cls.manzana = Product.objects.create(name="Manzana", producer=producer, unit="Kg")
+        ProductPrice.objects.create(product=cls.manzana, value=Decimal("2.00"), start_date=date(2026, 1, 1))
+        cls.pan = Product.objects.create(name="Pan", producer=producer, unit="unidad")
+
+        for day in range(1, 13):
+            DeliveryNote.objects.create(
+                customer=cls.ana if day % 2 else cls.pedro,
+                product=cls.pan if day % 4 == 0 else cls.manzana,
+                quantity=Decimal(day % 3 + 1),
+                date=timezone.datetime(2026, 3, day, 10, 0, tzinfo=timezone.utc),
+            )
+        cls.url = reverse("lupanes:deliverynote-month-data", args=(2026, 3))
+
+    def setUp(self):
+        self.client.login(username="manager", password="test1234")
+
+    def _params(self, column=2, direction="asc", **extra):
+        params = {
+            "draw": "1", "start": "0", "length": "5",
+            "order[0][column]": str(column), "order[0][dir]": direction,
+            "search[value]": "",
+        }
+        for index, name in enumerate(["index", "sheet_number", "date", "customer", "product",
+                                      "quantity", "amount", ""]):
+            params[f"columns[{index}][data]"] = name
+        params.update(extra)
+        return params
+
+    def _all_pages(self, **params):
+        rows = []
+        response = self.client.get(self.url, self._params(**params)).json()
+        rows.extend(response["data"])
+        while response["next"]:
+            response = self.client.get(self.url, self._params(
+                start=str(response["next"]["start"]), cursor=response["next"]["cursor"], **params)).json()
+            rows.extend(response["data"])
+        return rows
+
+    def test_first_page(self):
+        response = self.client.get(self.url, self._params())
+        data = response.json()
+        self.assertEqual(data["draw"], 1)
+        self.assertEqual(data["recordsTotal"], 12)
+        self.assertEqual(data["recordsFiltered"], 12)
+        self.assertEqual(len(data["data"]), 5)
+        self.assertEqual(data["data"][0]["date"], "01/03/2026")
+
+    def test_keyset_pages_match_offset_pages(self):
+        for column, direction in [(2, "asc"), (3, "desc"), (6, "asc"), (6, "desc")]:
+            with self.subTest(column=column, direction=direction):
+                rows = self._all_pages(column=column, direction=direction)
+                offset_rows = []
+                for start in range(0, 12, 5):
+                    response = self.client.get(self.url, self._params(column, direction, start=str(start)))
+                    offset_rows.extend(response.json()["data"])
+                self.assertEqual(len(rows), 12)
+                self.assertEqual(rows, offset_rows)
+
+    def test_sort_by_amount_puts_missing_prices_first(self):
+        rows = self._all_pages(column=6, direction="asc")
+        self.assertEqual([row["amount"] for row in rows[:3]], ["", "", ""])
+        self.assertEqual(rows[-1]["amount"], "6.00")
+
+    def test_search(self):
+        response = self.client.get(self.url, self._params(**{"search[value]": "pan"}))
+        data = response.json()
+        self.assertEqual(data["recordsFiltered"], 3)
+        self.assertEqual({row["product"] for row in data["data"]}, {"Pan"})
+
+    def test_invalid_cursor_falls_back_to_offset(self):
+        response = self.client.get(self.url, self._params(start="5", cursor="not-a-cursor"))
+        self.assertEqual(response.json()["data"][0]["index"], 6)
+
+
+# --- Export Tests ---
+
+
+class DeliveryNoteExportTestCase(TestCase):
+    """Tests for the streaming export of delivery notes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        managers_group = Group.objects.create(name="tienda")
+        cls.manager = User.objects.create_user(username="manager", password="test1234")
+        cls.manager.groups.add(managers_group)
+        cls.ana = User.objects.create_user(username="ana", password="test1234")
+        cls.pedro = User.objects.create_user(username="pedro", password="test1234")
+
+        producer = Producer.objects.create(name="Frutas <Garcia>")
+        cls.manzana = Product.objects.create(name="Manzana", producer=producer, unit="Kg")
+        ProductPrice.objects.create(product=cls.manzana, value=Decimal("2.50"), start_date=date(2026, 1, 1))
+        cls.pan = Product.objects.create(name="Pan", producer=producer, unit="unidad")
+
+        DeliveryNote.objects.create(
+            customer=cls.ana, product=cls.manzana, quantity=Decimal("1.5"), sheet_number="12",
+            date=timezone.datetime(2026, 3, 10, 10, 0, tzinfo=timezone.utc))
+        DeliveryNote.objects.create(
+            customer=cls.pedro, product=cls.pan, quantity=Decimal("2"),
+            date=timezone.datetime(2026, 3, 11, 10, 0, tzinfo=timezone.utc))
+        DeliveryNote.objects.create(
+            customer=cls.ana, product=cls.manzana, quantity=Decimal("1"),
+            date=timezone.datetime(2026, 4, 1, 10, 0, tzinfo=timezone.utc))
+        cls.url = reverse("lupanes:deliverynote-export")
+
+    def setUp(self):
+        self.client.login(username="manager", password="test1234")
+
+    def _content(self, response):
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content)
+
+    def test_csv_export(self):
+        response = self.client.get(self.url, {"date_from": "2026-03-01", "date_to": "2026-03-31"})
+        lines = self._content(response).decode().splitlines()
+
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[1], "12,2026-03-10 11:00,ana,Manzana,Frutas <Garcia>,1.500,Kg,2.50,3.75")
+        self.assertTrue(lines[2].endswith("Pan,Frutas <Garcia>,2.000,unidad,,"))
+
+    def test_filter_by_customer_and_product(self):
+        response = self.client.get(self.url, {"customers": [self.ana.pk], "products": [self.manzana.pk]})
+        lines = self._content(response).decode().splitlines()
+        self.assertEqual(len(lines), 3)
+
+    def test_xlsx_export(self):
+        import zipfile
+
+        response = self.client.get(self.url, {"format": "xlsx", "date_from": "2026-03-01"})
+        archive = zipfile.ZipFile(BytesIO(self._content(response)))
+
+        self.assertIsNone(archive.testzip())
+        sheet = archive.read("xl/worksheets/sheet1.xml").decode()
+        self.assertEqual(sheet.count("<row>"), 4)
+        self.assertIn("Frutas &lt;Garcia&gt;", sheet)
+        self.assertIn("<c><v>3.75</v></c>", sheet)
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get(self.url, {"format": "pdf"}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"date_from": "2026-13-01"}).status_code, 400)
+
+    def test_customer_cannot_export(self):
+        self.client.login(username="ana", password="test1234")
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+# --- Role Cache Tests ---
+
+
+class UserRoleCacheTestCase(TestCase):
+    """Tests for the role checks cached per user instance"""
+
+    def setUp(self):
+        self.customers_group = Group.objects.create(name=CUSTOMERS_GROUP)
+        self.managers_group = Group.objects.create(name="tienda")
+        self.user = User.objects.create_user(username="ana", password="test1234")
+
+    def test_roles_are_loaded_once(self):
+        self.user.groups.add(self.customers_group)
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(1):
+            for _ in range(3):
+                self.assertTrue(user.is_customer)
+                self.assertFalse(user.is_manager)
+
+    def test_cache_is_cleared_when_groups_change(self):
+        self.assertFalse(self.user.is_manager)
+        self.user.groups.add(self.managers_group)
+        self.assertTrue(self.user.is_manager)
+        self.user.groups.remove(self.managers_group)
+        self.assertFalse(self.user.is_manager)
+        self.user.groups.add(self.customers_group)
+        self.user.groups.clear()
+        self.assertFalse(self.user.is_customer)
+
+    def test_dashboard_checks_roles_once(self):
+        self.user.groups.add(self.customers_group)
+        self.client.login(username="ana", password="test1234")
+        with patch("lupanes.users.models.utils.search_nevera_balance", return_value="10,00"):
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get(reverse("lupanes:dashboard"))
+        group_queries = [q for q in ctx.captured_queries if "auth_group" in q["sql"]]
+        self.assertEqual(len(group_queries), 1)
+
+
+# --- Balance Sync Tests ---
+
+
+class FakeWorksheet:
+    """Local stand-in for a gspread worksheet"""
+
+    def __init__(self, values):
+        self.values = values
+
+    def get(self, range_name=None):
+        return self.values
+
+
+class BalanceSyncTestCase(TestCase):
+    """Tests for the background sync of neveras balances"""
+
+    def setUp(self):
+        self.customer = User.objects.create_user(username="Nevera1", password="test1234")
+        self.customer.groups.add(Group.objects.create(name=CUSTOMERS_GROUP))
+
+    def sync(self, values):
+        with patch("lupanes.utils.load_spreadsheet", return_value=FakeWorksheet(values)):
+            call_command("syncbalances", stdout=StringIO(), stderr=StringIO())
+
+    def test_sync_stores_all_balances(self):
+        self.sync([["Nevera1 ", "10,50"], ["nevera2", "-3,00"], ["incomplete"]])
+
+        self.assertEqual(NeveraBalance.objects.get_balance("nevera1"), "10,50")
+        self.assertEqual(NeveraBalance.objects.get_balance("NEVERA2"), "-3,00")
+        self.assertEqual(NeveraBalance.objects.count(), 2)
+
+    def test_sync_updates_and_removes_balances(self):
+        self.sync([["nevera1", "10,50"], ["nevera2", "-3,00"]])
+        self.sync([["nevera1", "7,25"]])
+
+        self.assertEqual(NeveraBalance.objects.get_balance("nevera1"), "7,25")
+        self.assertEqual(NeveraBalance.objects.get_balance("nevera2"), "N/A")
+
+    def test_empty_sync_keeps_previous_balances(self):
+        self.sync([["nevera1", "10,50"]])
+        self.sync([["incomplete"]])
+
+        self.assertEqual(NeveraBalance.objects.get_balance("nevera1"), "10,50")
+        self.assertFalse(NeveraBalance.objects.sync({}))
+
+    def test_sync_error_keeps_previous_balances(self):
+        self.sync([["nevera1", "10,50"]])
+        with patch("lupanes.utils.load_spreadsheet", side_effect=RetryExhausted("boom")):
+            with self.assertRaises(CommandError):
+                call_command("syncbalances", stdout=StringIO())
+
+        self.assertEqual(NeveraBalance.objects.get_balance("nevera1"), "10,50")
+
+    @patch("lupanes.management.commands.syncbalances.time.sleep", side_effect=[None, KeyboardInterrupt])
+    @patch("lupanes.utils.fetch_nevera_balances",
+           side_effect=[requests.exceptions.ConnectionError("reset"), {"nevera1": "1,00"}])
+    def test_loop_survives_network_errors(self, mock_fetch, mock_sleep):
+        err = StringIO()
+        with self.assertRaises(KeyboardInterrupt):
+            call_command("syncbalances", "--loop", stdout=StringIO(), stderr=err)
+
+        self.assertIn("Cannot fetch neveras balances: reset", err.getvalue())
+        self.assertEqual(NeveraBalance.objects.get_balance("nevera1"), "1,00")
+
+    @patch("lupanes.utils.load_spreadsheet", side_effect=AssertionError("Google Sheets called"))
+    def test_current_balance_reads_local_copy(self, mock_load):
+        self.assertEqual(self.customer.current_balance, "N/A")
+        NeveraBalance.objects.sync({"nevera1": "10,50"})
+
+        self.assertEqual(self.customer.current_balance, Decimal("10.50"))
+        mock_load.assert_not_called()
+
+    @override_settings(LUPIERRA_BALANCE_BACKGROUND_SYNC=False)
+    @patch("lupanes.users.models.utils.search_nevera_balance", return_value="4,00")
+    def test_current_balance_on_demand(self, mock_search):
+        self.assertEqual(self.customer.current_balance, Decimal("4.00"))
+        mock_search.assert_called_once_with("Nevera1")
+
+
+# --- Stale Balance Cache Tests ---
+
+
+class StaleBalanceCacheTestCase(TestCase):
+    """Tests for the single-flight refresh of expired balances"""
+
+    def setUp(self):
+        cache.clear()
+        self.worksheet = FakeWorksheet([["nevera1", "100,50"], ["nevera2", "20,00"]])
+
+    def tearDown(self):
+        cache.clear()
+
+    def expire(self, nevera, balance, age):
+        expired = lupanes.utils.CachedBalance(balance, time.time() - age)
+        cache.set(_get_nevera_cache_key(nevera), expired)
+
+    @patch("lupanes.utils.load_spreadsheet")
+    def test_fresh_value_is_not_refreshed(self, mock_load):
+        self.expire("nevera1", "90,00", age=10)
+
+        result = search_nevera_balance("nevera1")
+
+        self.assertEqual(result, "90,00")
+        self.assertLess(result.age, 60)
+        mock_load.assert_not_called()
+
+    @override_settings(LUPIERRA_BALANCE_CACHE_TTL=600)
+    @patch("lupanes.utils.load_spreadsheet")
+    def test_stale_value_is_refreshed_once(self, mock_load):
+        mock_load.return_value = self.worksheet
+        self.expire("nevera1", "90,00", age=700)
+        self.expire("nevera2", "10,00", age=700)
+
+        self.assertEqual(search_nevera_balance("nevera1"), "100,50")
+        self.assertEqual(search_nevera_balance("nevera2"), "20,00")
+        mock_load.assert_called_once()
+        self.assertIsNone(caches["durable"].get(lupanes.utils.BALANCE_REFRESH_LOCK_KEY))
+
+    @override_settings(LUPIERRA_BALANCE_CACHE_TTL=600)
+    @patch("lupanes.utils.load_spreadsheet")
+    def test_stale_value_is_served_while_other_refreshes(self, mock_load):
+        self.expire("nevera1", "90,00", age=700)
+        caches["durable"].add(lupanes.utils.BALANCE_REFRESH_LOCK_KEY, True)
+
+        result = search_nevera_balance("nevera1")
+
+        self.assertEqual(result, "90,00")
+        self.assertTrue(result.is_stale)
+        self.assertGreaterEqual(result.age, 700)
+        mock_load.assert_not_called()
+
+    @patch("lupanes.utils.BALANCE_REFRESH_LOCK_TIMEOUT", 0.5)
+    @patch("lupanes.utils.time.sleep", wraps=time.sleep)
+    @patch("lupanes.utils.load_spreadsheet")
+    def test_lock_wait_timeout_keeps_the_other_lock(self, mock_load, mock_sleep):
+        mock_load.return_value = self.worksheet
+        caches["durable"].add(lupanes.utils.BALANCE_REFRESH_LOCK_KEY, "other-token")
+
+        self.assertEqual(search_nevera_balance("nevera1"), "100,50")
+
+        self.assertEqual(caches["durable"].get(lupanes.utils.BALANCE_REFRESH_LOCK_KEY), "other-token")
+        # exponential backoff (0.2s, 0.4s...) cut to the time left
+        delays = [call.args[0] for call in mock_sleep.call_args_list]
+        self.assertEqual(delays[0], 0.2)
+        self.assertLessEqual(sum(delays), 0.5)
+
+    @override_settings(LUPIERRA_BALANCE_CACHE_TTL=600)
+    @patch("lupanes.utils.load_spreadsheet", side_effect=RetryExhausted("boom"))
+    def test_stale_value_is_served_on_error(self, mock_load):
+        self.expire("nevera1", "90,00", age=700)
+
+        self.assertEqual(search_nevera_balance("nevera1"), "90,00")
+        self.assertIsNone(caches["durable"].get(lupanes.utils.BALANCE_REFRESH_LOCK_KEY))
+
+    @patch("lupanes.utils.load_spreadsheet", side_effect=RetryExhausted("boom"))
+    def test_error_without_stale_value_is_raised(self, mock_load):
+        with self.assertRaises(RetryExhausted):
+            search_nevera_balance("nevera1")
+
+    # the threads cannot see the cache table rows written in the test transaction
+    @override_settings(CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "durable": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "durable"},
+    })
+    @patch("lupanes.utils.load_spreadsheet")
+    def test_concurrent_misses_fetch_once(self, mock_load):
+        def slow_load():
+            time.sleep(0.3)
+            return self.worksheet
+        mock_load.side_effect = slow_load
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(search_nevera_balance("nevera1")))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ["100,50"] * 5)
+        mock_load.assert_called_once()
+
+    @patch("lupanes.utils.load_spreadsheet")
+    def test_refresh_writes_all_balances_at_once(self, mock_load):
+        mock_load.return_value = self.worksheet
+
+        with patch.object(lupanes.utils, "cache", wraps=cache) as mock_cache:
+            self.assertEqual(search_nevera_balance("unknown"), "N/A")
+
+        mock_cache.set_many.assert_called_once()
+        mock_cache.set.assert_not_called()
+        self.assertEqual(len(mock_cache.set_many.call_args.args[0]), 3)
+        self.assertEqual(cache.get(_get_nevera_cache_key("nevera2")), "20,00")
+
+
+# --- Spreadsheet Client Tests ---
+
+
+class SpreadsheetClientTestCase(TestCase):
+    """Tests for the reuse of the gspread client and worksheet handle"""
+
+    def setUp(self):
+        lupanes.utils.reset_spreadsheet()
+        self.worksheet = MagicMock()
+        self.worksheet.get.return_value = [["Nevera1", "10,00"], ["nevera2"], []]
+        self.gc = MagicMock()
+        self.gc.open_by_url.return_value.get_worksheet.return_value = self.worksheet
+
+    def tearDown(self):
+        lupanes.utils.reset_spreadsheet()
+
+    @patch("lupanes.utils.gspread.service_account")
+    def test_client_and_worksheet_are_reused(self, mock_service_account):
+        mock_service_account.return_value = self.gc
+
+        lupanes.utils.fetch_nevera_balances()
+        balances = lupanes.utils.fetch_nevera_balances()
+
+        self.assertEqual(balances, {"nevera1": "10,00"})
+        mock_service_account.assert_called_once()
+        self.gc.open_by_url.assert_called_once()
+        self.assertEqual(self.worksheet.get.call_count, 2)
+
+    @override_settings(LUPIERRA_CUSTOMERS_BALANCE_RANGE="A2:B")
+    @patch("lupanes.utils.gspread.service_account")
+    def test_only_balance_range_is_read(self, mock_service_account):
+        mock_service_account.return_value = self.gc
+
+        lupanes.utils.fetch_nevera_balances()
+
+        self.worksheet.get.assert_called_once_with("A2:B")
+        self.worksheet.get_all_values.assert_not_called()
+
+    @patch("lupanes.utils.time.sleep")
+    @patch("lupanes.utils.gspread.service_account")
+    def test_read_is_retried_with_worksheet_opened_again(self, mock_service_account, mock_sleep):
+        mock_service_account.return_value = self.gc
+        self.worksheet.get.side_effect = [requests.exceptions.RequestException("Network error"), [["a", "1"]]]
+
+        self.assertEqual(lupanes.utils.fetch_nevera_balances(), {"a": "1"})
+
+        self.assertEqual(self.gc.open_by_url.call_count, 2)
+        mock_service_account.assert_called_once()
+        mock_sleep.assert_called_once()
+
+    @patch("lupanes.utils.time.sleep")
+    @patch("lupanes.utils.gspread.service_account")
+    def test_read_retries_exhausted(self, mock_service_account, mock_sleep):
+        mock_service_account.return_value = self.gc
+        self.worksheet.get.side_effect = requests.exceptions.RequestException("Network error")
+
+        with self.assertRaises(RetryExhausted):
+            lupanes.utils.fetch_nevera_balances()
+        self.assertEqual(self.worksheet.get.call_count, settings.LUPIERRA_GSPREAD_MAX_RETRIES)
+
+
+# --- Circuit Breaker Tests ---
+
+
+class CircuitBreakerTestCase(TestCase):
+    """Tests for the circuit breaker around Google Sheets"""
+
+    def setUp(self):
+        self.breaker = lupanes.utils.CircuitBreaker("test", failure_threshold=2, cooldown=60)
+
+    def call_failing(self):
+        with self.assertRaises(RetryExhausted):
+            with self.breaker:
+                raise RetryExhausted("boom")
+
+    def test_opens_after_threshold(self):
+        self.call_failing()
+        self.assertEqual(self.breaker.state, "closed")
+        self.call_failing()
+        self.assertEqual(self.breaker.state, "open")
+
+        with self.assertRaises(CircuitOpen):
+            with self.breaker:
+                raise AssertionError("must not be called")
+
+    def test_success_resets_failures(self):
+        self.call_failing()
+        with self.breaker:
+            pass
+        self.call_failing()
+        self.assertEqual(self.breaker.state, "closed")
+
+    # the threads cannot see the cache table rows written in the test transaction
+    @override_settings(CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "durable": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "durable"},
+    })
+    def test_concurrent_failures_are_all_counted(self):
+        breaker = lupanes.utils.CircuitBreaker("test", failure_threshold=5, cooldown=60)
+        barrier = threading.Barrier(5)
+
+        def fail():
+            barrier.wait()
+            with contextlib.suppress(RetryExhausted), breaker:
+                raise RetryExhausted("boom")
+
+        threads = [threading.Thread(target=fail) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(breaker.state, "open")
+
+    def test_other_errors_are_not_counted(self):
+        for _ in range(3):
+            with self.assertRaises(ValueError):
+                with self.breaker:
+                    raise ValueError()
+        self.assertEqual(self.breaker.state, "closed")
+
+    def test_single_probe_after_cooldown(self):
+        self.call_failing()
+        self.call_failing()
+        caches["durable"].set(self.breaker.opened_at_key, time.time() - 61, timeout=None)
+        self.assertEqual(self.breaker.state, "half-open")
+
+        with self.breaker:
+            # other callers fail fast while probing
+            with self.assertRaises(CircuitOpen):
+                with self.breaker:
+                    pass
+
+        self.assertEqual(self.breaker.state, "closed")
+
+    def test_failed_probe_opens_again(self):
+        self.call_failing()
+        self.call_failing()
+        caches["durable"].set(self.breaker.opened_at_key, time.time() - 61, timeout=None)
+
+        self.call_failing()
+
+        self.assertEqual(self.breaker.state, "open")
+
+    @override_settings(LUPIERRA_BALANCE_BACKGROUND_SYNC=False)
+    @patch("lupanes.utils.load_spreadsheet", side_effect=RetryExhausted("boom"))
+    def test_dashboard_fails_fast_while_open(self, mock_load):
+        customer = User.objects.create_user(username="nevera1", password="test1234")
+        customer.groups.add(Group.objects.create(name=CUSTOMERS_GROUP))
+        self.client.login(username="nevera1", password="test1234")
+        breaker = lupanes.utils.sheets_circuit_breaker
+        for _ in range(breaker.failure_threshold):
+            self.client.get(reverse("lupanes:dashboard"))
+        mock_load.reset_mock()
+
+        response = self.client.get(reverse("lupanes:dashboard"))
+
+        self.assertEqual(breaker.state, "open")
+        self.assertEqual(response.context["balance"], "N/A")
+        mock_load.assert_not_called()
+
+
+# --- Month Consumption Tests ---
+
+
+class MonthConsumptionTestCase(TestCase):
+    """Tests for the consumption of the current month, read from the daily deliveries"""
+
+    def setUp(self):
+        self.customer = User.objects.create_user(username="nevera1", password="test1234")
+        self.customer.groups.add(Group.objects.create(name=CUSTOMERS_GROUP))
+        self.product = Product.objects.create(
+            name="Tomate", producer=Producer.objects.create(name="Huerta"), unit=Product.Unit.KG,
+        )
+        self.price = ProductPrice.objects.create(
+            product=self.product, value=Decimal("2.00"), start_date=timezone.localdate().replace(day=1),
+        )
+
+    def add_note(self, quantity):
+        return DeliveryNote.objects.create(product=self.product, customer=self.customer, quantity=quantity)
+
+    def consumption(self):
+        # a new instance, as `request.user` on each request
+        return User.objects.get(pk=self.customer.pk).current_month_consumption()
+
+    def test_consumption_is_loaded_once_per_instance(self):
+        NeveraBalance.objects.sync({"nevera1": "50,00"})
+        self.add_note(Decimal("1.500"))
+        customer = User.objects.get(pk=self.customer.pk)
+        self.assertEqual(customer.current_month_consumption(), Decimal("3.00"))
+
+        # only the balance is read
+        with self.assertNumQueries(1):
+            self.assertEqual(customer.projected_balance(), Decimal("47.00"))
+
+    def test_new_and_deleted_notes_change_it(self):
+        note = self.add_note(Decimal("1"))
+        self.assertEqual(self.consumption(), Decimal("2.00"))
+
+        self.add_note(Decimal("2"))
+        self.assertEqual(self.consumption(), Decimal("6.00"))
+
+        note.delete()
+        self.assertEqual(self.consumption(), Decimal("4.00"))
+
+    def test_price_change_changes_it(self):
+        self.add_note(Decimal("1"))
+        self.assertEqual(self.consumption(), Decimal("2.00"))
+
+        self.price.value = Decimal("3.00")
+        self.price.save()
+
+        self.assertEqual(self.consumption(), Decimal("3.00"))
+
+    def test_rebuild_changes_it(self):
+        self.add_note(Decimal("1"))
+        self.assertEqual(self.consumption(), Decimal("2.00"))
+        DeliveryNote.objects.update(amount=Decimal("5.00"))
+
+        DailyDelivery.objects.rebuild()
+
+        self.assertEqual(self.consumption(), Decimal("5.00"))
+
+    def count_dashboard_queries(self):
+        self.client.login(username="nevera1", password="test1234")
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("lupanes:dashboard"))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_dashboard_queries_do_not_grow_with_notes(self):
+        NeveraBalance.objects.sync({"nevera1": "50,00"})
+        self.add_note(Decimal("1"))
+        cache.clear()
+        queries = self.count_dashboard_queries()
+
+        for _ in range(10):
+            self.add_note(Decimal("1"))
+        cache.clear()
+
+        self.assertEqual(self.count_dashboard_queries(), queries)
+
+
+# --- Product Catalog Tests ---
+
+
+class ProductCatalogViewTestCase(TestCase):
+    """Tests for the products catalog used by the delivery note forms"""
+
+    def setUp(self):
+        user = User.objects.create_user(username="nevera1", password="test1234")
+        user.groups.add(Group.objects.create(name=CUSTOMERS_GROUP))
+        self.client.login(username="nevera1", password="test1234")
+
+        producer = Producer.objects.create(name="Huerta")
+        self.tomato = Product.objects.create(name="Tomate", producer=producer, unit=Product.Unit.KG)
+        self.eggs = Product.objects.create(name="Huevos", producer=producer, unit=Product.Unit.DOCENA)
+        today = timezone.localdate()
+        ProductPrice.objects.create(product=self.tomato, value=Decimal("2.00"), start_date=today)
+        ProductPrice.objects.create(product=self.tomato, value=Decimal("9.00"),
+                                    start_date=today + timezone.timedelta(days=1))
+        self.url = reverse("lupanes:product-catalog")
+
+    def test_catalog_content(self):
+        # session, user, catalog version, products and prices
+        with self.assertNumQueries(5):
+            response = self.client.get(self.url)
+        products = response.json()["products"]
+
+        self.assertEqual(products[str(self.tomato.pk)], {
+            "name": "Tomate", "unit": "Kg", "accept_decimals": True, "is_active": True, "price": "2.00",
+        })
+        self.assertEqual(products[str(self.eggs.pk)]["price"], None)
+        self.assertFalse(products[str(self.eggs.pk)]["accept_decimals"])
+
+    def test_not_modified_with_same_etag(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertIn("no-cache", response["Cache-Control"])
+
+    def test_etag_changes_with_products_and_prices(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        ProductPrice.objects.create(product=self.eggs, value=Decimal("3.50"), start_date=timezone.localdate())
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["products"][str(self.eggs.pk)]["price"], "3.50")
+
+        etag = response["ETag"]
+        self.eggs.is_active = False
+        self.eggs.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()["products"][str(self.eggs.pk)]["is_active"])
+
+    def test_etag_changes_with_the_day(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        tomorrow = timezone.localdate() + timezone.timedelta(days=1)
+        with patch("lupanes.views.product.timezone.localdate", return_value=tomorrow):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["products"][str(self.tomato.pk)]["price"], "9.00")
+
+    def test_login_required(self):
+        self.client.logout()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+
+
+# --- Cached Form Choices Tests ---
+
+
+class CachedFormChoicesTestCase(TestCase):
+    """Tests for the cached choices of the delivery note forms"""
+
+    def setUp(self):
+        caches["local"].clear()
+        self.customers_group = Group.objects.create(name=CUSTOMERS_GROUP)
+        self.manager = User.objects.create_user(username="tienda1")
+        self.customer = User.objects.create_user(username="nevera1")
+        self.customer.groups.add(self.customers_group)
+        self.producer = Producer.objects.create(name="Huerta")
+        for name in ["Tomate", "Pimiento", "Cebolla"]:
+            Product.objects.create(name=name, producer=self.producer, unit=Product.Unit.KG)
+        Product.objects.create(name="Viejo", producer=self.producer, unit=Product.Unit.KG, is_active=False)
+
+    def render(self, form_class, **kwargs):
+        return str(form_class(**kwargs))
+
+    def test_choices_are_built_once(self):
+        self.render(DeliveryNoteForm, user=self.manager)
+
+        # only the data versions of customers and products are read
+        with self.assertNumQueries(2):
+            html = self.render(DeliveryNoteForm, user=self.manager)
+        self.assertIn("Tomate (Huerta)", html)
+        self.assertIn("Viejo (Huerta)", html)
+        self.assertIn("nevera1", html)
+        self.assertNotIn("tienda1", html)
+
+    def test_customer_form_lists_active_products(self):
+        self.render(DeliveryNoteCreateForm, customer=self.customer)
+        with self.assertNumQueries(1):
+            html = self.render(DeliveryNoteCreateForm, customer=self.customer)
+        self.assertIn("Tomate (Huerta)", html)
+        self.assertNotIn("Viejo", html)
+
+    def test_choices_are_built_with_a_single_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.render(DeliveryNoteForm, user=self.manager)
+        queries = [
+            q["sql"] for q in ctx.captured_queries
+            if "lupanes_cache" not in q["sql"] and "lupanes_durable_cache" not in q["sql"]
+        ]
+        self.assertEqual(len(queries), 2)  # customers and products (with their producer)
+
+    def test_product_changes_invalidate(self):
+        self.render(DeliveryNoteCreateForm, customer=self.customer)
+
+        Product.objects.create(name="Lechuga", producer=self.producer, unit=Product.Unit.UNIDAD)
+        self.assertIn("Lechuga (Huerta)", self.render(DeliveryNoteCreateForm, customer=self.customer))
+
+        self.producer.name = "La Huerta"
+        self.producer.save()
+        self.assertIn("Lechuga (La Huerta)", self.render(DeliveryNoteCreateForm, customer=self.customer))
+
+    def test_customer_changes_invalidate(self):
+        self.render(DeliveryNoteForm, user=self.manager)
+
+        new_customer = User.objects.create_user(username="nevera2")
+        self.customers_group.user_set.add(new_customer)
+        self.assertIn("nevera2", self.render(DeliveryNoteForm, user=self.manager))
+
+        new_customer.is_active = False
+        new_customer.save(update_fields=["is_active"])
+        self.assertNotIn("nevera2", self.render(DeliveryNoteForm, user=self.manager))
+
+    def test_posted_data_is_validated(self):
+        product = Product.objects.get(name="Tomate")
+        form = DeliveryNoteForm(user=self.manager, data={
+            "customer": self.customer.pk, "product": product.pk, "quantity": "1",
+            "date": timezone.localtime().strftime("%Y-%m-%dT%H:%M"),
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data["product"], product)
+
+        form = DeliveryNoteCreateForm(customer=self.customer, data={
+            "product": Product.objects.get(name="Viejo").pk, "quantity": "1",
+        })
+        self.assertFalse(form.is_valid())
+
+
+# --- Sheet Entry Tests ---
+
+
+class DeliveryNoteSheetCreateViewTestCase(TestCase):
+    """Tests for the entry of a whole paper sheet in one submit"""
+
+    def setUp(self):
+        manager = User.objects.create_user(username="tienda1", password="test1234")
+        manager.groups.add(Group.objects.create(name="tienda"))
+        customers_group = Group.objects.create(name=CUSTOMERS_GROUP)
+        self.customers = []
+        for name in ["nevera1", "nevera2"]:
+            customer = User.objects.create_user(username=name)
+            customer.groups.add(customers_group)
+            self.customers.append(customer)
+        producer = Producer.objects.create(name="Huerta")
+        self.tomato = Product.objects.create(name="Tomate", producer=producer, unit=Product.Unit.KG)
+        self.eggs = Product.objects.create(name="Huevos", producer=producer, unit=Product.Unit.DOCENA)
+        self.date = timezone.localtime().replace(second=0, microsecond=0)
+        ProductPrice.objects.create(product=self.tomato, value=Decimal("2.00"), start_date=self.date.date())
+        self.client.login(username="tienda1", password="test1234")
+        self.url = reverse("lupanes:deliverynote-new-sheet")
+
+    def post(self, lines, date=None, total=None):
+        data = {
+            "sheet_number": "42",
+            "date": (date or self.date).strftime("%Y-%m-%dT%H:%M"),
+            "lines-TOTAL_FORMS": total or len(lines),
+            "lines-INITIAL_FORMS": 0,
+            "lines-MIN_NUM_FORMS": 1,
+            "lines-MAX_NUM_FORMS": 100,
+        }
+        for index, (customer, product, quantity) in enumerate(lines):
+            data[f"lines-{index}-customer"] = customer
+            data[f"lines-{index}-product"] = product
+            data[f"lines-{index}-quantity"] = quantity
+        return self.client.post(self.url, data)
+
+    def test_get(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Tomate (Huerta)")
+        self.assertContains(response, 'name="lines-TOTAL_FORMS" value="11"')
+
+    def test_create_lines(self):
+        nevera1, nevera2 = self.customers
+        response = self.post([
+            (nevera1.pk, self.tomato.pk, "1.500"),
+            (nevera2.pk, self.tomato.pk, "2"),
+            (nevera2.pk, self.eggs.pk, "1"),
+            ("", "", ""),
+        ])
+
+        self.assertRedirects(response, reverse("lupanes:deliverynote-month", args=(self.date.year, self.date.month)))
+        notes = DeliveryNote.objects.order_by("pk")
+        self.assertEqual(notes.count(), 3)
+        self.assertEqual({note.sheet_number for note in notes}, {"42"})
+        self.assertEqual(notes[0].amount, Decimal("3.00"))
+        self.assertIsNone(notes[2].unit_price)
+        self.assertEqual(
+            DailyDelivery.objects.get(customer=nevera2, product=self.tomato).amount, Decimal("4.00"),
+        )
+
+    def test_errors_report(self):
+        nevera1, _ = self.customers
+        response = self.post([
+            (nevera1.pk, self.tomato.pk, "1"),
+            (nevera1.pk, 9999, "1"),
+            (nevera1.pk, self.eggs.pk, "-1"),
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(DeliveryNote.objects.exists())
+        report = dict(response.context["errors_report"])
+        self.assertEqual(sorted(report), [2, 3])
+        self.assertIn("Producto", report[2][0])
+        self.assertIn("Cantidad", report[3][0])
+
+    def test_empty_sheet(self):
+        response = self.post([("", "", "")])
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["formset"].non_form_errors())
+        self.assertFalse(DeliveryNote.objects.exists())
+
+    def test_closed_month(self):
+        ClosedMonth.objects.create(year=self.date.year, month=self.date.month)
+        response = self.post([(self.customers[0].pk, self.tomato.pk, "1")])
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["form"].errors["date"])
+        self.assertFalse(DeliveryNote.objects.exists())
+
+    def count_queries(self, lines):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.post(lines)
+        self.assertEqual(response.status_code, 302)
+        return len(ctx.captured_queries)
+
+    def test_queries_do_not_grow_with_lines(self):
+        line = (self.customers[0].pk, self.tomato.pk, "1")
+        self.count_queries([line])  # load choices
+        self.assertEqual(self.count_queries([line] * 2), self.count_queries([line] * 20))
+
+
+# --- Import Delivery Notes Tests ---
+
+
+class ImportDeliveryNotesTestCase(TestCase):
+    """Tests for the importdeliverynotes command"""
+
+    header = "Nº hoja,Fecha,Nevera,Producto,Productor,Cantidad\n"
+
+    def setUp(self):
+        self.customer = User.objects.create_user(username="Nevera1")
+        producer = Producer.objects.create(name="Huerta")
+        self.tomato = Product.objects.create(name="Tomate", producer=producer, unit=Product.Unit.KG)
+        self.eggs = Product.objects.create(name="Huevos", producer=producer, unit=Product.Unit.DOCENA)
+        ProductPrice.objects.create(product=self.tomato, value=Decimal("2.00"), start_date=date(2024, 1, 1))
+
+    def run_import(self, content, *args):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as csv_file:
+            csv_file.write(self.header + content)
+        self.addCleanup(os.remove, csv_file.name)
+        out, err = StringIO(), StringIO()
+        call_command("importdeliverynotes", csv_file.name, *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_import(self):
+        out, _ = self.run_import(
+            "12,2024-03-05 10:30,nevera1,tomate,Huerta,\"1,5\"\n"
+            ",2024-03-06,NEVERA1,Tomate,,2\n",
+            "--chunk-size", "1",
+        )
+
+        self.assertIn("Imported 2 delivery notes.", out)
+        self.assertIn("2 rows processed", out)
+        first, second = DeliveryNote.objects.order_by("date")
+        self.assertEqual(first.sheet_number, "12")
+        self.assertEqual(first.quantity, Decimal("1.5"))
+        self.assertEqual(first.amount, Decimal("3.00"))
+        self.assertEqual(timezone.localtime(first.date).hour, 10)
+        self.assertEqual(second.customer, self.customer)
+        self.assertEqual(DailyDelivery.objects.filter(customer=self.customer).count(), 2)
+
+    def test_invalid_rows_import_nothing(self):
+        with self.assertRaises(CommandError):
+            self.run_import(
+                "1,2024-03-05,nevera1,tomate,,1\n"
+                "2,2024-03-05,nobody,tomate,,1\n"
+                "3,yesterday,nevera1,unknown,,-1\n"
+                "4,2024-03-05,nevera1,huevos,,1\n"
+            )
+        self.assertFalse(DeliveryNote.objects.exists())
+
+    def test_errors_are_reported_by_line(self):
+        out, err = StringIO(), StringIO()
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as csv_file:
+            csv_file.write(self.header + "1,2024-03-05,nobody,tomate,,1\n2,2023-12-05,nevera1,tomate,,1\n")
+        self.addCleanup(os.remove, csv_file.name)
+
+        with self.assertRaisesMessage(CommandError, "2 invalid rows"):
+            call_command("importdeliverynotes", csv_file.name, stdout=out, stderr=err)
+
+        self.assertIn("Line 2: unknown customer 'nobody'", err.getvalue())
+        self.assertIn("Line 3: product 'tomate' has no price on 05/12/2023", err.getvalue())
+
+    def test_missing_price_allowed(self):
+        self.run_import("1,2024-03-05,nevera1,huevos,,2\n", "--allow-missing-price")
+        note = DeliveryNote.objects.get()
+        self.assertIsNone(note.amount)
+
+    def test_closed_month(self):
+        ClosedMonth.objects.create(year=2024, month=3)
+        with self.assertRaisesMessage(CommandError, "1 invalid rows"):
+            self.run_import("1,2024-03-05,nevera1,tomate,,1\n")
+
+    def test_dry_run(self):
+        out, _ = self.run_import("1,2024-03-05,nevera1,tomate,,1\n", "--dry-run")
+        self.assertIn("Dry run: 1 delivery notes are valid.", out)
+        self.assertFalse(DeliveryNote.objects.exists())
+
+    def test_missing_columns(self):
+        self.header = "Fecha,Nevera\n"
+        with self.assertRaisesMessage(CommandError, "Missing columns"):
+            self.run_import("2024-03-05,nevera1\n")
+
+
+# --- Import Products Tests ---
+
+
+class ImportProductsTestCase(TestCase):
+    """Tests for the upsert of the importproducts command"""
+
+    def setUp(self):
+        self.producer = Producer.objects.create(name="Huerta")
+        self.tomato = Product.objects.create(name="Tomate", producer=self.producer, unit=Product.Unit.KG)
+        ProductPrice.objects.create(product=self.tomato, value=Decimal("2.00"), start_date=date(2024, 1, 1))
+        self.customer = User.objects.create_user(username="nevera1")
+        self.note = DeliveryNote.objects.create(
+            customer=self.customer, product=self.tomato, quantity=Decimal("1"),
+            date=timezone.make_aware(timezone.datetime(2024, 3, 10, 12)),
+        )
+
+    def run_import(self, content, *args):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as csv_file:
+            csv_file.write("producto,precio,productor,unidad\n" + content)
+        self.addCleanup(os.remove, csv_file.name)
+        out = StringIO()
+        call_command("importproducts", csv_file.name, *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    content = (
+        "Tomate (desde 01/01/2024),\"2,00\",Huerta,Kg\n"
+        "Tomate (desde 01/03/2024),\"2,50\",Huerta,Kg\n"
+        "Huevos,\"3,20\",Granja,docena\n"
+    )
+
+    def test_upsert(self):
+        out = self.run_import(self.content)
+
+        self.assertIn("1 new producers, 1 new products, 0 updated products, 2 new prices (1 already existing)", out)
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertTrue(DeliveryNote.objects.filter(pk=self.note.pk).exists())
+        self.assertEqual(
+            list(self.tomato.productprice_set.order_by("start_date").values_list("value", flat=True)),
+            [Decimal("2.00"), Decimal("2.50")],
+        )
+        eggs = Product.objects.get(name="Huevos")
+        self.assertEqual(eggs.producer.name, "Granja")
+        self.assertEqual(eggs.get_price_on(date(2000, 1, 1)), Decimal("3.20"))
+
+    def test_new_prices_reprice_notes(self):
+        self.run_import(self.content)
+        self.note.refresh_from_db()
+        self.assertEqual(self.note.amount, Decimal("2.50"))
+
+    def test_rerun_is_idempotent(self):
+        self.run_import(self.content)
+        out = self.run_import(self.content)
+        self.assertIn("0 new producers, 0 new products, 0 updated products, 0 new prices (3 already existing)", out)
+
+    def test_product_unit_is_updated(self):
+        out = self.run_import("Tomate,\"1,00\",Huerta,unidad\n")
+        self.assertIn("1 updated products", out)
+        self.tomato.refresh_from_db()
+        self.assertEqual(self.tomato.unit, Product.Unit.UNIDAD)
+
+    def test_dry_run(self):
+        out = self.run_import(self.content, "--dry-run")
+        self.assertIn("Dry run: 1 new producers", out)
+        self.assertEqual(Product.objects.count(), 1)
+        self.assertEqual(ProductPrice.objects.count(), 1)
+
+    def test_debug(self):
+        out = self.run_import(self.content, "--debug", "--dry-run")
+        self.assertIn("producto,fecha,precio,productor", out)
+        self.assertIn("Tomate,2024-03-01,2.50,Huerta", out)
+
+    def test_drop(self):
+        self.run_import(self.content, "--drop")
+        self.assertFalse(DeliveryNote.objects.exists())
+        self.assertEqual(Product.objects.count(), 2)
+
+
+# --- Import Customers Tests ---
+
+
+class ImportCustomersTestCase(TestCase):
+    """Tests for the upsert of the importcustomers command"""
+
+    def run_import(self, content, *args):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as csv_file:
+            csv_file.write("Nombre nevera,E-mail\n" + content)
+        self.addCleanup(os.remove, csv_file.name)
+        out = StringIO()
+        call_command("importcustomers", csv_file.name, *args, stdout=out)
+        return out.getvalue()
+
+    def test_import(self):
+        existing = User.objects.create_user(username="nevera1", email="old@example.com")
+
+        out = self.run_import(
+            "nevera1 ,new@example.com\n"
+            "nevera2,n2@example.com\n"
+            "nevera2,other@example.com\n"
+            ",empty@example.com\n"
+            "nevera3,\n",
+            "--chunk-size", "2",
+        )
+
+        self.assertIn("Imported 2 customers, updated 1 e-mails, added 3 to neveras (1 duplicated rows skipped)", out)
+        existing.refresh_from_db()
+        self.assertEqual(existing.email, "new@example.com")
+        self.assertTrue(existing.is_customer)
+        nevera2 = User.objects.get(username="nevera2")
+        self.assertEqual(nevera2.email, "n2@example.com")
+        self.assertFalse(nevera2.has_usable_password())
+        self.assertEqual(
+            list(User.objects.get_active_customers().values_list("username", flat=True)),
+            ["nevera1", "nevera2", "nevera3"],
+        )
+
+    def test_rerun_does_not_fail(self):
+        content = "nevera1,n1@example.com\nnevera2,n2@example.com\n"
+        self.run_import(content)
+        out = self.run_import(content)
+        self.assertIn("Imported 0 customers, updated 0 e-mails, added 0 to neveras", out)
+        self.assertEqual(User.objects.count(), 2)
+
+    def test_blank_email_keeps_the_stored_one(self):
+        existing = User.objects.create_user(username="nevera1", email="n1@example.com")
+
+        out = self.run_import("nevera1,\n")
+
+        self.assertIn("updated 0 e-mails", out)
+        existing.refresh_from_db()
+        self.assertEqual(existing.email, "n1@example.com")
+
+    def test_dry_run(self):
+        out = self.run_import("nevera1,n1@example.com\n", "--dry-run")
+        self.assertIn("Dry run: Imported 1 customers", out)
+        self.assertFalse(User.objects.exists())
+
+    def test_queries_do_not_grow_with_rows(self):
+        content = "".join(f"nevera{i},n{i}@example.com\n" for i in range(50))
+        with CaptureQueriesContext(connection) as ctx:
+            self.run_import(content)
+        self.assertLess(len(ctx.captured_queries), 20)
+
+
+# --- Database Backup Tests ---
+
+
+FAKE_PG_DUMP = """#!{python}
+import os
+import sys
+
+args = sys.argv[1:]
+if os.environ.get("FAKE_PG_DUMP_FAIL"):
+    sys.stderr.write("connection refused")
+    sys.exit(1)
+if "--format=directory" in args:
+    path = [arg for arg in args if arg.startswith("--file=")][0][len("--file="):]
+    os.makedirs(path)
+    with open(os.path.join(path, "toc.dat"), "w") as toc:
+        toc.write(" ".join(args))
+else:
+    for number in range(1000):
+        sys.stdout.write("INSERT INTO lupanes_deliverynote VALUES (%d);\\n" % number)
+    sys.stdout.write(" ".join(args))
+"""
+
+
+class BackupDatabaseTestCase(TestCase):
+    """Tests for the backupdatabase command (with a stub of pg_dump)"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.output_dir = os.path.join(self.tmp_dir, "backups")
+        self.pg_dump = os.path.join(self.tmp_dir, "pg_dump")
+        with open(self.pg_dump, "w") as script:
+            script.write(FAKE_PG_DUMP.format(python=sys.executable))
+        os.chmod(self.pg_dump, 0o755)
+
+    def backup(self, *args):
+        out = StringIO()
+        call_command("backupdatabase", "--output-dir", self.output_dir, "--pg-dump", self.pg_dump, *args, stdout=out)
+        return out.getvalue()
+
+    def backups(self):
+        return sorted(
+            name for name in os.listdir(self.output_dir)
+            if name.startswith("backup_") and name != "backup_metrics.jsonl"
+        )
+
+    def test_plain_backup_is_gzipped(self):
+        out = self.backup()
+
+        [name] = self.backups()
+        self.assertTrue(name.endswith(".sql.gz"))
+        self.assertIn(f"Created {os.path.join(self.output_dir, name)}", out)
+        with gzip.open(os.path.join(self.output_dir, name), "rt") as backup:
+            content = backup.read()
+        self.assertIn("INSERT INTO lupanes_deliverynote VALUES (999);", content)
+        self.assertIn("--format=plain", content)
+        self.assertNotIn("PASSWORD", content)
+
+    def test_metrics_are_recorded(self):
+        self.backup()
+        with open(os.path.join(self.output_dir, "backup_metrics.jsonl")) as metrics_file:
+            metrics = json.loads(metrics_file.readline())
+        self.assertEqual(metrics["format"], "plain")
+        self.assertEqual(metrics["backup"], self.backups()[0])
+        self.assertGreater(metrics["size"], 0)
+        self.assertIn("duration", metrics)
+
+    def test_directory_backup(self):
+        self.backup("--format", "directory", "--jobs", "4")
+
+        [name] = self.backups()
+        self.assertTrue(name.endswith(".dir"))
+        with open(os.path.join(self.output_dir, name, "toc.dat")) as toc:
+            self.assertIn("--jobs=4", toc.read())
+
+    @patch.dict(os.environ, {"FAKE_PG_DUMP_FAIL": "1"})
+    def test_failed_dump(self):
+        with self.assertRaisesMessage(CommandError, "connection refused"):
+            self.backup()
+        self.assertEqual(self.backups(), [])
+        self.assertFalse([name for name in os.listdir(self.output_dir) if name.endswith(".partial")])
+
+    def test_old_backups_are_deleted(self):
+        os.makedirs(self.output_dir)
+        old = time.time() - 31 * 24 * 3600
+        for name in ["backup_20200101000000.zip", "backup_20200101000000.sql.gz", "other.zip"]:
+            path = os.path.join(self.output_dir, name)
+            open(path, "w").close()
+            os.utime(path, (old, old))
+        recent = os.path.join(self.output_dir, "backup_20990101000000.sql.gz")
+        open(recent, "w").close()
+
+        out = self.backup("--keep-days", "30")
+
+        self.assertIn("Deleting old backup backup_20200101000000.zip", out)
+        self.assertEqual(len(self.backups()), 2)  # the recent one and the new one
+        self.assertTrue(os.path.exists(recent))
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, "other.zip")))
+
+    def create_old_backup(self):
+        os.makedirs(self.output_dir)
+        path = os.path.join(self.output_dir, "backup_20200101000000.sql.gz")
+        open(path, "w").close()
+        old = time.time() - 31 * 24 * 3600
+        os.utime(path, (old, old))
+        return path
+
+    @patch.dict(os.environ, {"PATH": ""})
+    def test_missing_gdrive_still_deletes_old_backups(self):
+        old_backup = self.create_old_backup()
+
+        with self.assertRaisesMessage(CommandError, "Cannot upload"):
+            self.backup("--upload")
+
+        self.assertFalse(os.path.exists(old_backup))
+
+    def test_failed_upload_still_deletes_old_backups(self):
+        old_backup = self.create_old_backup()
+        gdrive = os.path.join(self.tmp_dir, "gdrive")
+        with open(gdrive, "w") as script:
+            script.write(f"#!{sys.executable}\nimport sys\nsys.stderr.write('quota exceeded')\nsys.exit(2)\n")
+        os.chmod(gdrive, 0o755)
+
+        with patch.dict(os.environ, {"PATH": self.tmp_dir}), \
+                self.assertRaisesMessage(CommandError, "failed with exit code 2: quota exceeded"):
+            self.backup("--upload")
+
+        self.assertFalse(os.path.exists(old_backup))
+        self.assertEqual(len(self.backups()), 1)
+
+
+# --- Analytics Export Tests ---
+
+
+class ExportAnalyticsTestCase(TestCase):
+    """Tests for the exportanalytics command"""
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir)
+        self.customer = User.objects.create_user(username="Nevera1")
+        producer = Producer.objects.create(name="Huerta")
+        self.product = Product.objects.create(name="Tomate", producer=producer, unit=Product.Unit.KG)
+        ProductPrice.objects.create(product=self.product, value=Decimal("2.00"), start_date=date(2024, 1, 1))
+        self.january = DeliveryNote.objects.create(
+            customer=self.customer, product=self.product, quantity=Decimal("1.5"),
+            date=timezone.make_aware(timezone.datetime(2024, 1, 31, 23, 30)),
+        )
+        # still January in UTC
+        self.february = DeliveryNote.objects.create(
+            customer=self.customer, product=self.product, quantity=Decimal("2"),
+            date=timezone.make_aware(timezone.datetime(2024, 2, 1, 0, 30)),
+        )
+
+    def export(self, *args):
+        out = StringIO()
+        call_command("exportanalytics", "--output-dir", self.output_dir, *args, stdout=out)
+        return out.getvalue()
+
+    def read_month(self, year, month):
+        path = os.path.join(self.output_dir, f"year={year}", f"month={month:02d}", "deliverynotes.csv.gz")
+        with gzip.open(path, "rt", newline="") as partition:
+            return list(csv.DictReader(partition))
+
+    def test_export_by_local_month(self):
+        out = self.export("--chunk-size", "1")
+
+        self.assertIn("2 months exported, 0 unchanged, 0 removed.", out)
+        [row] = self.read_month(2024, 1)
+        self.assertEqual(row["id"], str(self.january.pk))
+        self.assertEqual(row["customer"], "Nevera1")
+        self.assertEqual(row["producer"], "Huerta")
+        self.assertEqual(row["unit"], Product.Unit.KG)
+        self.assertEqual(Decimal(row["unit_price"]), Decimal("2.00"))
+        self.assertEqual(Decimal(row["amount"]), Decimal("3"))
+        self.assertTrue(row["date"].startswith("2024-01-31T23:30:00"))
+        [row] = self.read_month(2024, 2)
+        self.assertEqual(row["id"], str(self.february.pk))
+
+    def test_only_changed_months_are_rewritten(self):
+        self.export()
+
+        self.assertIn("0 months exported, 2 unchanged", self.export())
+
+        self.february.quantity = Decimal("3")
+        self.february.save()
+        DeliveryNote.objects.create(
+            customer=self.customer, product=self.product, quantity=Decimal("1"),
+            date=timezone.make_aware(timezone.datetime(2024, 3, 10, 12)),
+        )
+        out = self.export()
+        self.assertIn("Exported 1 delivery notes of 2024-02.", out)
+        self.assertIn("2 months exported, 1 unchanged", out)
+        self.assertEqual(Decimal(self.read_month(2024, 2)[0]["quantity"]), Decimal("3"))
+
+        self.assertIn("3 months exported", self.export("--full"))
+
+    def test_deleted_notes_are_detected(self):
+        self.export()
+        second = DeliveryNote.objects.create(
+            customer=self.customer, product=self.product, quantity=Decimal("1"),
+            date=timezone.make_aware(timezone.datetime(2024, 1, 10, 12)),
+        )
+        self.export()
+        second.delete()
+        self.assertIn("Exported 1 delivery notes of 2024-01.", self.export())
+
+        self.january.delete()
+        out = self.export()
+        self.assertIn("0 months exported, 1 unchanged, 1 removed.", out)
+        self.assertFalse(os.path.exists(os.path.join(self.output_dir, "year=2024", "month=01", "deliverynotes.csv.gz")))
+        with open(os.path.join(self.output_dir, "manifest.json")) as manifest_file:
+            self.assertEqual(list(json.load(manifest_file)), ["2024-02"])
+
+
+# --- Date Range Filter Tests ---
+
+
+class LocalDateRangeTestCase(TestCase):
+    """Tests for the half-open date ranges that replace `date__date` filters"""
+
+    def setUp(self):
+        self.customer = User.objects.create_user(username="Nevera1")
+        producer = Producer.objects.create(name="Huerta")
+        self.product = Product.objects.create(name="Tomate", producer=producer, unit=Product.Unit.KG)
+        ProductPrice.objects.create(product=self.product, value=Decimal("2.00"), start_date=date(2024, 1, 1))
+
+    def create_note(self, *args):
+        return DeliveryNote.objects.create(
+            customer=self.customer, product=self.product, quantity=1,
+            date=timezone.make_aware(timezone.datetime(*args)),
+        )
+
+    def test_ranges_are_local_and_half_open(self):
+        start, end = local_date_range(date(2024, 3, 31))
+        # summer time starts that day: 23 hours long
+        self.assertEqual(end.astimezone(timezone.utc) - start.astimezone(timezone.utc), timezone.timedelta(hours=23))
+        self.assertEqual(timezone.localtime(start).hour, 0)
+
+        start, end = local_month_range(2024, 12)
+        self.assertEqual(timezone.localtime(start).date(), date(2024, 12, 1))
+        self.assertEqual(timezone.localtime(end).date(), date(2025, 1, 1))
+
+    def test_filters_include_whole_local_days(self):
+        first = self.create_note(2024, 2, 1, 0, 30)  # 2024-01-31 in UTC
+        last = self.create_note(2024, 2, 29, 23, 59)
+        self.create_note(2024, 1, 31, 23, 59)
+        self.create_note(2024, 3, 1, 0, 0)
+
+        self.assertQuerySetEqual(DeliveryNote.objects.in_month(2024, 2).order_by("date"), [first, last])
+        self.assertQuerySetEqual(DeliveryNote.objects.on_days(date(2024, 2, 1)), [first])
+        self.assertQuerySetEqual(
+            DeliveryNote.objects.on_days(date(2024, 2, 1), date(2024, 2, 29)).order_by("date"), [first, last],
+        )
+        self.assertEqual(DeliveryNote.objects.since_day(date(2024, 2, 29)).count(), 2)
+
+    def test_queries_do_not_cast_the_date(self):
+        with CaptureQueriesContext(connection) as ctx:
+            list(DeliveryNote.objects.in_month(2024, 2))
+            list(DeliveryNote.objects.filter(customer=self.customer).on_days(date(2024, 2, 1)))
+        for query in ctx.captured_queries:
+            self.assertNotIn("django_datetime_cast_date", query["sql"])
+            self.assertNotIn("django_datetime_extract", query["sql"])
+
+    def test_refresh_many_days(self):
+        notes = [
+            DeliveryNote(customer=self.customer, product=self.product, quantity=1,
+                         date=timezone.make_aware(timezone.datetime(2024, 1, 1, 12)) + timezone.timedelta(days=2 * n))
+            for n in range(60)
+        ]
+        DeliveryNote.objects.create_many(notes)
+
+        self.assertEqual(DailyDelivery.objects.count(), 60)
+        self.assertEqual(DailyDelivery.objects.aggregate(total=Sum("amount"))["total"], Decimal("120"))
+
+
+@skipUnless(connection.vendor == "postgresql", "EXPLAIN output checked on PostgreSQL")
+class DeliveryNoteIndexesTestCase(TestCase):
+    """The hot queries can use the composite indexes (run the tests against PostgreSQL)"""
+
+    def setUp(self):
+        self.customer = User.objects.create_user(username="Nevera1")
+        producer = Producer.objects.create(name="Huerta")
+        self.product = Product.objects.create(name="Tomate", producer=producer, unit=Product.Unit.KG)
+        with connection.cursor() as cursor:
+            # the tables are nearly empty: make the planner choose indexes whenever it can
+            cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def test_customer_month(self):
+        plan = DeliveryNote.objects.filter(customer=self.customer).in_month(2024, 2).explain()
+        self.assertIn("deliverynote_customer_date", plan)
+
+    def test_product_since_day(self):
+        plan = DeliveryNote.objects.filter(product=self.product).since_day(date(2024, 2, 1)).explain()
+        self.assertIn("deliverynote_product_date", plan)
+
+    def test_month(self):
+        plan = DeliveryNote.objects.in_month(2024, 2).explain()
+        self.assertIn("deliverynote_date", plan)
+
+    def test_price_on_date(self):
+        plan = ProductPrice.objects.filter(
+            product=self.product, start_date__lte=date(2024, 2, 1),
+        ).order_by("-start_date")[:1].explain()
+        self.assertIn("Index Scan Backward", plan)
+        self.assertIn("lupanes_productprice_product_id_start_date", plan)
+
+
+# --- Fake Data Tests ---
+
+
+class SeedFakeDataTestCase(TestCase):
+    """Tests for the seedfakedata command"""
+
+    def seed(self, *args):
+        out = StringIO()
+        call_command(
+            "seedfakedata", "--customers", "4", "--managers", "1", "--products", "30", "--months", "2",
+            "--notes-per-day", "3", "--until", "2024-02-29", "--chunk-size", "7", *args, stdout=out,
+        )
+        return out.getvalue()
+
+    def test_seed(self):
+        out = self.seed()
+
+        self.assertIn("Created 4 customers and 1 managers.", out)
+        self.assertIn("Created 180 delivery notes from 2024-01-01 to 2024-02-29.", out)
+        self.assertEqual(User.objects.get_active_customers().count(), 4)
+        self.assertEqual(Product.objects.count(), 30)
+        self.assertTrue(Product.objects.filter(name="Tomates 2").exists())
+        self.assertTrue(self.client.login(username=User.objects.get_active_customers()[0].username,
+                                          password="password123"))
+
+        notes = DeliveryNote.objects.all()
+        self.assertEqual(notes.filter(unit_price__isnull=True).count(), 0)
+        self.assertEqual(notes.on_days(date(2024, 1, 1), date(2024, 1, 31)).count(), 93)
+        rollup = DailyDelivery.objects.aggregate(notes=Sum("notes"), amount=Sum("amount"))
+        self.assertEqual(rollup["notes"], 180)
+        self.assertEqual(rollup["amount"], notes.aggregate(amount=Sum("amount"))["amount"])
+
+    def test_same_seed_same_data(self):
+        self.seed("--seed", "7")
+        first = list(DeliveryNote.objects.order_by("pk").values_list("date", "quantity", "amount"))
+        DeliveryNote.objects.all().delete()
+
+        self.seed("--seed", "7")
+        self.assertEqual(list(DeliveryNote.objects.order_by("pk").values_list("date", "quantity", "amount")), first)
+
+    def test_options_must_be_positive(self):
+        for option in ["--customers", "--products", "--months", "--notes-per-day", "--price-changes", "--chunk-size"]:
+            with self.subTest(option=option), self.assertRaisesMessage(CommandError, f"{option} must be positive"):
+                self.seed(option, "0")
+        with self.assertRaisesMessage(CommandError, "--managers cannot be negative"):
+            self.seed("--managers", "-1")
+        self.assertFalse(User.objects.exists())
+
+        self.seed("--managers", "0")
+        self.assertFalse(DeliveryNote.objects.filter(created_by__isnull=False).exists())
@@ -20,9 +20,15 @@ urlpatterns = [
     path('albaranes/', views.DeliveryNoteCurrentMonthArchiveView.as_view(), name='deliverynote-current-month'),
     path('albaranes/<int:year>/<int:month>/', views.DeliveryNoteMonthArchiveView.as_view(month_format="%m"),
          name='deliverynote-month'),
+    path('albaranes/<int:year>/<int:month>/data/', views.DeliveryNoteMonthArchiveDataView.as_view(),
+         name='deliverynote-month-data'),
     path('albaranes/<int:year>/<int:month>/summary/', views.DeliveryNoteSummaryView.as_view(month_format="%m"),
          name='deliverynote-summary'),
+    path('albaranes/<int:year>/<int:month>/close/', views.DeliveryNoteMonthCloseView.as_view(),
+         name='deliverynote-month-close'),
+    path('albaranes/export/', views.DeliveryNoteExportView.as_view(), name='deliverynote-export'),
     path('albaranes/new-bulk/', views.DeliveryNoteBulkCreateView.as_view(), name='deliverynote-new-bulk'),
+    path('albaranes/new-sheet/', views.DeliveryNoteSheetCreateView.as_view(), name='deliverynote-new-sheet'),
     path('albaranes/<int:pk>/edit-bulk/', views.DeliveryNoteBulkUpdateView.as_view(), name='deliverynote-edit-bulk'),
     path('albaranes/<int:pk>/delete-bulk/', views.DeliveryNoteBulkDeleteView.as_view(),
          name='deliverynote-delete-bulk'),
@@ -32,6 +38,7 @@ urlpatterns = [
 
     path('product/<int:pk>/', views.ProductAjaxView.as_view(), name='product-detail'),
     path('products/', views.ProductListView.as_view(), name='product-list'),
+    path('products/catalog/', views.ProductCatalogView.as_view(), name='product-catalog'),
     path('products/new/', views.ProductCreateView.as_view(), name='product-new'),
     path('products/<int:pk>/edit/', views.ProductUpdateView.as_view(), name='product-edit'),
     path('products/<int:pk>/new-price/', views.ProductNewPriceView.as_view(), name='product-new-price'),
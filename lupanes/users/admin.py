@@ -2,6 +2,8 @@ from django.contrib import admin
 
 from django.contrib.auth import get_user_model
 
+from lupanes.users.models import NeveraBalance
+
 User = get_user_model()
 
 
@@ -12,3 +14,14 @@ class UserAdmin(admin.ModelAdmin):
 
     def group_list(self, obj):
         return ", ".join(obj.groups.values_list("name", flat=True))
+
+
+@admin.register(NeveraBalance)
+class NeveraBalanceAdmin(admin.ModelAdmin):
+    list_display = ["name", "balance", "synced_at"]
+    ordering = ["name"]
+    search_fields = ["name"]
+    readonly_fields = ["name", "balance", "synced_at"]
+
+    def has_add_permission(self, request):
+        return False
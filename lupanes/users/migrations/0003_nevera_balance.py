@@ -0,0 +1,22 @@
+# Generated by Django 4.2.28 on 2026-10-18 15:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_alter_user_managers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NeveraBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=150, unique=True, verbose_name='Nevera')),
+                ('balance', models.CharField(max_length=32, verbose_name='Saldo')),
+                ('synced_at', models.DateTimeField(verbose_name='Sincronizado')),
+            ],
+        ),
+    ]
@@ -1,17 +1,24 @@
 import decimal
+import logging
 
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.models import UserManager as ContribUserManager
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
 from django.db.models.functions import Lower
 from django.utils import timezone
 from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 
 from lupanes import utils
+from lupanes.models import CUSTOMERS, DailyDelivery, bump_data_version
 from lupanes.users import CUSTOMERS_GROUP, MANAGERS_GROUP
 from lupanes.users.validators import CustomUnicodeUsernameValidator
 
+logger = logging.getLogger(__name__)
+
 
 class UserManager(ContribUserManager):
     def get_active_customers(self):
@@ -43,20 +50,41 @@ class User(AbstractUser):
 
     objects = UserManager()
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # e.g. login only updates `last_login`
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or {"username", "is_active"} & set(update_fields):
+            bump_data_version(CUSTOMERS)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        bump_data_version(CUSTOMERS)
+        return result
+
+    @cached_property
+    def group_names(self):
+        """Names of the user groups, loaded once per instance (i.e. once per request for `request.user`)"""
+        return frozenset(self.groups.values_list("name", flat=True))
+
     @property
     def is_customer(self):
-        return self.groups.filter(name=CUSTOMERS_GROUP).exists()
+        return CUSTOMERS_GROUP in self.group_names
 
     @property
     def is_manager(self):
-        return self.groups.filter(name=MANAGERS_GROUP).exists()
+        return MANAGERS_GROUP in self.group_names
 
     @property
     def current_balance(self):
         if not self.is_customer:
             return
 
-        balance = utils.search_nevera_balance(self.username)
+        if settings.LUPIERRA_BALANCE_BACKGROUND_SYNC:
+            # kept up to date by `syncbalances`, never calls Google Sheets
+            balance = NeveraBalance.objects.get_balance(self.username)
+        else:
+            balance = utils.search_nevera_balance(self.username)
 
         try:
             balance = decimal.Decimal(balance.replace(",", "."))
@@ -65,26 +93,19 @@ class User(AbstractUser):
 
         return balance
 
+    @cached_property
+    def current_month_amount(self):
+        """Amount of the notes of the current month, loaded once per instance (i.e. once per request)"""
+        today = timezone.localdate()
+        # notes without price on its date are not included on the daily amount
+        return DailyDelivery.objects.customer_month_amount(self.pk, today.year, today.month)
+
     def current_month_consumption(self):
         """Calcula el consumo total del mes en curso"""
         if not self.is_customer:
             return decimal.Decimal(0)
 
-        now = timezone.now()
-        notes = self.deliverynote_set.filter(
-            date__year=now.year,
-            date__month=now.month,
-        )
-
-        total = decimal.Decimal(0)
-        for note in notes:
-            try:
-                total += note.amount()
-            except Exception:
-                # Si hay algún error calculando el precio, lo ignoramos
-                pass
-
-        return total
+        return self.current_month_amount
 
     def projected_balance(self):
         """Calcula la previsión de saldo al final del mes"""
@@ -97,3 +118,54 @@ class User(AbstractUser):
 
         consumption = self.current_month_consumption()
         return balance - consumption
+
+
+class NeveraBalanceQuerySet(models.QuerySet):
+    def get_balance(self, nevera):
+        balance = self.filter(name=nevera.strip().lower()).values_list("balance", flat=True).first()
+        return "N/A" if balance is None else balance
+
+    def sync(self, balances):
+        """
+        Replace the stored balances by `balances` ({nevera name: balance}), returns if they were replaced.
+
+        An empty `balances` is refused: it is a wrong read of the spreadsheet
+        (e.g. renamed sheet or range), not the removal of every nevera.
+        """
+        if not balances:
+            logger.warning("No neveras balances read from the spreadsheet, keeping the stored ones")
+            return False
+
+        now = timezone.now()
+        with transaction.atomic():
+            self.bulk_create(
+                [NeveraBalance(name=name, balance=balance, synced_at=now) for name, balance in balances.items()],
+                update_conflicts=True,
+                unique_fields=["name"],
+                update_fields=["balance", "synced_at"],
+            )
+            self.exclude(name__in=balances.keys()).delete()
+        return True
+
+
+class NeveraBalance(models.Model):
+    """Saldo de nevera (copia local de la hoja de cálculo)"""
+    name = models.CharField("Nevera", max_length=150, unique=True)
+    balance = models.CharField("Saldo", max_length=32)
+    synced_at = models.DateTimeField("Sincronizado")
+
+    objects = NeveraBalanceQuerySet.as_manager()
+
+    def __str__(self) -> str:
+        return self.name
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def clear_group_names(sender, instance, **kwargs):
+    """Forget the cached groups when they change through this same instance"""
+    if kwargs["action"] not in ("post_add", "post_remove", "post_clear"):
+        return
+    if isinstance(instance, User):
+        instance.__dict__.pop("group_names", None)
+    # who is a customer may have changed
+    bump_data_version(CUSTOMERS)
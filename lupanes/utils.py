@@ -1,6 +1,7 @@
 import hashlib
 import time
 import random
+import uuid
 import logging
 from functools import wraps
 
@@ -8,9 +9,9 @@ import gspread
 from gspread.exceptions import APIError
 import requests.exceptions
 from django.conf import settings
-from django.core.cache import cache
+from django.core.cache import cache, caches
 
-from lupanes.exceptions import RetryExhausted
+from lupanes.exceptions import CircuitOpen, RetryExhausted
 
 logger = logging.getLogger(__name__)
 
@@ -41,6 +42,89 @@ def retry_on_gspread_error(max_retries=4, base_delay=1.0):
     return decorator
 
 
+class CircuitBreaker:
+    """
+    Stop calling a failing service for a while.
+
+    After `failure_threshold` consecutive failures the circuit opens and calls
+    fail fast with `CircuitOpen` during `cooldown` seconds. Then a single call
+    is let through as a probe: its success closes the circuit and its failure
+    opens it again. The state is kept on the durable cache, shared by all the workers.
+
+    Use it as a context manager around the calls to the service.
+    """
+    errors = (APIError, RetryExhausted, requests.exceptions.RequestException)
+
+    def __init__(self, name, failure_threshold, cooldown):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        # one key per failure (see `record_failure`)
+        self.failure_keys = [f"circuit_breaker:{name}:failure:{number}" for number in range(1, failure_threshold + 1)]
+        self.opened_at_key = f"circuit_breaker:{name}:opened_at"
+        self.probe_key = f"circuit_breaker:{name}:probe"
+
+    @property
+    def cache(self):
+        return caches["durable"]
+
+    @property
+    def state(self):
+        opened_at = self.cache.get(self.opened_at_key)
+        if opened_at is None:
+            return "closed"
+        if time.time() - opened_at < self.cooldown:
+            return "open"
+        return "half-open"
+
+    def __enter__(self):
+        state = self.state
+        if state == "open":
+            raise CircuitOpen(f"Circuit {self.name} is open")
+        # only the caller that takes the probe lock tries while half-open
+        if state == "half-open" and not self.cache.add(self.probe_key, True, timeout=self.cooldown):
+            raise CircuitOpen(f"Circuit {self.name} is half-open and already probing")
+        if state == "half-open":
+            logger.info(f"Circuit {self.name} is half-open, probing the service")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.record_success()
+        elif issubclass(exc_type, self.errors):
+            self.record_failure()
+        return False
+
+    def record_success(self):
+        if self.cache.get(self.opened_at_key) is not None:
+            logger.info(f"Circuit {self.name} is closed again")
+        self.cache.delete_many([*self.failure_keys, self.opened_at_key, self.probe_key])
+
+    def record_failure(self):
+        # `incr` reads and writes the counter apart on the database cache, losing concurrent failures;
+        # `add` succeeds for a single caller, so each failure takes a different key
+        failures = self.failure_threshold
+        for number, key in enumerate(self.failure_keys, start=1):
+            if self.cache.add(key, True, timeout=None):
+                failures = number
+                break
+        probing = self.cache.get(self.opened_at_key) is not None
+        if probing or failures >= self.failure_threshold:
+            self.cache.set(self.opened_at_key, time.time(), timeout=None)
+            self.cache.delete(self.probe_key)
+            logger.warning(
+                f"Circuit {self.name} is open after {failures} consecutive failures, "
+                f"failing fast for {self.cooldown}s"
+            )
+
+
+sheets_circuit_breaker = CircuitBreaker(
+    "gspread",
+    failure_threshold=settings.LUPIERRA_GSPREAD_BREAKER_THRESHOLD,
+    cooldown=settings.LUPIERRA_GSPREAD_BREAKER_COOLDOWN,
+)
+
+
 def _get_nevera_cache_key(nevera_name):
     """Generate cache key for customer balance.
 
@@ -51,15 +135,105 @@ def _get_nevera_cache_key(nevera_name):
     return f"nevera_balance:{name_hash}"
 
 
+# Only one caller refreshes the balances at a time, long enough to cover the retries
+BALANCE_REFRESH_LOCK_KEY = "nevera_balance:refresh_lock"
+BALANCE_REFRESH_LOCK_TIMEOUT = 60
+# callers without a value to serve poll for the refreshed one with an exponential backoff
+BALANCE_REFRESH_WAIT_DELAY = 0.2
+BALANCE_REFRESH_MAX_WAIT_DELAY = 2
+
+
+class CachedBalance(str):
+    """Balance value that knows when it was fetched from the spreadsheet"""
+
+    def __new__(cls, value, fetched_at):
+        obj = super().__new__(cls, value)
+        obj.fetched_at = fetched_at
+        return obj
+
+    def __reduce__(self):
+        return (CachedBalance, (str(self), self.fetched_at))
+
+    @property
+    def age(self):
+        """Seconds since the value was fetched"""
+        return time.time() - self.fetched_at
+
+    @property
+    def is_stale(self):
+        return self.age >= settings.LUPIERRA_BALANCE_CACHE_TTL
+
+
+# Authorized client and worksheet handle, reused by all the fetches of the process
+# (the client refreshes its access token when it expires)
+_gspread_client = None
+_worksheet = None
+
+
+def reset_spreadsheet():
+    """Forget the client and worksheet handle, so the next fetch opens them again"""
+    global _gspread_client, _worksheet
+    _gspread_client = None
+    _worksheet = None
+
+
 @retry_on_gspread_error(
     max_retries=settings.LUPIERRA_GSPREAD_MAX_RETRIES,
     base_delay=settings.LUPIERRA_GSPREAD_BASE_DELAY
 )
 def load_spreadsheet():
-    gc = gspread.service_account(filename=CREDENTIALS_PATH)
-    sh = gc.open_by_url(DOC_URL)
-    worksheet = sh.get_worksheet(0)
-    return worksheet
+    global _gspread_client, _worksheet
+    if _worksheet is None:
+        if _gspread_client is None:
+            _gspread_client = gspread.service_account(filename=CREDENTIALS_PATH)
+        sh = _gspread_client.open_by_url(DOC_URL)
+        _worksheet = sh.get_worksheet(0)
+    return _worksheet
+
+
+@retry_on_gspread_error(
+    max_retries=settings.LUPIERRA_GSPREAD_MAX_RETRIES,
+    base_delay=settings.LUPIERRA_GSPREAD_BASE_DELAY
+)
+def read_balance_rows():
+    """Read the name and balance columns of the spreadsheet"""
+    global _worksheet
+    worksheet = load_spreadsheet()
+    try:
+        return worksheet.get(settings.LUPIERRA_CUSTOMERS_BALANCE_RANGE)
+    except (APIError, requests.exceptions.RequestException):
+        # the handle may be no longer valid (e.g. sheet moved), open it again on the next attempt
+        _worksheet = None
+        raise
+
+
+def fetch_nevera_balances():
+    """Read all the balances of the spreadsheet as {lowercase nevera name: balance}"""
+    with sheets_circuit_breaker:
+        rows = read_balance_rows()
+
+    balances = {}
+    for row in rows:
+        if len(row) >= 2:
+            balances[row[0].strip().lower()] = row[1]
+    return balances
+
+
+def _refresh_nevera_balances(requested_nevera_name):
+    """Fetch the spreadsheet and cache the balances of ALL customers with a single write"""
+    fetched_at = time.time()
+    balances = {
+        name: CachedBalance(balance, fetched_at)
+        for name, balance in fetch_nevera_balances().items()
+    }
+    # Cache the requested one even if not found, to avoid repeated lookups
+    balances.setdefault(requested_nevera_name, CachedBalance("N/A", fetched_at))
+
+    cache.set_many(
+        {_get_nevera_cache_key(name): balance for name, balance in balances.items()},
+        timeout=settings.LUPIERRA_BALANCE_CACHE_STALE_TTL,
+    )
+    return balances[requested_nevera_name]
 
 
 def search_nevera_balance(nevera):
@@ -69,35 +243,59 @@ def search_nevera_balance(nevera):
     On cache miss, fetches the entire spreadsheet and caches ALL customers
     to minimize API calls. Subsequent requests for any customer hit the cache.
 
+    Values older than `LUPIERRA_BALANCE_CACHE_TTL` are stale: a single caller
+    (the one that takes the refresh lock) fetches the spreadsheet again while
+    the rest get the stale value right away. Stale values are also served if
+    the refresh fails or the circuit breaker is open.
+
     Args:
         nevera: Customer name to search for (case-insensitive)
 
     Returns:
-        str: Balance value or "N/A" if not found
+        CachedBalance: Balance value or "N/A" if not found, with its `age`
     """
     requested_nevera_name = nevera.lower()
     cache_key = _get_nevera_cache_key(requested_nevera_name)
 
     cached_value = cache.get(cache_key)
-    if cached_value is not None:
+    if isinstance(cached_value, CachedBalance) and not cached_value.is_stale:
         logger.debug(f"Cache hit for {requested_nevera_name}")
         return cached_value
 
-    logger.debug(f"Cache miss for {requested_nevera_name}, fetching spreadsheet and caching all customers")
-    worksheet = load_spreadsheet()
-    values = worksheet.get_all_values()
+    # the token tells our lock apart from the one of another caller after ours expired
+    token = uuid.uuid4().hex
+    lock_cache = caches["durable"]
+    locked = lock_cache.add(BALANCE_REFRESH_LOCK_KEY, token, timeout=BALANCE_REFRESH_LOCK_TIMEOUT)
+    deadline = time.monotonic() + BALANCE_REFRESH_LOCK_TIMEOUT
+    delay = BALANCE_REFRESH_WAIT_DELAY
+    while not locked:
+        if isinstance(cached_value, CachedBalance):
+            logger.debug(f"Serving stale balance of {requested_nevera_name} ({cached_value.age:.0f}s old)")
+            return cached_value
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            # the lock owner has not finished in time, fetch it ourselves (without the lock)
+            break
+        # nothing to serve yet: wait for the caller that is refreshing
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, BALANCE_REFRESH_MAX_WAIT_DELAY)
+        cached_value = cache.get(cache_key)
+        locked = lock_cache.add(BALANCE_REFRESH_LOCK_KEY, token, timeout=BALANCE_REFRESH_LOCK_TIMEOUT)
 
-    result = "N/A"
-    for row in values:
-        if len(row) >= 2:
-            row_nevera_name = row[0].strip().lower()
-            row_balance = row[1]
-            row_cache_key = _get_nevera_cache_key(row_nevera_name)
-            cache.set(row_cache_key, row_balance, timeout=settings.LUPIERRA_BALANCE_CACHE_TTL)
+    try:
+        # it may have been refreshed while waiting for the lock
+        latest_value = cache.get(cache_key)
+        if isinstance(latest_value, CachedBalance) and not latest_value.is_stale:
+            return latest_value
 
-            if row_nevera_name == requested_nevera_name:
-                result = row_balance
-
-    # Cache the result (including "N/A" if not found)
-    cache.set(cache_key, result, timeout=settings.LUPIERRA_BALANCE_CACHE_TTL)
-    return result
+        logger.debug(f"Cache miss for {requested_nevera_name}, fetching spreadsheet and caching all customers")
+        return _refresh_nevera_balances(requested_nevera_name)
+    except (APIError, RetryExhausted, CircuitOpen, requests.exceptions.RequestException) as e:
+        if not isinstance(cached_value, CachedBalance):
+            raise
+        logger.warning(f"Cannot refresh balances, serving stale balance of {requested_nevera_name}: {e}")
+        return cached_value
+    finally:
+        # only release our own lock, never the one taken by another caller
+        if locked and lock_cache.get(BALANCE_REFRESH_LOCK_KEY) == token:
+            lock_cache.delete(BALANCE_REFRESH_LOCK_KEY)
@@ -8,12 +8,16 @@ from lupanes.views.manager import (CustomerListView,
                                    DeliveryNoteBulkUpdateView,
                                    DeliveryNoteBulkDeleteView,
                                    DeliveryNoteCurrentMonthArchiveView,
+                                   DeliveryNoteExportView,
+                                   DeliveryNoteMonthArchiveDataView,
                                    DeliveryNoteMonthArchiveView,
+                                   DeliveryNoteMonthCloseView,
+                                   DeliveryNoteSheetCreateView,
                                    DeliveryNoteSummaryView,
                                    ProductSummaryView)
-from lupanes.views.product import (ProductAjaxView, ProductCreateView,
-                                   ProductListView, ProductNewPriceView,
-                                   ProductUpdateView)
+from lupanes.views.product import (ProductAjaxView, ProductCatalogView,
+                                   ProductCreateView, ProductListView,
+                                   ProductNewPriceView, ProductUpdateView)
 
 __all__ = [
     "DashboardView",
@@ -23,15 +27,20 @@ __all__ = [
     "CustomerDeliveryNoteCurrentMonthArchiveView",
     "CustomerDeliveryNoteMonthArchiveView",
     "CustomerListView",
+    "DeliveryNoteMonthArchiveDataView",
     "DeliveryNoteMonthArchiveView",
+    "DeliveryNoteMonthCloseView",
     "DeliveryNoteCreateView",
     "DeliveryNoteCurrentMonthArchiveView",
     "DeliveryNoteDeleteView",
+    "DeliveryNoteExportView",
+    "DeliveryNoteSheetCreateView",
     "DeliveryNoteUpdateView",
     "DeliveryNoteSummaryView",
     "ProductSummaryView",
     "NotifyMissingProductView",
     "ProductAjaxView",
+    "ProductCatalogView",
     "ProductCreateView",
     "ProductListView",
     "ProductNewPriceView",
@@ -6,9 +6,9 @@ from django.contrib import messages
 from django.contrib.auth import get_user_model
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.mail import mail_managers, send_mail
-from django.db.models import QuerySet
+from django.db.models import QuerySet, Sum
 from django.forms.models import BaseModelForm
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseRedirect
 from django.template.loader import render_to_string
 from django.urls import reverse, reverse_lazy
 from django.utils import timezone
@@ -19,8 +19,9 @@ from django.views.generic.dates import MonthArchiveView
 from django.views.generic.edit import CreateView, DeleteView, UpdateView
 from gspread.exceptions import APIError
 
-from lupanes.exceptions import RetryExhausted
-from lupanes.forms import DeliveryNoteCreateForm, NotifyMissingProductForm
+from lupanes.exceptions import CircuitOpen, MonthClosed, RetryExhausted
+from lupanes.forms import (DeliveryNoteCreateForm, DeliveryNoteUpdateForm,
+                           NotifyMissingProductForm)
 from lupanes.models import DeliveryNote
 from lupanes.users.mixins import CustomerAuthMixin
 
@@ -38,7 +39,7 @@ class DashboardView(LoginRequiredMixin, TemplateView):
             context["balance"] = self.request.user.current_balance
             context["consumption"] = self.request.user.current_month_consumption()
             context["projected_balance"] = self.request.user.projected_balance()
-        except (APIError, TypeError, RetryExhausted) as e:
+        except (APIError, TypeError, RetryExhausted, CircuitOpen) as e:
             logger.error(f"Cannot fetch nevera balance: {e}")
             messages.warning(self.request, "Error temporal al obtener tu saldo. Por favor, inténtalo más tarde.")
             context["balance"] = "N/A"
@@ -60,11 +61,10 @@ class DeliveryNoteCreateView(CustomerAuthMixin, CreateView):
 
     def get_context_data(self, **kwargs: Any) -> Dict[str, Any]:
         context = super().get_context_data(**kwargs)
-        today = timezone.now().date()
         qs = self.model.objects.filter(
-            customer=self.request.user, date__date=today,
-        )
-        total = sum(note.amount() for note in qs)
+            customer=self.request.user,
+        ).on_days(timezone.localdate()).select_related("product")
+        total = qs.aggregate(total=Sum("amount"))["total"] or 0
         context.update({
             "deliverynotes_today": qs,
             "total_amount": total,
@@ -80,12 +80,11 @@ class DeliveryNoteCreateView(CustomerAuthMixin, CreateView):
 
 class DeliveryNoteUpdateView(CustomerAuthMixin, UpdateView):
     model = DeliveryNote
-    fields = ["product", "quantity"]
+    form_class = DeliveryNoteUpdateForm
     success_url = reverse_lazy("lupanes:deliverynote-new")
 
     def get_queryset(self) -> QuerySet[Any]:
-        today = timezone.now().date()
-        return DeliveryNote.objects.filter(customer=self.request.user, date__date=today)
+        return DeliveryNote.objects.filter(customer=self.request.user).on_days(timezone.localdate())
 
 
 class DeliveryNoteDeleteView(CustomerAuthMixin, DeleteView):
@@ -93,8 +92,14 @@ class DeliveryNoteDeleteView(CustomerAuthMixin, DeleteView):
     success_url = reverse_lazy("lupanes:deliverynote-new")
 
     def get_queryset(self) -> QuerySet[Any]:
-        today = timezone.now().date()
-        return DeliveryNote.objects.filter(customer=self.request.user, date__date=today)
+        return DeliveryNote.objects.filter(customer=self.request.user).on_days(timezone.localdate())
+
+    def form_valid(self, form):
+        try:
+            return super().form_valid(form)
+        except MonthClosed:
+            messages.error(self.request, "El mes de este albarán está cerrado, ya no se puede borrar.")
+            return HttpResponseRedirect(self.get_success_url())
 
 
 class NotifyMissingProductView(CustomerAuthMixin, FormView):
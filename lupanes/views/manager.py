@@ -3,19 +3,31 @@ import urllib
 from decimal import Decimal
 from typing import Any, Dict
 
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import get_user_model
+from django.core.exceptions import PermissionDenied
 from django.db.models import QuerySet, Sum
+from django.db.models.functions import Lower
+from django.http import (HttpResponseBadRequest, HttpResponseRedirect,
+                         JsonResponse, StreamingHttpResponse)
 from django.urls import reverse, reverse_lazy
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.utils.formats import date_format
+from django.utils.http import http_date
 from django.views.generic import (CreateView, DeleteView, ListView,
-                                  RedirectView, UpdateView)
+                                  RedirectView, TemplateView, UpdateView, View)
 from django.views.generic.dates import MonthArchiveView, MonthMixin, YearMixin
 
-from lupanes.exceptions import PriceDoesNotExistOnDate
-from lupanes.forms import DeliveryNoteForm
-from lupanes.models import DeliveryNote, Product
+from lupanes.datatables import DataTablesRequest
+from lupanes.exceptions import (MonthAlreadyClosed, MonthNotFinished,
+                                PriceDoesNotExistOnDate)
+from lupanes.exports import XLSX_CONTENT_TYPE, stream_csv, stream_xlsx
+from lupanes.forms import (DeliveryNoteForm, DeliveryNoteLineFormSet,
+                           DeliveryNoteSheetForm)
+from lupanes.models import (ClosedMonth, DailyDelivery, DeliveryNote,
+                            Product, local_date_range)
 from lupanes.users.mixins import ManagerAuthMixin
 
 User = get_user_model()
@@ -38,14 +50,201 @@ class DeliveryNoteCurrentMonthArchiveView(ManagerAuthMixin, RedirectView):
         return reverse("lupanes:deliverynote-month", args=(now.year, now.month))
 
 
-class DeliveryNoteMonthArchiveView(ManagerAuthMixin, MonthArchiveView):
-    queryset = DeliveryNote.objects.all()
+class ClosedMonthMixin:
+    """Serve closed months with HTTP caching (their content does not change)"""
+
+    def get_cache_max_age(self):
+        """
+        Seconds the browser reuses the response without asking, `None` to revalidate it
+        every time: pages also render the flash messages, which must not be replayed.
+        """
+        return None
+
+    def get_closed_month(self):
+        if not hasattr(self, "_closed_month"):
+            self._closed_month = ClosedMonth.objects.filter(
+                year=int(self.kwargs["year"]), month=int(self.kwargs["month"]),
+            ).first()
+        return self._closed_month
+
+    def dispatch(self, request, *args, **kwargs):
+        closed_month = self.get_closed_month()
+        # a page with pending flash messages is never reused
+        if closed_month is None or request.method not in ("GET", "HEAD") or len(messages.get_messages(request)):
+            return super().dispatch(request, *args, **kwargs)
+
+        last_modified = int(closed_month.closed_at.timestamp())
+        response = get_conditional_response(request, last_modified=last_modified)
+        if response is None:
+            response = super().dispatch(request, *args, **kwargs)
+            response["Last-Modified"] = http_date(last_modified)
+        max_age = self.get_cache_max_age()
+        if max_age is None:
+            patch_cache_control(response, private=True, no_cache=True)
+        else:
+            patch_cache_control(response, private=True, max_age=max_age)
+        return response
+
+    def get_context_data(self, **kwargs: Any) -> Dict[str, Any]:
+        context = super().get_context_data(**kwargs)
+        context["closed_month"] = self.get_closed_month()
+        return context
+
+
+class DeliveryNoteMonthArchiveView(ManagerAuthMixin, ClosedMonthMixin, MonthArchiveView):
+    queryset = DeliveryNote.objects.select_related("customer", "created_by", "product")
     date_field = "date"
     ordering = "date"
     allow_empty = True
 
+    def get_date_list(self, queryset, date_type=None, ordering="ASC"):
+        # notes are loaded by DeliveryNoteMonthArchiveDataView, the page does not need them
+        return []
 
-class DeliveryNoteSummaryView(ManagerAuthMixin, YearMixin, MonthMixin, ListView):
+    def get_context_data(self, **kwargs: Any) -> Dict[str, Any]:
+        context = super().get_context_data(**kwargs)
+        context["month_end"] = self._get_next_month(context["month"]) - datetime.timedelta(days=1)
+        # only finished months (next month is not in the future) can be closed
+        context["can_be_closed"] = context["closed_month"] is None and context["next_month"] is not None
+        return context
+
+
+class DeliveryNoteMonthArchiveDataView(ManagerAuthMixin, ClosedMonthMixin, View):
+    """Notes of the month for the DataTables of the archive (server-side processing)"""
+    columns = {
+        "date": "date",
+        "customer": "customer__username",
+        "product": "product__name",
+        "amount": "amount",
+    }
+    search_fields = ["customer__username", "product__name", "sheet_number"]
+
+    def get_cache_max_age(self):
+        return settings.LUPIERRA_CLOSED_MONTH_CACHE_MAX_AGE
+
+    def get(self, request, *args, **kwargs):
+        table = DataTablesRequest(request.GET, self.columns, self.search_fields, default_column="date")
+        qs = DeliveryNote.objects.in_month(self.kwargs["year"], self.kwargs["month"])
+        filtered_qs = table.filter(qs)
+        notes, next_cursor = table.page(filtered_qs.select_related("customer", "created_by", "product"))
+
+        closed = self.get_closed_month() is not None
+        data = []
+        for index, note in enumerate(notes, start=table.start + 1):
+            quantity = note.quantity if note.product.unit_accept_decimals() else note.quantity.quantize(1)
+            data.append({
+                "index": index,
+                "sheet_number": note.sheet_number,
+                "date": date_format(timezone.localtime(note.date), "SHORT_DATE_FORMAT"),
+                "customer": note.customer.username,
+                "created_by": note.created_by.username if note.created_by else None,
+                "product": note.product.name,
+                "product_edit_url": reverse("lupanes:product-edit", args=(note.product_id,)),
+                "quantity": f"{quantity} {note.product.unit}",
+                "amount": note.get_amount_export_format(),
+                "edit_url": None if closed else reverse("lupanes:deliverynote-edit-bulk", args=(note.pk,)),
+                "delete_url": None if closed else reverse("lupanes:deliverynote-delete-bulk", args=(note.pk,)),
+            })
+
+        total = qs.count()
+        return JsonResponse({
+            "draw": table.draw,
+            "recordsTotal": total,
+            "recordsFiltered": filtered_qs.count() if table.search else total,
+            "data": data,
+            "next": {"start": table.start + table.length, "cursor": next_cursor} if next_cursor else None,
+        })
+
+
+class DeliveryNoteExportView(ManagerAuthMixin, View):
+    """Export delivery notes filtered by date range, customers and products as CSV or XLSX"""
+    header = ["Nº hoja", "Fecha", "Nevera", "Producto", "Productor", "Cantidad", "Unidad",
+              "Precio unitario", "Importe"]
+    chunk_size = 2000
+
+    def get_queryset(self):
+        qs = DeliveryNote.objects.all()
+        params = self.request.GET
+        date_from = params.get("date_from")
+        date_to = params.get("date_to")
+        if date_from:
+            qs = qs.since_day(datetime.date.fromisoformat(date_from))
+        if date_to:
+            _, end = local_date_range(datetime.date.fromisoformat(date_to))
+            qs = qs.filter(date__lt=end)
+        customers = [pk for pk in params.getlist("customers") if pk]
+        if customers:
+            qs = qs.filter(customer__pk__in=customers)
+        products = [pk for pk in params.getlist("products") if pk]
+        if products:
+            qs = qs.filter(product__pk__in=products)
+
+        return qs.select_related("customer", "product", "product__producer").order_by("date", "pk")
+
+    def get_rows(self, qs):
+        # prices not stored yet are resolved in bulk for each chunk
+        for note in qs.with_prices().iterator(chunk_size=self.chunk_size):
+            unit_price = note.unit_price
+            if unit_price is None:
+                try:
+                    unit_price = note.get_unit_price()
+                except PriceDoesNotExistOnDate:
+                    pass
+            amount = None if unit_price is None else (note.quantity * unit_price).quantize(Decimal("0.01"))
+            yield [
+                note.sheet_number,
+                timezone.localtime(note.date).strftime("%Y-%m-%d %H:%M"),
+                note.customer.username,
+                note.product.name,
+                note.product.producer.name,
+                note.quantity,
+                note.product.unit,
+                unit_price,
+                amount,
+            ]
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.GET.get("format", "csv")
+        if export_format not in ("csv", "xlsx"):
+            return HttpResponseBadRequest("Formato no soportado.")
+        try:
+            qs = self.get_queryset()
+        except ValueError:
+            return HttpResponseBadRequest("Fecha no válida.")
+
+        filename = "albaranes-{}".format(timezone.localdate().isoformat())
+        if export_format == "xlsx":
+            content = stream_xlsx(self.header, self.get_rows(qs), sheet_name="Albaranes")
+            response = StreamingHttpResponse(content, content_type=XLSX_CONTENT_TYPE)
+        else:
+            content = stream_csv(self.header, self.get_rows(qs))
+            response = StreamingHttpResponse(content, content_type="text/csv; charset=utf-8")
+        response["Content-Disposition"] = f'attachment; filename="{filename}.{export_format}"'
+        return response
+
+
+class DeliveryNoteMonthCloseView(ManagerAuthMixin, TemplateView):
+    template_name = "lupanes/deliverynote_month_confirm_close.html"
+
+    def get_context_data(self, **kwargs: Any) -> Dict[str, Any]:
+        context = super().get_context_data(**kwargs)
+        context["period"] = datetime.date(year=self.kwargs["year"], month=self.kwargs["month"], day=1)
+        return context
+
+    def post(self, request, *args, **kwargs):
+        year, month = self.kwargs["year"], self.kwargs["month"]
+        try:
+            ClosedMonth.objects.close(year, month, closed_by=request.user)
+        except MonthNotFinished:
+            messages.error(request, "Solo se pueden cerrar meses ya terminados.")
+        except MonthAlreadyClosed:
+            messages.warning(request, "El mes ya estaba cerrado.")
+        else:
+            messages.success(request, "Mes cerrado correctamente.")
+        return HttpResponseRedirect(reverse("lupanes:deliverynote-month", args=(year, month)))
+
+
+class DeliveryNoteSummaryView(ManagerAuthMixin, ClosedMonthMixin, YearMixin, MonthMixin, ListView):
     template_name = "lupanes/deliverynote_summary.html"
     date_field = "date"
 
@@ -54,22 +253,31 @@ class DeliveryNoteSummaryView(ManagerAuthMixin, YearMixin, MonthMixin, ListView)
         month = self.kwargs["month"]
         self.period = datetime.datetime(year=year, month=month, day=1)
 
-        qs = User.objects.get_active_customers()
-        for customer in qs:
-            customer.total = Decimal(0)
-            notes = customer.deliverynote_set.filter(
-                date__date__year=year,
-                date__date__month=month,
-            )
-            for note in notes:
-                try:
-                    customer.total += note.amount()
-                except PriceDoesNotExistOnDate as e:
-                    messages.error(self.request, e)
-                    customer.total = None
-                    break
+        closed_month = self.get_closed_month()
+        if closed_month is not None:
+            # served from the snapshot saved when the month was closed
+            qs = User.objects.filter(month_totals__closed_month=closed_month).order_by(Lower('username'))
+            totals = closed_month.totals.values("customer", "total", "missing_prices")
+        else:
+            qs = User.objects.get_active_customers()
+            totals = DailyDelivery.objects.filter(
+                customer__in=qs,
+                day__year=year,
+                day__month=month,
+            ).values("customer").annotate(
+                total=Sum("amount"),
+                missing_prices=Sum("missing_prices"),
+            ).order_by()
+        totals = {item["customer"]: item for item in totals}
 
-            if customer.total is not None:
+        for customer in qs:
+            item = totals.get(customer.pk, {"total": None, "missing_prices": 0})
+            if item["missing_prices"]:
+                messages.error(self.request, f"No existe precio para {item['missing_prices']} "
+                                             f"albarán(es) de la nevera {customer.username}.")
+                customer.total = None
+            else:
+                customer.total = item["total"] or Decimal(0)
                 customer.total_export_format = '{0:.2f}'.format(customer.total)
 
         return qs
@@ -117,7 +325,54 @@ class DeliveryNoteBulkCreateView(ManagerAuthMixin, CreateView):
         )
 
 
-class DeliveryNoteBulkUpdateView(ManagerAuthMixin, UpdateView):
+class DeliveryNoteSheetCreateView(ManagerAuthMixin, TemplateView):
+    """Register all the lines of a paper sheet at once"""
+    template_name = "lupanes/deliverynote_sheet_create.html"
+
+    def get_context_data(self, **kwargs: Any) -> Dict[str, Any]:
+        context = super().get_context_data(**kwargs)
+        if "form" not in context:
+            context["form"] = DeliveryNoteSheetForm(initial={"date": timezone.localtime().replace(second=0)})
+        if "formset" not in context:
+            context["formset"] = DeliveryNoteLineFormSet(prefix="lines")
+        return context
+
+    def post(self, request, *args, **kwargs):
+        form = DeliveryNoteSheetForm(request.POST)
+        formset = DeliveryNoteLineFormSet(request.POST, prefix="lines")
+        # validate both to report all the errors at once
+        if not all([form.is_valid(), formset.is_valid()]):
+            context = self.get_context_data(form=form, formset=formset, errors_report=formset.get_errors_report())
+            return self.render_to_response(context)
+
+        notes = DeliveryNote.objects.create_many(
+            DeliveryNote(
+                sheet_number=form.cleaned_data["sheet_number"],
+                date=form.cleaned_data["date"],
+                customer_id=line["customer"],
+                product_id=line["product"],
+                quantity=line["quantity"],
+                created_by=request.user,
+            )
+            for line in formset.cleaned_data if line
+        )
+
+        messages.success(request, f"{len(notes)} albaranes creados correctamente.")
+        date = form.cleaned_data["date"]
+        return HttpResponseRedirect(reverse("lupanes:deliverynote-month", args=(date.year, date.month)))
+
+
+class OpenMonthRequiredMixin:
+    """Notes of closed months are read-only"""
+
+    def get_object(self, queryset=None):
+        obj = super().get_object(queryset)
+        if ClosedMonth.objects.is_closed(obj.date):
+            raise PermissionDenied("No se pueden modificar albaranes de un mes cerrado.")
+        return obj
+
+
+class DeliveryNoteBulkUpdateView(ManagerAuthMixin, OpenMonthRequiredMixin, UpdateView):
     form_class = DeliveryNoteForm
     template_name = "lupanes/deliverynote_bulk_create.html"
     model = DeliveryNote
@@ -137,7 +392,7 @@ class DeliveryNoteBulkUpdateView(ManagerAuthMixin, UpdateView):
         return reverse_lazy("lupanes:deliverynote-month", args=(date.year, date.month))
 
 
-class DeliveryNoteBulkDeleteView(ManagerAuthMixin, DeleteView):
+class DeliveryNoteBulkDeleteView(ManagerAuthMixin, OpenMonthRequiredMixin, DeleteView):
     model = DeliveryNote
     template_name = "lupanes/deliverynote_bulk_confirm_delete.html"
 
@@ -171,34 +426,29 @@ class ProductSummaryView(ManagerAuthMixin, ListView):
         if self._has_invalid_date_range():
             return []
 
-        qs = DeliveryNote.objects.select_related("product", "product__producer").all()
+        qs = DailyDelivery.objects.all()
 
         date_from, date_to = self._get_dates()
         products = self.request.GET.getlist("products")
 
         if date_from:
-            qs = qs.filter(date__date__gte=date_from)
+            qs = qs.filter(day__gte=date_from)
         if date_to:
-            qs = qs.filter(date__date__lte=date_to)
+            qs = qs.filter(day__lte=date_to)
         if products:
             qs = qs.filter(product__pk__in=products)
 
-        summary = qs.values(
+        # price depends on note date: notes without price on its date
+        # (PriceDoesNotExistOnDate) are not included on the daily amount
+        summary = list(qs.values(
             "product__name", "product__producer__name", "product__unit"
         ).annotate(
             total_qty=Sum("quantity"),
-        ).order_by("product__name")
+            total_amount=Sum("amount"),
+        ).order_by("product__name"))
 
-        # Calculate total_amount per product using Python (price depends on note date)
         for item in summary:
-            product_notes = qs.filter(product__name=item["product__name"])
-            total_amount = Decimal("0")
-            for note in product_notes:
-                try:
-                    total_amount += note.amount()
-                except PriceDoesNotExistOnDate:
-                    pass
-            item["total_amount"] = '{0:.2f}'.format(total_amount)
+            item["total_amount"] = '{0:.2f}'.format(item["total_amount"] or Decimal(0))
 
         return summary
 
@@ -9,10 +9,13 @@ from django.http import (HttpRequest, HttpResponse, HttpResponseRedirect,
                          JsonResponse)
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
-from django.views.generic import CreateView, DetailView, ListView, UpdateView
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.generic import (CreateView, DetailView, ListView,
+                                  UpdateView, View)
 
 from lupanes.forms import ProductForm, ProductPriceForm
-from lupanes.models import Product
+from lupanes.models import CATALOG, PriceResolver, Product, get_data_version
 from lupanes.users.mixins import CustomerAuthMixin, ManagerAuthMixin
 
 
@@ -33,6 +36,41 @@ class ProductAjaxView(CustomerAuthMixin, DetailView):
         return JsonResponse(data=data)
 
 
+class ProductCatalogView(LoginRequiredMixin, View):
+    """
+    Products with their unit and current price, for the delivery note forms
+    (inactive ones are included too because the tienda can still use them).
+
+    The ETag changes with the products and prices and with the day (a price
+    may start today), so clients can keep it and revalidate it cheaply.
+    """
+
+    def get(self, request: HttpRequest, *args: Any, **kwargs: Any) -> HttpResponse:
+        today = timezone.localdate()
+        etag = f'"{get_data_version(CATALOG)!r}-{today.isoformat()}"'
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            products = list(Product.objects.order_by(Lower("name")).values_list(
+                "pk", "name", "unit", "is_active",
+            ))
+            resolver = PriceResolver(pk for pk, *_ in products)
+            response = JsonResponse({"products": {
+                pk: {
+                    "name": name,
+                    "unit": unit,
+                    "accept_decimals": unit in Product.Unit.fractional_units(),
+                    "is_active": is_active,
+                    "price": resolver.get_price_or_none(pk, today),
+                }
+                for pk, name, unit, is_active in products
+            }})
+
+        response["ETag"] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
 class ProductListView(LoginRequiredMixin, ListView):
     model = Product
 
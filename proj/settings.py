@@ -121,14 +121,31 @@ DATABASES = {
 # Cache configuration
 # https://docs.djangoproject.com/en/4.2/topics/cache/
 
+# Stored on the database so every worker process shares the same values
+# (run `python manage.py createcachetable` after deploying)
 CACHES = {
+    # one balance per nevera and one consumption per nevera and month, among others
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'lupanes-cache',
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'lupanes_cache',
         'OPTIONS': {
-            'MAX_ENTRIES': 1000,  # Support up to 1000 customers
+            'MAX_ENTRIES': env('LUPIERRA_CACHE_MAX_ENTRIES', default=20000, cast=int),
         }
-    }
+    },
+    # a few keys that must not be evicted when the default cache is culled:
+    # data versions, circuit breaker state and the balances refresh lock
+    'durable': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'lupanes_durable_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        }
+    },
+    # Per process, for values that are versioned (e.g. form choices)
+    'local': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'lupanes-local',
+    },
 }
 
 
@@ -295,9 +312,36 @@ LUPIERRA_GSPREAD_AUTH_PATH = env("LUPIERRA_GSPREAD_AUTH_PATH")
 
 LUPIERRA_CUSTOMERS_BALANCE_URL = env("LUPIERRA_CUSTOMERS_BALANCE_URL")
 
+# Cells read from the first worksheet: nevera name and balance columns
+LUPIERRA_CUSTOMERS_BALANCE_RANGE = env("LUPIERRA_CUSTOMERS_BALANCE_RANGE", default="A:B")
+
 # Retry configuration for Google Sheets API
 LUPIERRA_GSPREAD_MAX_RETRIES = env("LUPIERRA_GSPREAD_MAX_RETRIES", default=4, cast=int)
 LUPIERRA_GSPREAD_BASE_DELAY = env("LUPIERRA_GSPREAD_BASE_DELAY", default=1.0, cast=float)
 
+# Circuit breaker: stop calling Google Sheets for COOLDOWN seconds after THRESHOLD failed fetches
+LUPIERRA_GSPREAD_BREAKER_THRESHOLD = env("LUPIERRA_GSPREAD_BREAKER_THRESHOLD", default=3, cast=int)
+LUPIERRA_GSPREAD_BREAKER_COOLDOWN = env("LUPIERRA_GSPREAD_BREAKER_COOLDOWN", default=60, cast=int)
+
 # Cache TTL for customer balance (10 minutes default)
 LUPIERRA_BALANCE_CACHE_TTL = env("LUPIERRA_BALANCE_CACHE_TTL", default=600, cast=int)
+
+# How long an expired balance is kept to be served while it is refreshed (1 day default)
+LUPIERRA_BALANCE_CACHE_STALE_TTL = env("LUPIERRA_BALANCE_CACHE_STALE_TTL", default=24 * 3600, cast=int)
+
+# Read balances from the local copy kept by `syncbalances` instead of querying
+# Google Sheets on the request (set to False to fetch them on demand)
+LUPIERRA_BALANCE_BACKGROUND_SYNC = env("LUPIERRA_BALANCE_BACKGROUND_SYNC", default=True, cast=bool)
+
+# Seconds between syncs when running `syncbalances --loop`
+LUPIERRA_BALANCE_SYNC_INTERVAL = env("LUPIERRA_BALANCE_SYNC_INTERVAL", default=300, cast=int)
+
+# Database backups (`backupdatabase` command)
+LUPIERRA_BACKUP_DIR = env("LUPIERRA_BACKUP_DIR", default=str(BASE_DIR / "backups"))
+LUPIERRA_BACKUP_KEEP_DAYS = env("LUPIERRA_BACKUP_KEEP_DAYS", default=30, cast=int)
+
+# Month partitions of the delivery notes for analytics (`exportanalytics` command)
+LUPIERRA_ANALYTICS_DIR = env("LUPIERRA_ANALYTICS_DIR", default=str(BASE_DIR / "analytics"))
+
+# HTTP cache max-age for the table data of closed months (7 days default)
+LUPIERRA_CLOSED_MONTH_CACHE_MAX_AGE = env("LUPIERRA_CLOSED_MONTH_CACHE_MAX_AGE", default=7 * 24 * 3600, cast=int)
@@ -8,4 +8,4 @@ LOG_FILE="$PROJECT_DIR/mail.log"
 export PYTHONPATH="$PROJECT_DIR"
 export DJANGO_SETTINGS_MODULE="proj.settings"
 
-$PYTHON "$PROJECT_DIR/scripts/database_backup.py" >> $LOG_FILE 2>&1
+$PYTHON "$PROJECT_DIR/manage.py" backupdatabase --upload >> $LOG_FILE 2>&1